@@ -84,7 +84,7 @@ list of observed dispersion curves, as a list of numpy arrays
 distribution by the MCMC algorithm, as a list of instances of VsModel
 (module psdepthmodel) [vsmodel1, vsmodel2 ...]
 """
-from pysismo import psdepthmodel, psmcsampling
+from pysismo import psdepthmodel, psmcsampling, pstomo
 import os
 import shutil
 import pickle
@@ -212,10 +212,9 @@ s = ('2-pass-tomography_1996-2012_xmlresponse_7-60s_'
      'earthquake-band=7-60s_periods=10-30s.pickle')
 PICKLE_FILE_LONG_PERIODS = os.path.join(TOMO_DIR, s)
 
-with open(PICKLE_FILE_SHORT_PERIODS, 'rb') as f:
-    VMAPS_SHORT = pickle.load(f)
-with open(PICKLE_FILE_LONG_PERIODS, 'rb') as f:
-    VMAPS_LONG = pickle.load(f)
+# (pickled dicts {period: velocity map} or compact sets of maps *.vmapset)
+VMAPS_SHORT = pstomo.load_velocity_maps(PICKLE_FILE_SHORT_PERIODS)
+VMAPS_LONG = pstomo.load_velocity_maps(PICKLE_FILE_LONG_PERIODS)
 
 PERIODVMAPS = {T: (VMAPS_SHORT[T] if T <= 10 else VMAPS_LONG[T]) for T in range(6, 26)}
 PERIODS = np.array(sorted(PERIODVMAPS.keys()))
@@ -291,7 +290,7 @@ for locname, (lon, lat) in sorted(LOCATIONS.items()):
             # ...estimated from the covariance matrix of the
             # best-fitting parameters of the tomographic inversion
             # if only one velocity (NB_NEIGHBORS = 1)
-            sigmamopt = np.sqrt(vmap.covmopt[inodes[0], inodes[0]])
+            sigmamopt = np.sqrt(vmap.covmopt_diag()[inodes[0]])
             # m = (v0 - v) / v, so sigma_m = v0 * sigma_v / v^2
             sigmavg[iT] = vels[0]**2 * sigmamopt / vmap.v0
 
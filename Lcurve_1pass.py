@@ -2,7 +2,6 @@ from pysismo import pstomo, psutils
 import os, sys
 import shutil
 import glob
-import pickle
 import itertools as it
 import numpy as np
 
@@ -21,7 +20,8 @@ vtype = 'phase'
 from pysismo.psconfig import FTAN_DIR, TOMO_DIR
 
 # selecting dispersion curves
-flist = sorted(glob.glob(os.path.join(FTAN_DIR, 'FTAN*.pickle*')))
+flist = sorted(glob.glob(os.path.join(FTAN_DIR, 'FTAN*.pickle*')) +
+               glob.glob(os.path.join(FTAN_DIR, 'FTAN*.dcset*')))
 print('Select file(s) containing dispersion curves to process: [1]')
 for i,f in enumerate(flist):
     print('{} - {}'.format(i+1, os.path.basename(f)))
@@ -35,9 +35,7 @@ pickle_file = flist[res-1]
 
 print("\nProcessing dispersion curves of file: " + pickle_file)
 
-f = open(pickle_file, 'rb')
-curves = pickle.load(f)
-f.close()
+curves = pstomo.load_dispersion_curves(pickle_file)
 
 # opening outfile
 try:
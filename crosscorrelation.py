@@ -30,8 +30,18 @@ pairs of stations, from *FIRSTDAY* to *LASTDAY* and, in each given day,
 rejecting stations whose data fill is < *MINFILL*. Define a subset of
 stations to cross-correlate in *CROSSCORR_STATIONS_SUBSET* (or let it
 empty to cross-correlate all stations). Define a list of locations to
-skip in *CROSSCORR_SKIPLOCS*, if any. The cross-correlations are
-calculated between -/+ *CROSSCORR_TMAX* seconds.
+skip in *CROSSCORR_SKIPLOCS*, if any. The pairs of stations to
+cross-correlate can be further selected according to their
+inter-station distance (*CROSSCORR_MINDIST*, *CROSSCORR_MAXDIST*),
+their networks (*CROSSCORR_WITHNETS*, *CROSSCORR_ONLYWITHNETS*),
+explicit lists of pairs (*CROSSCORR_PAIRS_SUBSET*, *CROSSCORR_SKIPPAIRS*)
+and a max nb of pairs per station, nearest stations first
+(*CROSSCORR_MAXPAIRS_PER_STATION*): only the selected pairs are
+cross-correlated and stored. The cross-correlations are
+calculated between -/+ *CROSSCORR_TMAX* seconds, or, if
+*CROSSCORR_TMAX_FLOOR* is set, up to the end of the noise window
+of each pair (depending on the inter-station distance, see
+pscrosscorr.pair_tmax()), but not less than *CROSSCORR_TMAX_FLOOR*.
 
 Several pre-processing steps are applied to the daily seismic waveform
 data, before the daily cross-correlation is calculated and stacked:
@@ -50,15 +60,54 @@ data, before the daily cross-correlation is calculated and stacked:
       The smoothing window is *PERIODMAX_EARTHQUAKE* / 2;
 
     - if *ONEBIT_NORM* = False, one-bit normalization, wherein
-      only the sign of the signal is kept (+1 or -1);
+      only the sign of the signal is kept (+1 or -1). The signs are
+      then bit-packed, and the cross-correlations are exact integers;
 
 (5) spectral whitening of the Fourier amplitude spectrum: the Fourier
     amplitude spectrum of the signal is divided by a smoothed version
     of itself. The smoonthing window is *WINDOW_FREQ*.
 
+Several components of the stations (e.g., Z, N, E, or Z, 1, 2) can be
+cross-correlated in one pass, by listing them in *CROSSCORR_COMPONENTS*:
+each component is then read and pre-processed once per day, its Fourier
+spectrum is calculated once, and the cross-correlations between all the
+pairs of components (ZZ, ZN, ZE, NZ etc.) are obtained from these shared
+spectra and stacked into a multi-component collection
+(pscrosscorr.MultiComponentCrossCorrelationCollection). A station is
+cross-correlated at a given day only if all its components could be
+pre-processed. At export, the horizontal components are rotated to the
+radial (R) and transverse (T) directions of each pair of stations.
+
+If *CROSSCORR_WINDOW_LENGTH* is set, each pre-processed day is split into
+(overlapping) sub-daily windows, the windows of all the traces are Fourier-
+transformed at once and the daily cross-correlation of a pair is obtained
+from its cross-spectra averaged over the windows, skipping the windows of
+anomalous amplitude (see *CROSSCORR_WINDOW_REJECT*).
+
 Note that all the parameters mentioned above are defined in the
 configuration file.
 
+The days are processed in a pipeline: while the traces of a given day
+are being cross-correlated and stacked, the data of the next day(s) are
+read and pre-processed in a separate thread (see *PREFETCH_DAYS* below).
+
+At the end of each processed month, the stacks of the month are appended
+to a checkpoint journal (files <output name>.journal.pickle and
+<output name>.manifest.json, see below). If the script is interrupted,
+running it again with the same output name resumes the run from the
+first day not yet processed. The journal is removed once the results
+are exported.
+
+An existing set of cross-correlations (exported in binary format by a
+previous run) can be updated with new data: select it when asked at
+the beginning of the script. Only the data not yet processed are then
+read: new days, or new stations (or data that arrived late) at days
+already processed. The corresponding daily cross-correlations (those
+comprising at least one such station) are stacked to the existing month
+stacks and totals, and the updated set is exported to the new output
+files. The days at which each station has been processed are recorded
+in the set of cross-correlations for that purpose.
+
 When all the cross-correlations are calculated, the script exports
 several files in dir *CROSSCORR_DIR*, whose name (without extension)
 is:
@@ -75,9 +124,21 @@ The files, depending on their extension, contain the following data:
                   pscrosscorr.CrossCorrelationCollection) exported in binary
                   format with module pickle;
 
+- .xcstore/     = (if *CROSSCORR_STORE* is set, instead of the .pickle
+                  file) chunked store of all the cross-correlations, with
+                  one file per pair and a JSON manifest, allowing to read
+                  a single pair, a subset of months or a window of time
+                  lags without loading the whole collection (see
+                  pscrosscorr.CrossCorrelationStore);
+
 - .txt          = all cross-correlations exported in ascii format
                   (one column per pair);
 
+- .columns.npy  = (if *CROSSCORR_COLUMNAR* is set, instead of the .txt
+                  file) all cross-correlations exported in binary columnar
+                  format (one column per pair, whose names are given in
+                  the .columns.json file);
+
 - .stats.txt    = general information on cross-correlations in ascii
                   format: stations coordinates, number of days, inter-
                   station distance etc.
@@ -88,15 +149,29 @@ The files, depending on their extension, contain the following data:
 
 - .png          = figure showing all the cross-correlations (normalized to
                   unity), stacked as a function of inter-station distance.
+
+- .daily/       = (if *CROSSCORR_DAILY_ARCHIVE* is set) compressed archive of
+                  the daily cross-correlations of each pair, by month,
+                  allowing to stack them over any selection of days
+                  (see pscrosscorr.DailyCrossCorrelationArchive). When
+                  updating existing cross-correlations, their archive
+                  (if any) is extended instead.
+
+With several components, the .pickle file contains the multi-component
+collection, and the other files (including a .pickle file) are exported
+for each pair of components, after rotation, with names suffixed by the
+pair of components, e.g., "xcorr_1996-2012_xmlresponse_TT.txt".
 """
 
 from pysismo import pscrosscorr, pserrors, psstation
 import os
 import sys
+import glob
 import warnings
 import datetime as dt
 import itertools as it
-import pickle
+import queue
+import threading
 import obspy.signal.cross_correlation
 
 # turn on multiprocessing to get one merged trace per station?
@@ -111,6 +186,12 @@ if any(MULTIPROCESSING.values()):
     import multiprocessing as mp
     mp.freeze_support()  # for Windows; no effect on non-Windows systems
 
+# how many days can be read and pre-processed in advance, while the
+# current day is being cross-correlated and stacked? (set 0 to process
+# the days strictly one after another). Reading and pre-processing stop
+# when this many processed days are waiting to be stacked.
+PREFETCH_DAYS = 2
+
 # ====================================================
 # parsing configuration file to import some parameters
 # ====================================================
@@ -120,7 +201,9 @@ from pysismo.psconfig import (
     USE_DATALESSPAZ, USE_STATIONXML, CROSSCORR_STATIONS_SUBSET, CROSSCORR_SKIPLOCS,
     FIRSTDAY, LASTDAY, MINFILL, FREQMIN, FREQMAX, CORNERS, ZEROPHASE, PERIOD_RESAMPLE,
     ONEBIT_NORM, FREQMIN_EARTHQUAKE, FREQMAX_EARTHQUAKE, WINDOW_TIME, WINDOW_FREQ,
-    CROSSCORR_TMAX)
+    CROSSCORR_TMAX, CROSSCORR_COMPONENTS, CROSSCORR_DAILY_ARCHIVE,
+    CROSSCORR_RAM_BUDGET, CROSSCORR_WINDOW_LENGTH, CROSSCORR_WINDOW_OVERLAP,
+    CROSSCORR_WINDOW_REJECT)
 
 print("\nProcessing parameters:")
 print("- dir of miniseed data: " + MSEED_DIR)
@@ -134,6 +217,18 @@ else:
     s = ("- normalization in time-domain: "
          "running normalization in earthquake band ({:.1f}-{:.1f} s)")
     print(s.format(1.0 / FREQMAX_EARTHQUAKE, 1.0 / FREQMIN_EARTHQUAKE))
+if CROSSCORR_COMPONENTS:
+    print("- components: {}".format(', '.join(CROSSCORR_COMPONENTS)))
+if CROSSCORR_DAILY_ARCHIVE:
+    print("- daily cross-correlations archived in {}".format(CROSSCORR_DAILY_ARCHIVE))
+if CROSSCORR_RAM_BUDGET:
+    print("- memory for the cross-correlations of a day: {} MB".format(CROSSCORR_RAM_BUDGET))
+if CROSSCORR_WINDOW_LENGTH:
+    s = "- sub-daily windows of {:.0f} s overlapping by {:.0f}%"
+    print(s.format(CROSSCORR_WINDOW_LENGTH, 100 * CROSSCORR_WINDOW_OVERLAP))
+    if CROSSCORR_WINDOW_REJECT:
+        s = "  rejecting windows whose std exceeds {} x median std"
+        print(s.format(CROSSCORR_WINDOW_REJECT))
 fmt = '%d/%m/%Y'
 s = "- cross-correlation will be stacked between {}-{}"
 print(s.format(FIRSTDAY.strftime(fmt), LASTDAY.strftime(fmt)))
@@ -168,6 +263,25 @@ if suffix:
     OUTFILESPATH = u'{}_{}'.format(OUTFILESPATH, suffix)
 print('Results will be exported to files:\n"{}" (+ extension)\n'.format(OUTFILESPATH))
 
+# ==================================================================
+# Existing cross-correlations to update with new data (if any),
+# looking for *.pickle files and *.xcstore dirs in dir *CROSSCORR_DIR*
+# ==================================================================
+
+UPDATED_XCORR_FILE = None
+flist = sorted(glob.glob(os.path.join(CROSSCORR_DIR, 'xcorr*.pickle')) +
+               glob.glob(os.path.join(CROSSCORR_DIR, 'xcorr*.xcstore')))
+flist = [f for f in flist if not f.endswith(('.journal.pickle', '.SNRs.pickle'))]
+if flist:
+    print('Select file containing the cross-correlations to update '
+          'with new data: [none = new cross-correlations]')
+    for i, f in enumerate(flist):
+        print('{} - {}'.format(i + 1, os.path.basename(f)))
+    res = input('\n').strip()
+    if res:
+        UPDATED_XCORR_FILE = flist[int(res) - 1]
+        print('Cross-correlations to update:\n"{}"\n'.format(UPDATED_XCORR_FILE))
+
 # ============
 # Main program
 # ============
@@ -192,31 +306,162 @@ stations = psstation.get_stations(mseed_dir=MSEED_DIR,
                                   dataless_inventories=dataless_inventories,
                                   startday=FIRSTDAY,
                                   endday=LASTDAY,
+                                  components=CROSSCORR_COMPONENTS,
                                   verbose=True)
 
-
-# Initializing collection of cross-correlations
-xc = pscrosscorr.CrossCorrelationCollection()
-
-# Loop on day
-nday = (LASTDAY - FIRSTDAY).days + 1
-dates = [FIRSTDAY + dt.timedelta(days=i) for i in range(nday)]
-for date in dates:
-
-    # exporting the collection of cross-correlations after the end of each
-    # processed month (allows to restart after a crash from that date)
-    if date.day == 1:
-        try:
-            with open(u'{}.part.pickle'.format(OUTFILESPATH), 'wb') as f:
-                print("\nExporting cross-correlations calculated until now to: " + f.name)
-                pickle.dump(xc, f, protocol=2)
-        except FileNotFoundError:
-            os.makedirs(CROSSCORR_DIR)
-            with open(u'{}.part.pickle'.format(OUTFILESPATH), 'wb') as f:
-                print("\nExporting cross-correlations calculated until now to: " + f.name)
-                pickle.dump(xc, f, protocol=2)
-
-    print("\nProcessing data of day {}".format(date))
+# Selecting the pairs of stations to cross-correlate, according to
+# the parameters of the configuration file (inter-station distance,
+# networks, explicit pairs, max nb of pairs per station), and
+# discarding stations not appearing in any selected pair
+selected_pairs = pscrosscorr.select_pairs(
+    [sta for sta in stations if not subset or sta.name in subset])
+s = "Selected {} pairs of stations to cross-correlate (out of {})"
+print(s.format(len(selected_pairs), len(stations) * (len(stations) - 1) // 2))
+selected_stations = set(name for pair in selected_pairs for name in pair)
+stations = [sta for sta in stations if sta.name in selected_stations]
+stationdict = {sta.name: sta for sta in stations}
+
+# Loading the cross-correlations to update, if any, and getting the
+# days at which each station has already been processed
+updated_xc = None
+already_processed_days = {}
+if UPDATED_XCORR_FILE:
+    print("\nLoading cross-correlations to update: " + UPDATED_XCORR_FILE)
+    updated_xc = pscrosscorr.load_xcorr(UPDATED_XCORR_FILE)
+    multicomponent = isinstance(updated_xc,
+                                pscrosscorr.MultiComponentCrossCorrelationCollection)
+    if multicomponent != bool(CROSSCORR_COMPONENTS) or \
+            (multicomponent and updated_xc.components() != CROSSCORR_COMPONENTS):
+        raise Exception("The cross-correlations to update do not have the "
+                        "components of CROSSCORR_COMPONENTS")
+    # verifying up front that the new stacks can be merged with the
+    # updated ones at the end of the run (same time arrays)
+    updated_xc.check_time_arrays(xcorr_dt=PERIOD_RESAMPLE, xcorr_tmax=CROSSCORR_TMAX)
+    if not updated_xc.has_processed_days():
+        print("Warning: no record of processed days in cross-correlations to update:\n"
+              "assuming that stations have been processed between the first and last\n"
+              "days of their pairs")
+    already_processed_days = updated_xc.processed_days()
+
+
+# ============================================================
+# functions that get one merged trace per station, pre-process
+# trace and cross-correlate traces, ready to be parallelized
+# (if required) and to be run in the day-processing pipeline
+# ============================================================
+
+def get_merged_trace(station_date_channel):
+    """
+    Preparing func that returns one trace from selected station,
+    at selected date, of selected channel (*station_date_channel* =
+    (station, date, channel)). Function is ready to be parallelized.
+    """
+    station, date, channel = station_date_channel
+    try:
+        trace = pscrosscorr.get_merged_trace(station=station,
+                                             date=date,
+                                             skiplocs=CROSSCORR_SKIPLOCS,
+                                             minfill=MINFILL,
+                                             channel=channel)
+        errmsg = None
+    except pserrors.CannotPreprocess as err:
+        # cannot preprocess if no trace or daily fill < *minfill*
+        trace = None
+        errmsg = '{}: skipping'.format(err)
+    except Exception as err:
+        # unhandled exception!
+        trace = None
+        errmsg = 'Unhandled error: {}'.format(err)
+
+    if errmsg:
+        # printing error message
+        print('{}.{} [{}] '.format(station.network, station.name, errmsg),)
+
+    return trace
+
+
+def preprocessed_trace(trace_resp):
+    """
+    Preparing func that returns processed trace: processing includes
+    removal of instrumental response, band-pass filtering, demeaning,
+    detrending, downsampling, time-normalization and spectral whitening
+    (see pscrosscorr.preprocess_trace()'s doc)
+
+    Function is ready to be parallelized.
+    """
+    trace, response = trace_resp
+    if not trace or response is False:
+        return
+
+    network = trace.stats.network
+    station = trace.stats.station
+    try:
+        pscrosscorr.preprocess_trace(
+            trace=trace,
+            paz=response,
+            freqmin=FREQMIN,
+            freqmax=FREQMAX,
+            freqmin_earthquake=FREQMIN_EARTHQUAKE,
+            freqmax_earthquake=FREQMAX_EARTHQUAKE,
+            corners=CORNERS,
+            zerophase=ZEROPHASE,
+            period_resample=PERIOD_RESAMPLE,
+            onebit_norm=ONEBIT_NORM,
+            window_time=WINDOW_TIME,
+            window_freq=WINDOW_FREQ)
+        if ONEBIT_NORM:
+            # bit-packing one-bit normalized data
+            trace = pscrosscorr.OneBitTrace(trace)
+        msg = 'ok'
+    except pserrors.CannotPreprocess as err:
+        # cannot preprocess if no instrument response was found,
+        # trace data are not consistent etc. (see function's doc)
+        trace = None
+        msg = '{}: skipping'.format(err)
+    except Exception as err:
+        # unhandled exception!
+        trace = None
+        msg = 'Unhandled error: {}'.format(err)
+
+    # printing output (error or ok) message
+    print('{}.{} [{}] '.format(network, station, msg),)
+
+    # although processing is performed in-place, trace is returned
+    # in order to get it back after multi-processing
+    return trace
+
+
+def xcorr_func(pair):
+    """
+    Preparing func that returns cross-correlation array
+    beween two traces, between -/+ shift samples
+    """
+    (s1, tr1), (s2, tr2), shift = pair
+    print('{}-{} '.format(s1, s2),)
+    if abs(len(tr1.data) - len(tr2.data))%2 != 0:  # odd number length difference
+        # pick one of the traces and lop off a sample to make the difference even
+        tr1.data = tr1.data[:-1]
+    xcorr = obspy.signal.cross_correlation.correlate(
+        tr1, tr2, shift, demean=False, normalize=None)
+    return xcorr
+
+
+def get_day_data(date):
+    """
+    Reads, attaches the instrumental response to and pre-processes
+    the traces of the stations at *date*, and returns:
+
+    - the names of the new stations at *date*, i.e., not yet processed
+      at *date* (all the stations, unless updating existing
+      cross-correlations);
+    - the pairs to cross-correlate at *date*: the selected pairs
+      comprising at least one new station;
+    - the traces of the stations of these pairs, as a dict
+      {station name: trace}, or {station name: {component: trace}}
+      with several components (only the stations whose all components
+      could be processed are kept)
+    """
+    print("\nReading and processing data of day {}".format(date))
 
     # loop on stations appearing in subdir corresponding to current month
     month_subdir = '{year}-{month:02d}'.format(year=date.year, month=date.month)
@@ -227,98 +472,32 @@ for date in dates:
         month_stations = [sta for sta in month_stations
                           if sta.name in CROSSCORR_STATIONS_SUBSET]
 
-    # =============================================================
-    # preparing functions that get one merged trace per station
-    # and pre-process trace, ready to be parallelized (if required)
-    # =============================================================
-
-    def get_merged_trace(station):
-        """
-        Preparing func that returns one trace from selected station,
-        at current date. Function is ready to be parallelized.
-        """
-        try:
-            trace = pscrosscorr.get_merged_trace(station=station,
-                                                 date=date,
-                                                 skiplocs=CROSSCORR_SKIPLOCS,
-                                                 minfill=MINFILL)
-            errmsg = None
-        except pserrors.CannotPreprocess as err:
-            # cannot preprocess if no trace or daily fill < *minfill*
-            trace = None
-            errmsg = '{}: skipping'.format(err)
-        except Exception as err:
-            # unhandled exception!
-            trace = None
-            errmsg = 'Unhandled error: {}'.format(err)
-
-        if errmsg:
-            # printing error message
-            print('{}.{} [{}] '.format(station.network, station.name, errmsg),)
-
-        return trace
-
-    def preprocessed_trace(trace_resp):
-        """
-        Preparing func that returns processed trace: processing includes
-        removal of instrumental response, band-pass filtering, demeaning,
-        detrending, downsampling, time-normalization and spectral whitening
-        (see pscrosscorr.preprocess_trace()'s doc)
-
-        Function is ready to be parallelized.
-        """
-        trace, response = trace_resp
-        if not trace or response is False:
-            return
-
-        network = trace.stats.network
-        station = trace.stats.station
-        try:
-            pscrosscorr.preprocess_trace(
-                trace=trace,
-                paz=response,
-                freqmin=FREQMIN,
-                freqmax=FREQMAX,
-                freqmin_earthquake=FREQMIN_EARTHQUAKE,
-                freqmax_earthquake=FREQMAX_EARTHQUAKE,
-                corners=CORNERS,
-                zerophase=ZEROPHASE,
-                period_resample=PERIOD_RESAMPLE,
-                onebit_norm=ONEBIT_NORM,
-                window_time=WINDOW_TIME,
-                window_freq=WINDOW_FREQ)
-            msg = 'ok'
-        except pserrors.CannotPreprocess as err:
-            # cannot preprocess if no instrument response was found,
-            # trace data are not consistent etc. (see function's doc)
-            trace = None
-            msg = '{}: skipping'.format(err)
-        except Exception as err:
-            # unhandled exception!
-            trace = None
-            msg = 'Unhandled error: {}'.format(err)
-
-        # printing output (error or ok) message
-        print('{}.{} [{}] '.format(network, station, msg),)
-
-        # although processing is performed in-place, trace is returned
-        # in order to get it back after multi-processing
-        return trace
-
-    # ====================================
-    # getting one merged trace per station
-    # ====================================
+    # new stations and pairs to cross-correlate (and hence stations to read)
+    newstations = set(sta.name for sta in month_stations
+                      if date not in already_processed_days.get(sta.name, ()))
+    if len(newstations) == len(month_stations):
+        day_pairs = selected_pairs
+    else:
+        day_pairs = set(pair for pair in selected_pairs
+                        if pair[0] in newstations or pair[1] in newstations)
+        day_stations = set(name for pair in day_pairs for name in pair)
+        month_stations = [sta for sta in month_stations if sta.name in day_stations]
+        if not newstations:
+            print("Stations already processed: skipping day")
+
+    # ================================================================
+    # getting one merged trace per station (and per channel, if several
+    # components are cross-correlated)
+    # ================================================================
 
     t0 = dt.datetime.now()
+    station_channels = [(s, channel) for s in month_stations for channel in s.channels]
     if MULTIPROCESSING['merge trace']:
         # multiprocessing turned on: one process per station
-        pool = mp.Pool(NB_PROCESSES)
-        traces = pool.map(get_merged_trace, month_stations)
-        pool.close()
-        pool.join()
+        traces = pool.map(get_merged_trace, [(s, date, ch) for s, ch in station_channels])
     else:
         # multiprocessing turned off: processing stations one after another
-        traces = [get_merged_trace(s) for s in month_stations]
+        traces = [get_merged_trace((s, date, ch)) for s, ch in station_channels]
 
     # =====================================================
     # getting or attaching instrumental response
@@ -362,19 +541,160 @@ for date in dates:
 
     if MULTIPROCESSING['process trace']:
         # multiprocessing turned on: one process per station
-        pool = mp.Pool(NB_PROCESSES)
         traces = pool.map(preprocessed_trace, zip(traces, responses))
-        pool.close()
-        pool.join()
     else:
         # multiprocessing turned off: processing stations one after another
         traces = [preprocessed_trace((tr, res)) for tr, res in zip(traces, responses)]
 
-    # setting up dict of current date's traces, {station: trace}
-    tracedict = {s.name: trace for s, trace in zip(month_stations, traces) if trace}
+    if not CROSSCORR_COMPONENTS:
+        # setting up dict of current date's traces, {station: trace}
+        tracedict = {s.name: trace for (s, _), trace in zip(station_channels, traces)
+                     if trace}
+    else:
+        # setting up dict of current date's traces, {station: {component: trace}},
+        # keeping stations whose all components were processed
+        tracedict = {}
+        for (s, channel), trace in zip(station_channels, traces):
+            tracedict.setdefault(s.name, {})[channel[-1]] = trace
+        tracedict = {name: comptraces for name, comptraces in tracedict.items()
+                     if all(comptraces.values())}
 
     delta = (dt.datetime.now() - t0).total_seconds()
-    print("\nProcessed stations in {:.1f} seconds".format(delta))
+    print("\nProcessed stations of day {} in {:.1f} seconds".format(date, delta))
+
+    return newstations, day_pairs, tracedict
+
+
+def prefetch_days(dates, dayqueue):
+    """
+    Producer of the day-processing pipeline: puts the (date, day data)
+    of the successive *dates* in *dayqueue* (see get_day_data()), then
+    None. As the queue is bounded, the producer waits as long as
+    *PREFETCH_DAYS* processed days are waiting to be stacked. If something
+    goes wrong, the exception is put in the queue (in place of the day
+    data) to be raised in the main thread.
+    """
+    for date in dates:
+        try:
+            daydata = get_day_data(date)
+        except Exception as err:
+            dayqueue.put((date, err))
+            return
+        dayqueue.put((date, daydata))
+    dayqueue.put(None)
+
+
+# Loop on day
+nday = (LASTDAY - FIRSTDAY).days + 1
+dates = [FIRSTDAY + dt.timedelta(days=i) for i in range(nday)]
+
+if not os.path.exists(CROSSCORR_DIR):
+    os.makedirs(CROSSCORR_DIR)
+
+# checkpoint journal: the stacks of each processed month are appended to
+# the journal, and the processed days are recorded in its manifest
+journal = pscrosscorr.CrossCorrelationJournal(OUTFILESPATH)
+if journal.exists():
+    # resuming an interrupted run: rebuilding the collection of
+    # cross-correlations and skipping the days already processed
+    s = ("Found the journal of an interrupted run: resuming it\n"
+         "(delete files {} and {} to start from scratch)")
+    print(s.format(journal.journalpath, journal.manifestpath))
+    xc = journal.replay(verbose=True)
+    completed_days = journal.completed_days()
+    dates = [date for date in dates if date not in completed_days]
+    s = "{} days already processed, {} days remaining"
+    print(s.format(len(completed_days), len(dates)))
+else:
+    xc = None
+if xc is None:
+    # Initializing collection of cross-correlations (when updating existing
+    # cross-correlations, it will only contain the new stacks, which are
+    # stacked to the existing ones at the end)
+    if CROSSCORR_COMPONENTS:
+        xc = pscrosscorr.MultiComponentCrossCorrelationCollection(CROSSCORR_COMPONENTS)
+    else:
+        xc = pscrosscorr.CrossCorrelationCollection()
+
+# archive of daily cross-correlations: the daily cross-correlations
+# are staged during each month, and compressed into the archive at the
+# end of the month (just before the month is appended to the journal)
+archive = None
+if CROSSCORR_DAILY_ARCHIVE:
+    archivepath = u'{}.daily'.format(os.path.splitext(UPDATED_XCORR_FILE)[0]
+                                     if UPDATED_XCORR_FILE else OUTFILESPATH)
+    if not os.path.exists(archivepath):
+        archivepath = u'{}.daily'.format(OUTFILESPATH)
+    print("Archiving daily cross-correlations in dir: " + archivepath)
+    archive = pscrosscorr.DailyCrossCorrelationArchive(archivepath,
+                                                       dtype=CROSSCORR_DAILY_ARCHIVE,
+                                                       xcorr_dt=PERIOD_RESAMPLE,
+                                                       xcorr_tmax=CROSSCORR_TMAX)
+    # discarding the daily cross-correlations of an interrupted month
+    archive.discard_staging()
+    archive.add_stations(stations)
+
+# days processed since the last append to the journal
+journal_days = []
+
+
+def append_to_journal(days):
+    """
+    Appends to the journal the stacks of the month of *days*
+    (which must all belong to the same month), and records
+    *days* as processed. The daily cross-correlations of the
+    month are first compressed into the archive, if any.
+    """
+    month = pscrosscorr.MonthYear(days[0])
+    if archive:
+        archive.compress_staging(verbose=True)
+    s = "\nAppending cross-correlations of month {} to journal: {}"
+    print(s.format(month, journal.journalpath))
+    journal.append(xc.extract_months([month]), days=days)
+
+
+if any(MULTIPROCESSING.values()):
+    # pool of processes shared by all the steps of the pipeline
+    # (initialized before any thread is started)
+    pool = mp.Pool(NB_PROCESSES)
+
+if PREFETCH_DAYS:
+    # pipeline: the next days are read and processed in a separate
+    # thread while the current day is being cross-correlated and stacked
+    dayqueue = queue.Queue(maxsize=PREFETCH_DAYS)
+    producer = threading.Thread(target=prefetch_days, args=(dates, dayqueue))
+    producer.daemon = True
+    producer.start()
+    days_data = iter(dayqueue.get, None)
+else:
+    # no pipeline: each day is processed just before being stacked
+    days_data = ((date, get_day_data(date)) for date in dates)
+
+for date, daydata in days_data:
+    if isinstance(daydata, Exception):
+        # something went wrong while processing the day's data
+        raise daydata
+    newstations, day_pairs, tracedict = daydata
+
+    # appending the stacks of the previous month to the journal after
+    # the end of each processed month (allows to resume the run after a
+    # crash from that date)
+    if journal_days and (date.year, date.month) != (journal_days[-1].year,
+                                                    journal_days[-1].month):
+        append_to_journal(journal_days)
+        journal_days = []
+    journal_days.append(date)
+
+    # pairs of the day whose traces could be read and processed
+    pairs = [(s1, s2) for s1, s2 in day_pairs if s1 in tracedict and s2 in tracedict]
+
+    # recording the new stations that are cross-correlated as processed
+    # at the current day (the others, e.g., whose trace was rejected, will
+    # be processed again if the collection is updated with new data)
+    stackedstations = set(name for pair in pairs for name in pair)
+    xc.add_processed_days(sorted(newstations & stackedstations), [date])
+
+    print("\nCross-correlating data of day {}".format(date))
 
     # ==============================================
     # stacking cross-correlations of the current day
@@ -385,46 +705,134 @@ for date in dates:
         continue
 
     t0 = dt.datetime.now()
-    xcorrdict = {}
-    if MULTIPROCESSING['cross-corr']:
-        # if multiprocessing is turned on, we pre-calculate cross-correlation
-        # arrays between pairs of stations (one process per pair) and feed
-        # them to xc.add() (which won't have to recalculate them)
-        print("Pre-calculating cross-correlation arrays")
-
-        def xcorr_func(pair):
-            """
-            Preparing func that returns cross-correlation array
-            beween two traces
-            """
-            (s1, tr1), (s2, tr2) = pair
-            print('{}-{} '.format(s1, s2),)
-            shift = int(CROSSCORR_TMAX / PERIOD_RESAMPLE)
-            if abs(len(tr1.data) - len(tr2.data))%2 != 0:  # odd number length difference
-                # pick one of the traces and lop off a sample to make the difference even
-                tr1.data = tr1.data[:-1]
-            xcorr = obspy.signal.cross_correlation.correlate(
-                tr1, tr2, shift, demean=False, normalize=None)
-            return xcorr
-
-        pairs = list(it.combinations(sorted(tracedict.items()), 2))
-        pool = mp.Pool(NB_PROCESSES)
-        xcorrs = pool.map(xcorr_func, pairs)
-        pool.close()
-        pool.join()
-        xcorrdict = {(s1, s2): xcorr for ((s1, _), (s2, _)), xcorr in zip(pairs, xcorrs)}
-        print()
-
-    print("Stacking cross-correlations")
-    xc.add(tracedict=tracedict,
-           stations=stations,
-           xcorr_tmax=CROSSCORR_TMAX,
-           xcorrdict=xcorrdict,
-           verbose=not MULTIPROCESSING['cross-corr'])
+
+    # max lag (in samples) of the cross-correlations of each pair, which
+    # depends on the distance between the stations (see pair_tmax()), or
+    # that of the existing cross-correlation of the pair if updating
+    refxc = updated_xc if updated_xc is not None else xc
+    nmax = {(s1, s2): refxc.xcorr_nmax(stationdict[s1], stationdict[s2],
+                                       xcorr_dt=PERIOD_RESAMPLE,
+                                       xcorr_tmax=CROSSCORR_TMAX)
+            for s1, s2 in pairs}
+
+    # splitting the pairs of the day into tiles whose cross-correlations
+    # fit in the memory budget (a single tile if no budget): the tiles
+    # are cross-correlated and stacked one after another
+    nlags = {pair: 2 * pairnmax + 1 for pair, pairnmax in nmax.items()}
+    maxnmax = max(nmax.values()) if nmax else 0
+    ncomp = len(CROSSCORR_COMPONENTS) if CROSSCORR_COMPONENTS else 1
+    if CROSSCORR_COMPONENTS:
+        npts = max(len(tr) for comptraces in tracedict.values()
+                   for tr in comptraces.values())
+    else:
+        npts = max(len(tr) for tr in tracedict.values())
+    if CROSSCORR_WINDOW_LENGTH:
+        # spectra of the windows of a trace
+        nwinpts = int(round(CROSSCORR_WINDOW_LENGTH / PERIOD_RESAMPLE))
+        step = max(int(round(nwinpts * (1.0 - CROSSCORR_WINDOW_OVERLAP))), 1)
+        tracebytes = (npts // step + 1) * (nwinpts + maxnmax) * 8
+    else:
+        # spectrum of a trace
+        tracebytes = (npts + maxnmax) * 8
+    if CROSSCORR_COMPONENTS or ONEBIT_NORM or CROSSCORR_WINDOW_LENGTH:
+        # cross-correlations of all the pairs of components of a pair,
+        # and spectra of all the components of a station
+        pairbytes = {pair: ncomp**2 * n * 8 for pair, n in nlags.items()}
+        stationbytes = ncomp * tracebytes
+    else:
+        # cross-correlation of a pair (pre-calculated only if multiprocessing)
+        pairbytes = {pair: n * 8 if MULTIPROCESSING['cross-corr'] else 0
+                     for pair, n in nlags.items()}
+        stationbytes = 0
+    tiles = pscrosscorr.tile_pairs(pairs, pairbytes, stationbytes)
+    if len(tiles) > 1:
+        s = "Splitting {} pairs into {} tiles to fit in {} MB"
+        print(s.format(len(pairs), len(tiles), CROSSCORR_RAM_BUDGET))
+
+    for tile in tiles:
+        if CROSSCORR_COMPONENTS:
+            # multi-component stations: the cross-correlations between all
+            # the pairs of components are calculated by xc.add() from the
+            # shared spectra of the traces (or of their sub-daily windows)
+            xcorrdict = {}
+            if CROSSCORR_WINDOW_LENGTH:
+                print("Pre-calculating cross-correlation arrays of sub-daily windows")
+                traces = {(s, c): tr for s, comptraces in tracedict.items()
+                          for c, tr in comptraces.items()}
+                keypairs = [((s1, c1), (s2, c2)) for s1, s2 in tile
+                            for c1, c2 in it.product(CROSSCORR_COMPONENTS, repeat=2)]
+                keynmax = {keypair: nmax[(keypair[0][0], keypair[1][0])]
+                           for keypair in keypairs}
+                xcorrdict = pscrosscorr.segment_xcorrs(traces, keypairs, keynmax)
+                # pairs of stations lacking the cross-correlation of a pair of
+                # components (no common window) are left out of the stacks
+                tile = [(s1, s2) for s1, s2 in tile
+                        if all(((s1, c1), (s2, c2)) in xcorrdict for c1, c2
+                               in it.product(CROSSCORR_COMPONENTS, repeat=2))]
+            print("Stacking cross-correlations")
+            xc.add(tracedict=tracedict,
+                   stations=stations,
+                   xcorr_tmax=CROSSCORR_TMAX,
+                   xcorrdict=xcorrdict,
+                   pairs=set(tile),
+                   archive=archive,
+                   verbose=True)
+        else:
+            xcorrdict = {}
+            if CROSSCORR_WINDOW_LENGTH:
+                # sub-daily windows: the cross-correlation arrays are
+                # calculated from the averaged cross-spectra of the windows
+                print("Pre-calculating cross-correlation arrays of sub-daily windows")
+                xcorrdict = pscrosscorr.segment_xcorrs(tracedict, tile, nmax)
+                # pairs without common window are left out of the stacks
+                tile = [pair for pair in tile if pair in xcorrdict]
+            elif ONEBIT_NORM:
+                # one-bit traces: the cross-correlation arrays are calculated
+                # from the spectra of the bit-packed traces (each trace is
+                # Fourier-transformed only once)
+                print("Pre-calculating cross-correlation arrays")
+                xcorrdict = pscrosscorr.spectral_xcorrs(tracedict, tile, nmax)
+            elif MULTIPROCESSING['cross-corr']:
+                # if multiprocessing is turned on, we pre-calculate cross-correlation
+                # arrays between pairs of stations (one process per pair) and feed
+                # them to xc.add() (which won't have to recalculate them)
+                print("Pre-calculating cross-correlation arrays")
+                tracepairs = [((s1, tracedict[s1]), (s2, tracedict[s2]), nmax[(s1, s2)])
+                              for s1, s2 in tile]
+                xcorrs = pool.map(xcorr_func, tracepairs)
+                xcorrdict = {pair: xcorr for pair, xcorr in zip(tile, xcorrs)}
+                del xcorrs
+                print()
+
+            print("Stacking cross-correlations")
+            xc.add(tracedict=tracedict,
+                   stations=stations,
+                   xcorr_tmax=CROSSCORR_TMAX,
+                   xcorrdict=xcorrdict,
+                   pairs=set(tile),
+                   archive=archive,
+                   verbose=not xcorrdict)
+        del xcorrdict
 
     delta = (dt.datetime.now() - t0).total_seconds()
     print("Calculated and stacked cross-correlations in {:.1f} seconds".format(delta))
 
+if any(MULTIPROCESSING.values()):
+    pool.close()
+    pool.join()
+
+# appending the stacks of the last processed month to the journal
+if journal_days:
+    append_to_journal(journal_days)
+
+# stacking the new cross-correlations to the updated ones, if any
+# (the days of the new stacks were not processed in the updated ones,
+# although they may lie within the periods of their pairs)
+if updated_xc is not None:
+    print("\nStacking new cross-correlations to the updated ones")
+    updated_xc.merge(xc, check_periods=False, verbose=True)
+    xc = updated_xc
+
 # exporting cross-correlations
 if not xc.pairs():
     print("No cross-correlation could be calculated: nothing to export!")
@@ -432,15 +840,22 @@ else:
     # exporting to binary and ascii files
     xc.export(outprefix=OUTFILESPATH, stations=stations, verbose=True)
 
-    # exporting to png file
-    print("Exporting cross-correlations to file: {}.png".format(OUTFILESPATH))
-    # optimizing time-scale: max time = max distance / vmin (vmin = 2.5 km/s)
-    maxdist = max([xc[s1][s2].dist() for s1, s2 in xc.pairs()])
-    maxt = min(CROSSCORR_TMAX, maxdist / 2.5)
-    xc.plot(xlim=(-maxt, maxt), outfile=OUTFILESPATH + '.png', showplot=False)
-
-# removing file containing periodical exports of cross-corrs
-try:
-    os.remove(u'{}.part.pickle'.format(OUTFILESPATH))
-except:
-    pass
+    # exporting to png file(s): one per pair of components (after
+    # rotation) if several components
+    if CROSSCORR_COMPONENTS:
+        rotated_xc = xc.rotated()
+        plots = [(u'{}_{}'.format(OUTFILESPATH, key), rotated_xc[key])
+                 for key in rotated_xc]
+    else:
+        plots = [(OUTFILESPATH, xc)]
+    for outprefix, plotxc in plots:
+        if not plotxc.pairs():
+            continue
+        print("Exporting cross-correlations to file: {}.png".format(outprefix))
+        # optimizing time-scale: max time = max distance / vmin (vmin = 2.5 km/s)
+        maxdist = max([plotxc[s1][s2].dist() for s1, s2 in plotxc.pairs()])
+        maxt = min(CROSSCORR_TMAX, maxdist / 2.5)
+        plotxc.plot(xlim=(-maxt, maxt), outfile=outprefix + '.png', showplot=False)
+
+# removing checkpoint journal
+journal.remove()
@@ -51,8 +51,11 @@ import os
 # parsing configuration file to import dir of cross-corr results
 from pysismo.psconfig import CROSSCORR_DIR, FTAN_DIR
 
-# loading cross-correlations (looking for *.pickle files in dir *CROSSCORR_DIR*)
-flist = sorted(glob.glob(os.path.join(CROSSCORR_DIR, 'xcorr*.pickle*')))
+# loading cross-correlations (looking for *.pickle files
+# and *.xcstore dirs in dir *CROSSCORR_DIR*)
+flist = sorted(glob.glob(os.path.join(CROSSCORR_DIR, 'xcorr*.pickle*')) +
+               glob.glob(os.path.join(CROSSCORR_DIR, 'xcorr*.xcstore')))
+flist = [f for f in flist if not f.endswith(('.journal.pickle', '.SNRs.pickle'))]
 print('Select file(s) containing cross-correlations to process: [All except backups]')
 print('0 - All except backups (*~)')
 for i,f in enumerate(flist):
@@ -69,7 +72,9 @@ usersuffix = input("\nEnter suffix to append: [none]\n").strip()
 # processing each set of cross-correlations
 for pickle_file in pickle_files:
     print("\nProcessing cross-correlations of file: " + pickle_file)
-    xc = pscrosscorr.load_pickled_xcorr(pickle_file)
+    # (the cross-correlations of a store are loaded lazily, i.e.,
+    # one pair at a time, see pscrosscorr.LazyCrossCorrelationCollection)
+    xc = pscrosscorr.load_xcorr(pickle_file, lazy=True)
 
     # copying the suffix of cross-correlations file
     # (everything between 'xcorr_' and the extension)
@@ -103,3 +108,8 @@ for pickle_file in pickle_files:
         os.makedirs(FTAN_DIR)
 
     xc.FTANs(suffix=suffix, whiten=False, normalize_ampl=True, logscale=True)
+
+    # saving the SNRs calculated during the FTANs along with the
+    # cross-correlations, so that the next runs (e.g., with other
+    # FTAN parameters) reuse them
+    pscrosscorr.save_SNRs(xc, pickle_file)
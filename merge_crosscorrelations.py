@@ -0,0 +1,99 @@
+#!/usr/bin/python -u
+"""
+[Advice: run this script using python with unbuffered output:
+`python -u merge_crosscorrelations.py`]
+
+This script merges several partial sets of cross-correlations into
+a single one. It allows to shard a long cross-correlation run
+(performed with script crosscorrelation.py) across several processes
+or machines, e.g.:
+
+- by date range, each run having its own *FIRSTDAY* - *LASTDAY*
+  interval in its configuration file;
+
+- by subset of pairs, each run cross-correlating its own pairs
+  of stations.
+
+The stacks, month stacks and nb of days of the pairs appearing in
+several partial sets are summed, their locations and ids are united
+and their first/last days are combined, so that the merged set is
+equivalent to the one that a single run would have produced. Note that
+a given pair must not have been cross-correlated over the same days in
+two partial sets: an exception is raised if the periods of a pair
+overlap.
+
+The partial sets of cross-correlations (instances of
+pscrosscorr.CrossCorrelationCollection, or of
+pscrosscorr.MultiComponentCrossCorrelationCollection with the same
+components, exported in binary format with module pickle) are read in
+folder *CROSSCORR_DIR*, and the merged set is exported to the same folder as crosscorrelation.py would do (see
+the description of the output files in crosscorrelation.py).
+"""
+
+from pysismo import pscrosscorr
+import glob
+import os
+
+# parsing configuration file to import dir of cross-corr results
+from pysismo.psconfig import CROSSCORR_DIR, CROSSCORR_TMAX
+
+# selecting partial cross-correlations (looking for *.pickle files
+# and *.xcstore dirs in dir *CROSSCORR_DIR*)
+flist = sorted(glob.glob(os.path.join(CROSSCORR_DIR, 'xcorr*.pickle*')) +
+               glob.glob(os.path.join(CROSSCORR_DIR, 'xcorr*.xcstore')))
+flist = [f for f in flist if not f.endswith(('.journal.pickle', '.SNRs.pickle'))]
+print('Select files containing the partial cross-correlations to merge: '
+      '[All except backups]')
+print('0 - All except backups (*~)')
+for i, f in enumerate(flist):
+    print('{} - {}'.format(i + 1, os.path.basename(f)))
+
+res = input('\n')
+if not res or res.strip() == '0':
+    pickle_files = [f for f in flist if f[-1] != '~']
+else:
+    pickle_files = [flist[int(i) - 1] for i in res.split()]
+
+if len(pickle_files) < 2:
+    raise Exception("At least two sets of cross-correlations are needed to merge!")
+
+# name of output files (without extension)
+outbasename = input("\nEnter name of output files (without extension): "
+                    "[xcorr_merged]\n").strip()
+OUTFILESPATH = os.path.join(CROSSCORR_DIR, outbasename or 'xcorr_merged')
+print('Results will be exported to files:\n"{}" (+ extension)\n'.format(OUTFILESPATH))
+
+# merging partial sets of cross-correlations
+xc = None
+for pickle_file in pickle_files:
+    print("Merging cross-correlations of file: " + pickle_file)
+    partialxc = pscrosscorr.load_xcorr(pickle_file)
+    if xc is None:
+        xc = partialxc
+    else:
+        xc.merge(partialxc)
+    del partialxc
+
+# exporting merged cross-correlations
+if not xc.pairs():
+    print("No cross-correlation in merged set: nothing to export!")
+else:
+    # exporting to binary and ascii files
+    xc.export(outprefix=OUTFILESPATH, verbose=True)
+
+    # exporting to png file(s): one per pair of components (after
+    # rotation) if multi-component cross-correlations
+    if isinstance(xc, pscrosscorr.MultiComponentCrossCorrelationCollection):
+        rotated_xc = xc.rotated()
+        plots = [(u'{}_{}'.format(OUTFILESPATH, key), rotated_xc[key])
+                 for key in rotated_xc]
+    else:
+        plots = [(OUTFILESPATH, xc)]
+    for outprefix, plotxc in plots:
+        if not plotxc.pairs():
+            continue
+        print("Exporting cross-correlations to file: {}.png".format(outprefix))
+        # optimizing time-scale: max time = max distance / vmin (vmin = 2.5 km/s)
+        maxdist = max([plotxc[s1][s2].dist() for s1, s2 in plotxc.pairs()])
+        maxt = min(CROSSCORR_TMAX, maxdist / 2.5)
+        plotxc.plot(xlim=(-maxt, maxt), outfile=outprefix + '.png', showplot=False)
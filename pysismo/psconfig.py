@@ -101,6 +101,46 @@ CROSSCORR_STATIONS_SUBSET = json.loads(CROSSCORR_STATIONS_SUBSET)
 # locations to skip
 CROSSCORR_SKIPLOCS = json.loads(config.get('cross-correlation', 'CROSSCORR_SKIPLOCS'))
 
+# selection of the pairs of stations to cross-correlate:
+# min/max inter-station distance (km)
+CROSSCORR_MINDIST = json.loads(config.get('cross-correlation', 'CROSSCORR_MINDIST'))
+CROSSCORR_MAXDIST = json.loads(config.get('cross-correlation', 'CROSSCORR_MAXDIST'))
+# networks of (at least one of / both) the stations of the pair
+CROSSCORR_WITHNETS = json.loads(config.get('cross-correlation', 'CROSSCORR_WITHNETS'))
+CROSSCORR_ONLYWITHNETS = json.loads(config.get('cross-correlation',
+                                               'CROSSCORR_ONLYWITHNETS'))
+# explicit pairs to cross-correlate / to skip
+CROSSCORR_PAIRS_SUBSET = json.loads(config.get('cross-correlation',
+                                               'CROSSCORR_PAIRS_SUBSET'))
+CROSSCORR_SKIPPAIRS = json.loads(config.get('cross-correlation', 'CROSSCORR_SKIPPAIRS'))
+# max nb of pairs per station (nearest stations first)
+CROSSCORR_MAXPAIRS_PER_STATION = json.loads(config.get('cross-correlation',
+                                                       'CROSSCORR_MAXPAIRS_PER_STATION'))
+
+# components to cross-correlate in one pass (null if one channel per station)
+CROSSCORR_COMPONENTS = json.loads(config.get('cross-correlation', 'CROSSCORR_COMPONENTS'))
+
+# data type of the archive of daily cross-correlations (null if no archive)
+CROSSCORR_DAILY_ARCHIVE = json.loads(config.get('cross-correlation',
+                                                'CROSSCORR_DAILY_ARCHIVE'))
+
+# memory (MB) allowed for the cross-correlations of a day (null if no limit)
+CROSSCORR_RAM_BUDGET = json.loads(config.get('cross-correlation', 'CROSSCORR_RAM_BUDGET'))
+
+# sub-daily windows: length (sec, null if whole days), overlap (fraction of
+# length) and max std of a window relative to the median (null if no rejection)
+CROSSCORR_WINDOW_LENGTH = json.loads(config.get('cross-correlation',
+                                                'CROSSCORR_WINDOW_LENGTH'))
+CROSSCORR_WINDOW_OVERLAP = config.getfloat('cross-correlation', 'CROSSCORR_WINDOW_OVERLAP')
+CROSSCORR_WINDOW_REJECT = json.loads(config.get('cross-correlation',
+                                                'CROSSCORR_WINDOW_REJECT'))
+
+# export cross-correlations to a chunked store instead of a pickle file?
+CROSSCORR_STORE = config.getboolean('cross-correlation', 'CROSSCORR_STORE')
+
+# export cross-correlations to a binary columnar file instead of a txt file?
+CROSSCORR_COLUMNAR = config.getboolean('cross-correlation', 'CROSSCORR_COLUMNAR')
+
 # first and last day, minimum data fill per day
 FIRSTDAY = config.get('cross-correlation', 'FIRSTDAY')
 FIRSTDAY = dt.datetime.strptime(FIRSTDAY, '%d/%m/%Y').date()
@@ -135,6 +175,8 @@ WINDOW_FREQ = config.getfloat('cross-correlation', 'WINDOW_FREQ')
 
 # Max time window (s) for cross-correlation
 CROSSCORR_TMAX = config.getfloat('cross-correlation', 'CROSSCORR_TMAX')
+# floor of per-pair max lag (null if all pairs up to CROSSCORR_TMAX)
+CROSSCORR_TMAX_FLOOR = json.loads(config.get('cross-correlation', 'CROSSCORR_TMAX_FLOOR'))
 
 
 # ---------------
@@ -211,6 +253,10 @@ HALFWINDOW_MEDIAN_PERIOD = config.getint('FTAN', 'HALFWINDOW_MEDIAN_PERIOD')
 MAX_RELDIFF_INST_MEDIAN_PERIOD = config.getfloat('FTAN',
                                                  'MAX_RELDIFF_INST_MEDIAN_PERIOD')
 
+# export dispersion curves as an array-backed set (dir *.dcset,
+# see pstomo.DispersionCurveSet) instead of a pickled list?
+FTAN_CURVESET = config.getboolean('FTAN', 'FTAN_CURVESET')
+
 # --------------------------------
 # Tomographic inversion parameters
 # --------------------------------
@@ -254,3 +300,11 @@ BETA = config.getfloat('tomography', 'BETA')
 # With a value of 0.15, penalization becomes strong when path density < ~20
 # With a value of 0.30, penalization becomes strong when path density < ~10
 LAMBDA = config.getfloat('tomography', 'LAMBDA')
+
+# export final velocity maps as a compact set (dir *.vmapset, see
+# pstomo.VelocityMapSet) instead of pickling the whole maps?
+# Fields kept in the set (JSON list among "mopt", "density", "Rradius",
+# "covmopt_diag"), and export resolution matrices (in float32)?
+TOMO_COMPACT_EXPORT = config.getboolean('tomography', 'TOMO_COMPACT_EXPORT')
+TOMO_COMPACT_FIELDS = json.loads(config.get('tomography', 'TOMO_COMPACT_FIELDS'))
+TOMO_COMPACT_R = config.getboolean('tomography', 'TOMO_COMPACT_R')
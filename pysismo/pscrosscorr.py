@@ -13,8 +13,9 @@ import obspy.signal.filter
 from obspy.core import AttribDict, read, UTCDateTime, Trace
 from obspy.signal.invsim import cosine_taper
 import numpy as np
-from numpy.fft import rfft, irfft, fft, ifft, fftfreq
+from numpy.fft import rfft, irfft, fft, ifft, fftfreq, rfftfreq
 from scipy import integrate
+from scipy.fftpack import next_fast_len
 from scipy.interpolate import RectBivariateSpline, interp1d, interp2d
 from scipy.optimize import minimize
 import itertools as it
@@ -22,6 +23,7 @@ import os
 import shutil
 import glob
 import pickle
+import json
 import copy
 from collections import OrderedDict
 import datetime as dt
@@ -39,12 +41,17 @@ plt.ioff()  # turning off interactive mode
 # ====================================================
 from pysismo.psconfig import (
     CROSSCORR_DIR, FTAN_DIR, PERIOD_BANDS, CROSSCORR_TMAX, PERIOD_RESAMPLE,
-    CROSSCORR_SKIPLOCS, MINFILL, FREQMIN, FREQMAX, CORNERS, ZEROPHASE,
+    CROSSCORR_SKIPLOCS, CROSSCORR_MINDIST, CROSSCORR_MAXDIST, CROSSCORR_WITHNETS,
+    CROSSCORR_ONLYWITHNETS, CROSSCORR_PAIRS_SUBSET, CROSSCORR_SKIPPAIRS,
+    CROSSCORR_MAXPAIRS_PER_STATION, CROSSCORR_TMAX_FLOOR, CROSSCORR_RAM_BUDGET, CROSSCORR_WINDOW_LENGTH,
+    CROSSCORR_WINDOW_OVERLAP, CROSSCORR_WINDOW_REJECT, CROSSCORR_STORE, CROSSCORR_COLUMNAR,
+    MINFILL, FREQMIN, FREQMAX, CORNERS, ZEROPHASE,
     ONEBIT_NORM, FREQMIN_EARTHQUAKE, FREQMAX_EARTHQUAKE, WINDOW_TIME, WINDOW_FREQ,
     SIGNAL_WINDOW_VMIN, SIGNAL_WINDOW_VMAX, SIGNAL2NOISE_TRAIL, NOISE_WINDOW_SIZE,
     RAWFTAN_PERIODS, CLEANFTAN_PERIODS, FTAN_VELOCITIES, FTAN_ALPHA, STRENGTH_SMOOTHING,
     USE_INSTANTANEOUS_FREQ, MAX_RELDIFF_INST_NOMINAL_PERIOD, MIN_INST_PERIOD,
-    HALFWINDOW_MEDIAN_PERIOD, MAX_RELDIFF_INST_MEDIAN_PERIOD, BBOX_LARGE, BBOX_SMALL)
+    HALFWINDOW_MEDIAN_PERIOD, MAX_RELDIFF_INST_MEDIAN_PERIOD, FTAN_CURVESET,
+    BBOX_LARGE, BBOX_SMALL)
 
 # ========================
 # Constants and parameters
@@ -52,6 +59,16 @@ from pysismo.psconfig import (
 
 EPS = 1.0e-5
 ONESEC = dt.timedelta(seconds=1)
+# nb of values formatted at once when exporting cross-correlations to txt file
+ASCII_BLOCK_SIZE = 2**20
+# nb of values of the cross-correlations whose SNRs are calculated at once
+SNR_BLOCK_SIZE = 2**22
+# default parameters of the spectral whitening of cross-correlations
+# (see CrossCorrelation.whiten()): width of the smoothing window of
+# the amplitude spectrum (Hz), and bandpass (s)
+WHITEN_WINDOW_FREQ = 0.004
+WHITEN_BANDPASS_TMIN = 7.0
+WHITEN_BANDPASS_TMAX = 150
 
 
 class MonthYear:
@@ -122,8 +139,10 @@ class MonthCrossCorrelation:
         # initializing stats
         self.nday = 0
 
-        # data array of month cross-correlation
+        # data array of month cross-correlation, and sum of the
+        # squared daily cross-correlations (variance of the stack)
         self.dataarray = np.zeros(ndata)
+        self.sqdataarray = np.zeros(ndata)
 
     def monthfill(self):
         """
@@ -174,6 +193,9 @@ class CrossCorrelation:
         nmax = int(xcorr_tmax / xcorr_dt)
         self.timearray = np.arange(-nmax * xcorr_dt, (nmax + 1)*xcorr_dt, xcorr_dt)
         self.dataarray = np.zeros(2 * nmax + 1)
+        # sum of the squared daily cross-correlations, streamed while
+        # stacking to estimate the variance of the stack (see stack_stderr())
+        self.sqdataarray = np.zeros(2 * nmax + 1)
 
         #  has cross-corr been symmetrized? whitened?
         self.symmetrized = False
@@ -182,6 +204,62 @@ class CrossCorrelation:
         # initializing list of cross-correlations over a single month
         self.monthxcs = []
 
+        # cached index of month stacks (see _get_month_index()),
+        # cached symmetrized/whitened cross-corrs (see symmetrize(), whiten())
+        # and cached index ranges of windows (see signal_noise_indexes())
+        self._monthindex = None
+        self._views = {}
+        self._windows = {}
+
+        # cached SNRs, {SNR parameters of band: SNR} (see SNR()), and
+        # cross-corr of which self is a symmetrized/whitened view, whose
+        # cache holds the SNRs of the view (see _get_SNRcache())
+        self._SNRcache = {}
+        self._parent = None
+
+        # cached indices of the stations in the registry of stations
+        # (see _get_stationindices())
+        self._stationindices = None
+
+    def __getstate__(self):
+        """
+        The cached index of month stacks, the cached
+        symmetrized/whitened cross-corrs, the cached index
+        ranges of windows, the cached indices of the stations
+        in the registry and the link to the cross-corr of which
+        self is a view are not pickled (the cached SNRs are)
+        """
+        state = self.__dict__.copy()
+        state.pop('_monthindex', None)
+        state.pop('_views', None)
+        state.pop('_windows', None)
+        state.pop('_stationindices', None)
+        state.pop('_parent', None)
+        return state
+
+    def _discard_caches(self):
+        """
+        Discards the cached index of month stacks, the cached
+        symmetrized/whitened cross-corrs, the cached index ranges
+        of windows and the cached SNRs (and the link to the cross-corr
+        of which self was a view), after data are stacked or modified
+        """
+        self._release_caches()
+        self._SNRcache = {}
+        self._parent = None
+
+    def _release_caches(self):
+        """
+        Discards the cached index of month stacks, the cached
+        symmetrized/whitened cross-corrs and the cached index ranges
+        of windows, to free memory once self has been processed (e.g.,
+        in CrossCorrelationCollection.FTANs()). The cached SNRs, which
+        also hold the SNRs of the views (see _get_SNRcache()), are kept.
+        """
+        self._monthindex = None
+        self._views = {}
+        self._windows = {}
+
     def __repr__(self):
         s = '<cross-correlation between stations {0}-{1}: avg {2} days>'
         return s.format(self.station1.name, self.station2.name, self.nday)
@@ -200,12 +278,31 @@ class CrossCorrelation:
                         sta2=self.station2.name, locs2=locs2, nday=self.nday,
                         start=self.startday, end=self.endday)
 
+    def _get_stationindices(self):
+        """
+        Returns the indices of the stations of the pair in the
+        registry of stations (see L{psstation.StationRegistry}),
+        cached (but not pickled) in self._stationindices along
+        with the generation of the registry they are valid for
+
+        @rtype: (int, int)
+        """
+        registry = psstation.registry
+        cache = getattr(self, '_stationindices', None)
+        if cache is None or cache[0] != registry.generation:
+            self._stationindices = (registry.generation,
+                                    registry.index(self.station1),
+                                    registry.index(self.station2))
+        return self._stationindices[1:]
+
     def dist(self):
         """
         Geodesic distance (in km) between stations, using the
-        WGS-84 ellipsoidal model of the Earth
+        WGS-84 ellipsoidal model of the Earth, taken from the
+        cached matrix of distances of the registry of stations
         """
-        return self.station1.dist(self.station2)
+        i1, i2 = self._get_stationindices()
+        return psstation.registry.dists()[i1, i2]
 
     def copy(self):
         """
@@ -215,13 +312,16 @@ class CrossCorrelation:
         result = copy.copy(self)
         # copy of month cross-correlations
         result.monthxcs = [copy.copy(mxc) for mxc in self.monthxcs]
+        result._discard_caches()
         return result
 
     def add(self, tr1, tr2, xcorr=None):
         """
-        Stacks cross-correlation between 2 traces
+        Stacks cross-correlation between 2 traces, and returns
+        the (daily) cross-correlation that was stacked
         @type tr1: L{obspy.core.trace.Trace}
         @type tr2: L{obspy.core.trace.Trace}
+        @rtype: L{numpy.ndarray}
         """
         # verifying sampling rates
         try:
@@ -238,14 +338,22 @@ class CrossCorrelation:
                 tr1.data = tr1.data[:-1]  # make the length difference even
             xcorr = obspy.signal.cross_correlation.correlate(
                 tr1, tr2, self._get_xcorr_nmax(), demean=False, normalize=False)
+        else:
+            # cropping cross-corr provided over larger lags than those of
+            # self (whose max lag may depend on the pair, see pair_tmax())
+            xcorr = _crop_lags(xcorr, self._get_xcorr_nmax())
 
         # verifying that we don't have NaN
         if np.any(np.isnan(xcorr)):
             s = u"Got NaN in cross-correlation between traces:\n{tr1}\n{tr2}"
             raise pserrors.NaNError(s.format(tr1=tr1, tr2=tr2))
 
-        # stacking cross-corr
+        # stacking cross-corr (and squared cross-corr, unless
+        # missing in cross-corrs stacked by an older version)
         self.dataarray += xcorr
+        sqxcorr = xcorr**2
+        if getattr(self, 'sqdataarray', None) is not None:
+            self.sqdataarray += sqxcorr
         # updating stats: 1st day, last day, nb of days of cross-corr
         startday = (tr1.stats.starttime + ONESEC).date
         self.startday = min(self.startday, startday) if self.startday else startday
@@ -263,7 +371,10 @@ class CrossCorrelation:
             monthxc = MonthCrossCorrelation(month=month, ndata=len(self.timearray))
             self.monthxcs.append(monthxc)
         monthxc.dataarray += xcorr
+        if getattr(monthxc, 'sqdataarray', None) is not None:
+            monthxc.sqdataarray += sqxcorr
         monthxc.nday += 1
+        self._discard_caches()
 
         # updating (adding) locs and ids
         self.locs1.add(tr1.stats.location)
@@ -271,12 +382,126 @@ class CrossCorrelation:
         self.ids1.add(tr1.id)
         self.ids2.add(tr2.id)
 
-    def symmetrize(self, inplace=False):
+        return xcorr
+
+    def merge(self, other, check_periods=True):
+        """
+        Merges (in-place) the stacks of another cross-correlation
+        between the same pair of stations, calculated over another
+        period (e.g., by a run sharded by date range): stacks, month
+        stacks and nb of days are summed, locations and ids are united
+        and first/last days are combined.
+
+        Raises an Exception if cross-correlations are symmetrized or
+        whitened, if their time arrays differ or if their periods
+        overlap (the same day would then be stacked twice). Set
+        *check_periods* = False to skip the latter verification if
+        the days are known to be distinct, although the periods
+        overlap (e.g., when the other cross-correlation only contains
+        data that arrived late).
+
+        @type other: L{CrossCorrelation}
+        @type check_periods: bool
+        """
+        # verifying that cross-correlations can be merged
+        if self.symmetrized or self.whitened or other.symmetrized or other.whitened:
+            raise Exception('Cannot merge symmetrized or whitened cross-correlations')
+        if self.station1 != other.station1 or self.station2 != other.station2:
+            s = 'Cannot merge cross-correlations of different pairs: {} and {}'
+            raise Exception(s.format(repr(self), repr(other)))
+        if len(self.timearray) != len(other.timearray) or \
+                np.any(np.abs(self.timearray - other.timearray) > EPS):
+            s = 'Cannot merge cross-correlations with different time arrays: {} and {}'
+            raise Exception(s.format(repr(self), repr(other)))
+        if check_periods and self.nday and other.nday and \
+                not (self.endday < other.startday or other.endday < self.startday):
+            s = ('Cannot merge cross-correlations over overlapping periods: '
+                 '{} to {} and {} to {}')
+            raise Exception(s.format(self.startday, self.endday,
+                                     other.startday, other.endday))
+
+        # stacking cross-corr (and squared cross-corr, if known in
+        # both cross-corrs) and updating stats
+        self.dataarray += other.dataarray
+        self.sqdataarray = _sum_sqdataarrays([self, other])
+        startdays = [d for d in (self.startday, other.startday) if d]
+        self.startday = min(startdays) if startdays else None
+        enddays = [d for d in (self.endday, other.endday) if d]
+        self.endday = max(enddays) if enddays else None
+        self.nday += other.nday
+
+        # stacking cross-corr over single months
+        for othermonthxc in other.monthxcs:
+            try:
+                monthxc = next(monthxc for monthxc in self.monthxcs
+                               if monthxc.month == othermonthxc.month)
+            except StopIteration:
+                # appending new month xc
+                monthxc = MonthCrossCorrelation(month=othermonthxc.month,
+                                                ndata=len(self.timearray))
+                self.monthxcs.append(monthxc)
+            monthxc.dataarray += othermonthxc.dataarray
+            monthxc.sqdataarray = _sum_sqdataarrays([monthxc, othermonthxc])
+            monthxc.nday += othermonthxc.nday
+        # keeping month cross-corrs in chronological order
+        self.monthxcs.sort(key=lambda monthxc: (monthxc.month.y, monthxc.month.m))
+        self._discard_caches()
+
+        # updating (uniting) locs and ids
+        self.locs1 |= other.locs1
+        self.locs2 |= other.locs2
+        self.ids1 |= other.ids1
+        self.ids2 |= other.ids2
+
+    def extract_months(self, months):
+        """
+        Returns a new cross-correlation containing only the stacks
+        of the given months (or None if there is no data in these
+        months): the stack and nb of days are those of the selected
+        month stacks, and the first/last days are bounded by the
+        selected months. Locations and ids are copied as is.
+
+        @type months: list of (L{MonthYear} or (int, int))
+        @rtype: L{CrossCorrelation}
+        """
+        monthxcs = [copy.deepcopy(mxc) for mxc in self.monthxcs if mxc.month in months]
+        if not monthxcs:
+            return None
+
+        xcout = copy.copy(self)
+        xcout.monthxcs = monthxcs
+        xcout._discard_caches()
+        xcout.dataarray = sum(mxc.dataarray for mxc in monthxcs)
+        xcout.sqdataarray = _sum_sqdataarrays(monthxcs)
+        xcout.nday = sum(mxc.nday for mxc in monthxcs)
+
+        # first/last days, bounded by the first/last selected months
+        firstmonth = min(monthxcs, key=lambda mxc: (mxc.month.y, mxc.month.m)).month
+        lastmonth = max(monthxcs, key=lambda mxc: (mxc.month.y, mxc.month.m)).month
+        firstday = dt.date(firstmonth.y, firstmonth.m, 1)
+        lastday = dt.date(lastmonth.y, lastmonth.m,
+                          monthrange(year=lastmonth.y, month=lastmonth.m)[1])
+        xcout.startday = max(self.startday, firstday)
+        xcout.endday = min(self.endday, lastday)
+
+        xcout.locs1 = set(self.locs1)
+        xcout.locs2 = set(self.locs2)
+        xcout.ids1 = set(self.ids1)
+        xcout.ids2 = set(self.ids2)
+        return xcout
+
+    def symmetrize(self, inplace=False, cache=True):
         """
         Symmetric component of cross-correlation (including
         the list of cross-corr over a single month).
         Returns self if already symmetrized or inPlace=True
 
+        If inplace=False, the symmetrized copy is cached until data
+        are stacked to self (unless *cache* is False, e.g., for a
+        copy used only once), and shared by the next calls: it must
+        not be modified.
+
+        @type cache: bool
         @rtype: CrossCorrelation
         """
 
@@ -284,6 +509,10 @@ class CrossCorrelation:
             # already symmetrized
             return self
 
+        if not inplace and 'symmetrized' in self._get_views():
+            # cached symmetrized copy
+            return self._views['symmetrized']
+
         # symmetrizing on self or copy of self
         xcout = self if inplace else self.copy()
 
@@ -301,21 +530,41 @@ class CrossCorrelation:
         for obj in [xcout] + (xcout.monthxcs if hasattr(xcout, 'monthxcs') else []):
             a = obj.dataarray
             obj.dataarray = (a[mid:] + a[mid::-1]) / 2.0
+            # the squared daily cross-corrs cannot be symmetrized
+            obj.sqdataarray = None
 
+        xcout._discard_caches()
         xcout.symmetrized = True
+        if not inplace and cache:
+            self._views['symmetrized'] = xcout
+            xcout._parent = self
         return xcout
 
-    def whiten(self, inplace=False, window_freq=0.004,
-               bandpass_tmin=7.0, bandpass_tmax=150):
+    def whiten(self, inplace=False, window_freq=WHITEN_WINDOW_FREQ,
+               bandpass_tmin=WHITEN_BANDPASS_TMIN, bandpass_tmax=WHITEN_BANDPASS_TMAX,
+               cache=True):
         """
         Spectral whitening of cross-correlation (including
-        the list of cross-corr over a single month).
+        the list of cross-corr over a single month), all
+        the stacks being whitened at once.
+
+        If inplace=False, the whitened copy is cached until data
+        are stacked to self (unless *cache* is False), and shared
+        by the next calls with the same parameters: it must not
+        be modified.
+
+        @type cache: bool
         @rtype: CrossCorrelation
         """
         if hasattr(self, 'whitened') and self.whitened:
             # already whitened
             return self
 
+        viewkey = ('whitened', window_freq, bandpass_tmin, bandpass_tmax)
+        if not inplace and viewkey in self._get_views():
+            # cached whitened copy
+            return self._views[viewkey]
+
         # whitening on self or copy of self
         xcout = self if inplace else self.copy()
 
@@ -324,26 +573,72 @@ class CrossCorrelation:
         sampling_rate = 1.0 / xcout._get_xcorr_dt()
         deltaf = sampling_rate / npts
 
-        # loop over cross-corr and one-month stacks
-        for obj in [xcout] + (xcout.monthxcs if hasattr(xcout, 'monthxcs') else []):
-            a = obj.dataarray
-            # Fourier transform
-            ffta = rfft(a)
+        # array of cross-corr and one-month stacks
+        objs = [xcout] + (xcout.monthxcs if hasattr(xcout, 'monthxcs') else [])
+        a = np.array([obj.dataarray for obj in objs])
+
+        # Fourier transform
+        ffta = rfft(a, axis=-1)
 
-            # smoothing amplitude spectrum
-            halfwindow = int(round(window_freq / deltaf / 2.0))
-            weight = psutils.moving_avg(abs(ffta), halfwindow=halfwindow)
-            a[:] = irfft(ffta / weight, n=npts)
+        # smoothing amplitude spectrum
+        halfwindow = int(round(window_freq / deltaf / 2.0))
+        weight = psutils.moving_avg(abs(ffta), halfwindow=halfwindow)
+        a = irfft(ffta / weight, n=npts, axis=-1)
 
-            # bandpass to avoid low/high freq noise
-            obj.dataarray = psutils.bandpass_butterworth(data=a,
-                                                         dt=xcout._get_xcorr_dt(),
-                                                         periodmin=bandpass_tmin,
-                                                         periodmax=bandpass_tmax)
+        # bandpass to avoid low/high freq noise
+        a = psutils.bandpass_butterworth(data=a,
+                                         dt=xcout._get_xcorr_dt(),
+                                         periodmin=bandpass_tmin,
+                                         periodmax=bandpass_tmax)
 
+        for obj, whitened in zip(objs, a):
+            obj.dataarray = whitened
+            # the squared daily cross-corrs cannot be whitened
+            obj.sqdataarray = None
+
+        xcout._discard_caches()
         xcout.whitened = True
+        if not inplace and cache:
+            self._views[viewkey] = xcout
+            # SNRs of the view = SNRs of self with whitening only if self is
+            # symmetrized and whitened with the default parameters, as in
+            # SNR() (which whitens the symmetrized cross-corr): the SNRs of
+            # a whitened unsymmetrized cross-corr are not shared with self
+            if self.symmetrized and (window_freq, bandpass_tmin, bandpass_tmax) == \
+                    (WHITEN_WINDOW_FREQ, WHITEN_BANDPASS_TMIN, WHITEN_BANDPASS_TMAX):
+                xcout._parent = self
         return xcout
 
+    def _get_views(self):
+        """
+        Returns the dict of cached symmetrized/whitened
+        cross-corrs (initialized if needed)
+
+        @rtype: dict
+        """
+        if getattr(self, '_views', None) is None:
+            self._views = {}
+        return self._views
+
+    def _get_SNRcache(self):
+        """
+        Returns the dict of cached SNRs (initialized if needed).
+
+        The SNRs of a symmetrized view (see symmetrize()), and of
+        a whitened view of a symmetrized cross-corr (see whiten()), are
+        those of the cross-corr it is a view of (with whitening if the
+        view is whitened, see SNR()): they are cached, and pickled, with
+        the latter, as long as the view is valid.
+
+        @rtype: dict
+        """
+        parent = getattr(self, '_parent', None)
+        if parent is not None and any(view is self for view in parent._get_views().values()):
+            return parent._get_SNRcache()
+        if getattr(self, '_SNRcache', None) is None:
+            self._SNRcache = {}
+        return self._SNRcache
+
     def signal_noise_windows(self, vmin, vmax, signal2noise_trail, noise_window_size):
         """
         Returns the signal window and the noise window.
@@ -363,22 +658,33 @@ class CrossCorrelation:
 
         @rtype: (float, float), (float, float)
         """
-        # signal window
-        tmin_signal = self.dist() / vmax
-        tmax_signal = self.dist() / vmin
+        tsignal, tnoise = signal_noise_windows(self.dist(), self.timearray.max(),
+                                               vmin, vmax, signal2noise_trail,
+                                               noise_window_size)
+        return tuple(float(t) for t in tsignal), tuple(float(t) for t in tnoise)
+
+    def signal_noise_indexes(self, vmin=SIGNAL_WINDOW_VMIN, vmax=SIGNAL_WINDOW_VMAX,
+                             signal2noise_trail=SIGNAL2NOISE_TRAIL,
+                             noise_window_size=NOISE_WINDOW_SIZE):
+        """
+        Returns the signal window and the noise window (see
+        signal_noise_windows()) as slice bounds of the time array:
+        (istart_signal, istop_signal), (istart_noise, istop_noise).
 
-        # noise window
-        tmin_noise = tmax_signal + signal2noise_trail
-        tmax_noise = tmin_noise + noise_window_size
-        if tmax_noise > self.timearray.max():
-            # the noise window hits the rightmost limit:
-            # let's shift it to the left without crossing
-            # the signal window
-            delta = min(tmax_noise - self.timearray.max(), tmin_noise - tmax_signal)
-            tmin_noise -= delta
-            tmax_noise -= delta
-
-        return (tmin_signal, tmax_signal), (tmin_noise, tmax_noise)
+        Index ranges are cached for each set of parameters,
+        until data are stacked or modified.
+
+        @rtype: (int, int), (int, int)
+        """
+        if getattr(self, '_windows', None) is None:
+            self._windows = {}
+        key = (float(vmin), float(vmax), float(signal2noise_trail),
+               float(noise_window_size))
+        if key not in self._windows:
+            windows = signal_noise_indexes(self.timearray, self.dist(), *key)
+            self._windows[key] = tuple((int(istart), int(istop))
+                                       for istart, istop in windows)
+        return self._windows[key]
 
     def SNR(self, periodbands=None,
             centerperiods_and_alpha=None,
@@ -416,6 +722,9 @@ class CrossCorrelation:
         we try to extend it to the left until it hits the signal
         window.
 
+        The SNR of each band is cached (and pickled) with its parameters
+        (months, whitening, windows and filter), until data are stacked.
+
         @type periodbands: (list of (float, float))
         @type whiten: bool
         @type vmin: float
@@ -425,56 +734,45 @@ class CrossCorrelation:
         @type months: list of (L{MonthYear} or (int, int))
         @rtype: L{numpy.ndarray}
         """
-        # symmetric part of cross-corr
-        xcout = self.symmetrize(inplace=False)
-
-        # spectral whitening
-        if whiten:
-            xcout = xcout.whiten(inplace=False)
-
-        # cross-corr of desired months
-        xcdata = xcout._get_monthyears_xcdataarray(months=months)
-
-        # filter type and associated arguments
-        if periodbands:
-            filtertype = 'Butterworth'
-            kwargslist = [{'periodmin': band[0], 'periodmax': band[1]}
-                          for band in periodbands]
-        elif centerperiods_and_alpha:
-            filtertype = 'Gaussian'
-            kwargslist = [{'period': period, 'alpha': alpha}
-                          for period, alpha in centerperiods_and_alpha]
-        else:
-            filtertype = None
-            kwargslist = [{}]
-
-        SNR = []
-        for filterkwargs in kwargslist:
-            if not filtertype:
-                dataarray = xcdata
-            else:
-                # bandpass filtering data before calculating SNR
-                dataarray = psutils.bandpass(data=xcdata,
-                                             dt=xcout._get_xcorr_dt(),
-                                             filtertype=filtertype,
-                                             **filterkwargs)
-
-            # signal and noise windows
-            tsignal, tnoise = xcout.signal_noise_windows(
-                vmin, vmax, signal2noise_trail, noise_window_size)
-
-            signal_window = (xcout.timearray >= tsignal[0]) & \
-                            (xcout.timearray <= tsignal[1])
-
-            noise_window = (xcout.timearray >= tnoise[0]) & \
-                           (xcout.timearray <= tnoise[1])
+        periodbands = list(periodbands) if periodbands else None
+        centerperiods_and_alpha = (list(centerperiods_and_alpha)
+                                   if centerperiods_and_alpha else None)
+
+        # cached SNRs of bands
+        keys = _SNRkeys(periodbands=periodbands,
+                        centerperiods_and_alpha=centerperiods_and_alpha,
+                        whiten=whiten or self.whitened, months=months,
+                        vmin=vmin, vmax=vmax,
+                        signal2noise_trail=signal2noise_trail,
+                        noise_window_size=noise_window_size)
+        cache = self._get_SNRcache()
+        missing = [i for i, key in enumerate(keys) if key not in cache]
 
-            peak = np.abs(dataarray[signal_window]).max()
-            #noise = dataarray[noise_window].std()
-            noise = sum(np.abs(dataarray[noise_window]))/len(dataarray[noise_window])
+        if missing:
+            # symmetric part of cross-corr
+            xcout = self.symmetrize(inplace=False)
 
-            # appending SNR
-            SNR.append(peak / noise)
+            # spectral whitening
+            if whiten:
+                xcout = xcout.whiten(inplace=False)
+
+            # cross-corr of desired months
+            xcdata = xcout._get_monthyears_xcdataarray(months=months)
+
+            # SNRs of missing bands of the single cross-corr (see SNR_matrix())
+            windows = xcout.signal_noise_indexes(vmin, vmax, signal2noise_trail,
+                                                 noise_window_size)
+            SNRs = SNR_matrix(xcout.timearray, xcdata, None,
+                              periodbands=[periodbands[i] for i in missing]
+                              if periodbands else None,
+                              centerperiods_and_alpha=[centerperiods_and_alpha[i]
+                                                       for i in missing]
+                              if centerperiods_and_alpha else None,
+                              windows=windows)[0]
+            for i, SNR in zip(missing, SNRs):
+                cache[keys[i]] = float(SNR)
+
+        SNR = [cache[key] for key in keys]
 
         # returning 1d array if spectral SNR, 0d array if normal SNR
         return np.array(SNR) if len(SNR) > 1 else np.array(SNR[0])
@@ -564,10 +862,14 @@ class CrossCorrelation:
         # one plot per band + plot of original xcorr
         nplot = len(bands) + 1
 
+        # signal and noise windows
+        tsignal, tnoise = self.signal_noise_windows(
+            vmin, vmax, signal2noise_trail, noise_window_size)
+
         # limits of time axis
         if not tmax:
             # default is to show time up to the noise window (plus 5 %)
-            tmax = self.dist() / vmin + signal2noise_trail + noise_window_size
+            tmax = tsignal[1] + signal2noise_trail + noise_window_size
             tmax = min(1.05 * tmax, self.timearray.max())
         xlim = (0, tmax)
 
@@ -595,13 +897,11 @@ class CrossCorrelation:
 
         # limits of y-axis = min/max of the cross-correlation
         # AFTER the beginning of the signal window
-        mask = (xcout.timearray >= min(self.dist() / vmax, xlim[1])) & \
-               (xcout.timearray <= xlim[1])
-        ylim = (xcdata[mask].min(), xcdata[mask].max())
-
-        # signal and noise windows
-        tsignal, tnoise = xcout.signal_noise_windows(
-            vmin, vmax, signal2noise_trail, noise_window_size)
+        istart = xcout.signal_noise_indexes(vmin, vmax, signal2noise_trail,
+                                            noise_window_size)[0][0]
+        istop = np.searchsorted(xcout.timearray, xlim[1], side='right')
+        istart = min(istart, np.searchsorted(xcout.timearray, xlim[1], side='left'))
+        ylim = (xcdata[istart:istop].min(), xcdata[istart:istop].max())
 
         # plotting original cross-correlation
         axlist[0].plot(xcout.timearray, xcdata)
@@ -656,9 +956,7 @@ class CrossCorrelation:
                                                      periodmax=tmax)
             # limits of y-axis = min/max of the cross-correlation
             # AFTER the beginning of the signal window
-            mask = (xcout.timearray >= min(self.dist() / vmax, xlim[1])) & \
-                   (xcout.timearray <= xlim[1])
-            ylim = (dataarray[mask].min(), dataarray[mask].max())
+            ylim = (dataarray[istart:istop].min(), dataarray[istart:istop].max())
 
             ax.plot(xcout.timearray, dataarray)
 
@@ -684,7 +982,7 @@ class CrossCorrelation:
 
             if lastplot:
                 # adding label to signalwindows
-                ax.text(x=self.dist() * (1.0 / vmin + 1.0 / vmax) / 2.0,
+                ax.text(x=sum(tsignal) / 2,
                         y=ylim[0] + 0.1 * (ylim[1] - ylim[0]),
                         s="Signal window",
                         horizontalalignment='center',
@@ -723,7 +1021,7 @@ class CrossCorrelation:
     def FTAN(self, whiten=False, phase_corr=None, months=None, vgarray_init=None,
              optimize_curve=None, strength_smoothing=STRENGTH_SMOOTHING,
              use_inst_freq=USE_INSTANTANEOUS_FREQ, vg_at_nominal_freq=None,
-             debug=False):
+             cache_SNRs=None, debug=False):
         """
         Frequency-time analysis of a cross-correlation function.
 
@@ -755,6 +1053,15 @@ class CrossCorrelation:
         - if an array is provided in *vg_at_nominal_freq*, then it is filled
           with the vg curve BEFORE the nominal freqs are replaced with
           instantaneous freqs
+        - if a dict of window parameters (vmin, vmax, signal2noise_trail,
+          noise_window_size) is provided in *cache_SNRs*, then the raw
+          FTAN (no phase corr) also calculates the spectral SNRs at the
+          raw FTAN periods, from the real part of the filtered analytic
+          signal (i.e., the cross-corr band-passed with the Gaussian
+          filters), and at the clean FTAN periods that are not raw FTAN
+          periods (with the same Gaussian filters), and puts them in the
+          cache of SNRs (see SNR()), so that the SNRs of the clean vg
+          curve (see FTAN_complete()) need not be calculated again
 
         Returns (1) the amplitude matrix A(T0,v), (2) the phase matrix
         phi(T0,v) (that is, the amplitude and phase function of velocity
@@ -779,6 +1086,7 @@ class CrossCorrelation:
         @type months: list of (L{MonthYear} or (int, int))
         @type vgarray_init: L{numpy.ndarray}
         @type vg_at_nominal_freq: L{numpy.ndarray}
+        @type cache_SNRs: dict
         @rtype: (L{numpy.ndarray}, L{numpy.ndarray}, L{DispersionCurve})
         """
         # no phase correction given <=> raw FTAN
@@ -800,18 +1108,40 @@ class CrossCorrelation:
 
         # FTAN analysis: amplitute and phase function of
         # center periods T0 and time t
-        filter_alpha = 20.*np.sqrt(self.dist()/1000)
+        dist = self.dist()
+        filter_alpha = 20.*np.sqrt(dist/1000)
         ampl, phase = FTAN(x=xcdata,
                            dt=xcout._get_xcorr_dt(),
                            periods=ftan_periods,
                            alpha=filter_alpha,
                            phase_corr=phase_corr)
 
+        if raw_ftan and cache_SNRs is not None:
+            # spectral SNRs at FTAN periods: the real part of the filtered
+            # analytic signal is the cross-corr band-passed with the
+            # Gaussian filters of the FTAN (see psutils.bandpass_gaussian())
+            # (band-passed cross-corr at the periods of the clean vg curve
+            # that are not FTAN periods calculated with the same filters)
+            SNRperiods = list(ftan_periods)
+            bandpassed = ampl * np.cos(phase)
+            cleanperiods = np.setdiff1d(CLEANFTAN_PERIODS, ftan_periods)
+            if len(cleanperiods):
+                cleanampl, cleanphase = FTAN(x=xcdata, dt=xcout._get_xcorr_dt(),
+                                             periods=cleanperiods, alpha=filter_alpha)
+                SNRperiods += list(cleanperiods)
+                bandpassed = np.concatenate([bandpassed, cleanampl * np.cos(cleanphase)])
+            keys = _SNRkeys(centerperiods_and_alpha=[(T, filter_alpha) for T in SNRperiods],
+                            whiten=whiten or self.whitened, months=months,
+                            **cache_SNRs)
+            SNRs = _window_SNRs(xcout.timearray, [bandpassed], None,
+                                windows=xcout.signal_noise_indexes(**cache_SNRs))[:, 0]
+            self._get_SNRcache().update(zip(keys, SNRs.tolist()))
+
         # re-interpolating amplitude and phase as functions
         # of center periods T0 and velocities v
         tne0 = xcout.timearray != 0.0
         x = ftan_periods                                 # x = periods
-        y = (self.dist() / xcout.timearray[tne0])[::-1]  # y = velocities
+        y = (dist / xcout.timearray[tne0])[::-1]         # y = velocities
         zampl = ampl[:, tne0][:, ::-1]                   # z = amplitudes
         zphase = phase[:, tne0][:, ::-1]                 # z = phases
         # spline interpolation
@@ -1014,6 +1344,14 @@ class CrossCorrelation:
         if whiten:
             xc = xc.whiten(inplace=False)
 
+        # window parameters of the spectral SNRs, calculated
+        # along with the raw FTANs (see FTAN())
+        cache_SNRs = None
+        if add_SNRs:
+            cache_SNRs = {'vmin': vmin, 'vmax': vmax,
+                          'signal2noise_trail': signal2noise_trail,
+                          'noise_window_size': noise_window_size}
+
         # raw FTAN (no need to whiten any more)
         rawvg_init = np.zeros_like(RAWFTAN_PERIODS)
         try:
@@ -1023,6 +1361,7 @@ class CrossCorrelation:
                                         strength_smoothing=strength_smoothing,
                                         use_inst_freq=use_inst_freq,
                                         vg_at_nominal_freq=rawvg_init,
+                                        cache_SNRs=cache_SNRs,
                                         **kwargs)
         except pserrors.CannotCalculateInstFreq:
             # pb with instantaneous frequency: returnin NaNs
@@ -1111,6 +1450,7 @@ class CrossCorrelation:
                         optimize_curve=optimize_curve,
                         strength_smoothing=strength_smoothing,
                         use_inst_freq=use_inst_freq,
+                        cache_SNRs=cache_SNRs,
                         **kwargs)
 
                     phase_corr_trimester = xc.phase_func(vgcurve=rawvg_trimester)
@@ -1513,12 +1853,112 @@ class CrossCorrelation:
         """
         if not months:
             return self.dataarray
+
+        # positions of the selected months along the month axis
+        positions, prefixsums, calendarstacks, calendarpositions = self._get_month_index()
+        selected = sorted(set(positions[key] for key in _monthkeys(months)
+                              if key in positions))
+        if not selected:
+            return None
+
+        # runs of consecutive months, whose stacks are
+        # differences between prefix sums
+        runs = []
+        for i in selected:
+            if runs and runs[-1][1] == i:
+                runs[-1][1] = i + 1
+            else:
+                runs.append([i, i + 1])
+
+        # whole calendar months (e.g., seasonal selection over all the
+        # years), whose stacks are sums of calendar month stacks
+        selected = set(selected)
+        calmonths = [m for m, ipositions in calendarpositions.items() if ipositions & selected]
+        if len(calmonths) < len(runs) and \
+                selected == set().union(*[calendarpositions[m] for m in calmonths]):
+            return sum(calendarstacks[m] for m in calmonths)
+
+        return sum(prefixsums[stop] - prefixsums[start] for start, stop in runs)
+
+    def _get_month_index(self):
+        """
+        Returns the (cached) index of the month stacks, made of:
+        - a dict {(month, year): position} along the (chronological) month axis
+        - the cumulative sums of the month stacks along the month axis,
+          starting with zero (prefix sums), so that the stack of the months
+          at positions i to j-1 is prefixsums[j] - prefixsums[i]
+        - the stacks of the calendar months over all the years, {month: stack}
+        - the positions of the calendar months, {month: set of positions}
+
+        The index is discarded when data are stacked or modified (add(),
+        merge(), symmetrize() etc.), and rebuilt at the next call.
+
+        @rtype: (dict, L{numpy.ndarray}, dict, dict)
+        """
+        if getattr(self, '_monthindex', None) is None:
+            monthxcs = sorted(self.monthxcs, key=lambda mxc: (mxc.month.y, mxc.month.m))
+            positions = {(mxc.month.m, mxc.month.y): i for i, mxc in enumerate(monthxcs)}
+            prefixsums = np.zeros((len(monthxcs) + 1, len(self.dataarray)))
+            if monthxcs:
+                np.cumsum([mxc.dataarray for mxc in monthxcs], axis=0, out=prefixsums[1:])
+            calendarstacks = {}
+            calendarpositions = {}
+            for i, mxc in enumerate(monthxcs):
+                calendarstacks[mxc.month.m] = calendarstacks.get(mxc.month.m, 0.0) + \
+                    mxc.dataarray
+                calendarpositions.setdefault(mxc.month.m, set()).add(i)
+            self._monthindex = (positions, prefixsums, calendarstacks, calendarpositions)
+        return self._monthindex
+
+    def stack_stderr(self, months=None):
+        """
+        Returns the standard error of the stack (of given list of
+        (month, year), or of the whole cross-corr if *months* is None)
+        at each lag, sqrt(nday * var), where var is the variance of the
+        daily cross-correlations, streamed while stacking from the sum
+        of their squares.
+
+        Returns None if there are less than 2 days, or if the sum of
+        squares is not available (symmetrized or whitened cross-corr,
+        rotated components, or cross-corr stacked by an older version).
+
+        @type months: list of (L{MonthYear} or (int, int))
+        @rtype: L{numpy.ndarray}
+        """
+        if not months:
+            stack = self.dataarray
+            sqstack = getattr(self, 'sqdataarray', None)
+            nday = self.nday
         else:
             monthxcs = [mxc for mxc in self.monthxcs if mxc.month in months]
-            if monthxcs:
-                return sum(monthxc.dataarray for monthxc in monthxcs)
-            else:
-                return None
+            stack = sum(monthxc.dataarray for monthxc in monthxcs)
+            sqstack = _sum_sqdataarrays(monthxcs) if monthxcs else None
+            nday = sum(monthxc.nday for monthxc in monthxcs)
+
+        if sqstack is None or nday < 2:
+            return None
+        # variance of daily cross-corrs (clipping negative round-off errors)
+        mean = stack / nday
+        var = np.maximum(sqstack - nday * mean**2, 0.0) / (nday - 1)
+        return np.sqrt(nday * var)
+
+    def convergence_snr(self, months=None):
+        """
+        Returns the signal-to-noise ratio of the convergence of the
+        stack, i.e., the max amplitude of the stack divided by the
+        root mean square of its standard error (see stack_stderr()),
+        or None if the standard error is not available.
+
+        @type months: list of (L{MonthYear} or (int, int))
+        @rtype: float
+        """
+        stderr = self.stack_stderr(months=months)
+        if stderr is None:
+            return None
+        rmserr = np.sqrt(np.mean(stderr**2))
+        if rmserr == 0.0:
+            return None
+        return np.abs(self._get_monthyears_xcdataarray(months=months)).max() / rmserr
 
 
 class CrossCorrelationCollection(AttribDict):
@@ -1544,14 +1984,178 @@ class CrossCorrelationCollection(AttribDict):
         s = '(AttribDict)<Collection of cross-correlation between {0} pairs>'
         return s.format(npair)
 
+    def __iter__(self):
+        """
+        Iterates over the names of the first stations of the pairs
+        (keys starting with an underscore contain information on the
+        collection itself, e.g., the record of processed days)
+        """
+        return (key for key in self.__dict__ if not key.startswith('_'))
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __getstate__(self):
+        """
+        The cached table of pairs (see _get_pairtable()) and the
+        version of the collection (see _bump_version()) are not pickled
+        """
+        state = self.__dict__.copy()
+        state.pop('_pairtable', None)
+        state.pop('_version', None)
+        return state
+
+    def __setitem__(self, key, value):
+        AttribDict.__setitem__(self, key, value)
+        self._bump_version()
+
+    def __delitem__(self, key):
+        AttribDict.__delitem__(self, key)
+        self._bump_version()
+
+    __setattr__ = __setitem__
+    __delattr__ = __delitem__
+
+    def _bump_version(self):
+        """
+        Increments the version of the collection, which invalidates
+        the cached table of pairs (see _get_pairtable()). Must be called
+        whenever pairs are added to, or removed from, the collection,
+        or days are stacked, as done by __setitem__(), __delitem__(),
+        _get_or_init_xcorr() (and hence add()) and merge().
+        """
+        # (avoiding setattr(), which would bump the version recursively)
+        self.__dict__['_version'] = self.__dict__.get('_version', 0) + 1
+
+    def _get_pairtable(self):
+        """
+        Returns the table of pairs of the collection, as a structured
+        array with one row per pair, in the order of iteration
+        over the collection, with fields:
+        - s1, s2: names of the stations of the pair
+        - i1, i2: indices of the stations in the list of stations
+                  of the table (see _get_pairtable_stations())
+        - net1, net2: networks of the stations
+        - dist: inter-station distance (km)
+        - azimuth: azimuth of the pair (from station1 to station2)
+        - nday: nb of days stacked
+        - startday, endday: first and last days stacked
+        - SNR: SNR of the pair, cached by pairs() (nan if not calculated)
+
+        The table is cached in self._pairtable, and recalculated only
+        if the version of the collection has changed, i.e., if pairs
+        have been added to, or removed from, the collection, or if days
+        have been stacked (see _bump_version()). Pairs modified without
+        going through the collection (e.g., self[s1][s2].add(...)) call
+        for an explicit _bump_version().
+
+        @rtype: L{numpy.ndarray}
+        """
+        version = self.__dict__.get('_version', 0)
+        cache = self.__dict__.get('_pairtable')
+        if cache and cache['version'] == version:
+            return cache['table']
+
+        pairs = [(s1, s2) for s1 in self for s2 in self[s1]]
+        xcs = [self[s1][s2] for s1, s2 in pairs]
+
+        # unique stations of the pairs (see Station.__eq__())
+        stations = []
+        stationindex = {}
+        indices = []
+        for xc in xcs:
+            pairindices = []
+            for station in (xc.station1, xc.station2):
+                stationkey = tuple(getattr(station, att) for att in station.BOOLATTRS)
+                if stationkey not in stationindex:
+                    stationindex[stationkey] = len(stations)
+                    stations.append(station)
+                pairindices.append(stationindex[stationkey])
+            indices.append(pairindices)
+
+        namelen = max([len(s) for pair in pairs for s in pair] + [1])
+        netlen = max([len(s.network) for s in stations] + [1])
+        dtype = [('s1', 'U{}'.format(namelen)), ('s2', 'U{}'.format(namelen)),
+                 ('i1', int), ('i2', int),
+                 ('net1', 'U{}'.format(netlen)), ('net2', 'U{}'.format(netlen)),
+                 ('dist', float), ('azimuth', float), ('nday', int),
+                 ('startday', 'datetime64[D]'), ('endday', 'datetime64[D]'),
+                 ('SNR', float)]
+        table = np.zeros(len(pairs), dtype=dtype)
+        if pairs:
+            table['s1'], table['s2'] = zip(*pairs)
+            table['i1'], table['i2'] = np.array(indices).T
+            networks = np.array([s.network for s in stations])
+            table['net1'] = networks[table['i1']]
+            table['net2'] = networks[table['i2']]
+
+            # distances and azimuths from the registry of stations
+            iregistry = psstation.registry.indices(stations)
+            i1, i2 = iregistry[table['i1']], iregistry[table['i2']]
+            table['dist'] = psstation.registry.dists()[i1, i2]
+            table['azimuth'] = psstation.registry.azimuths()[i1, i2]
+
+            table['nday'] = [xc.nday for xc in xcs]
+            table['startday'] = [xc.startday for xc in xcs]
+            table['endday'] = [xc.endday for xc in xcs]
+        table['SNR'] = np.nan
+
+        # (avoiding setattr(), which would turn the dict into an AttribDict)
+        self.__dict__['_pairtable'] = {'version': version,
+                                       'table': table,
+                                       'stations': stations,
+                                       'rows': {pair: i for i, pair in enumerate(pairs)},
+                                       'SNRkwargs': None,
+                                       'windows': {}}
+        return table
+
+    def _get_pairtable_stations(self):
+        """
+        Returns the list of stations indexed by fields i1, i2
+        of the table of pairs (see _get_pairtable())
+
+        @rtype: list of L{pysismo.psstation.Station}
+        """
+        self._get_pairtable()
+        return self.__dict__['_pairtable']['stations']
+
+    def _get_pairtable_windows(self, timearray, vmin=SIGNAL_WINDOW_VMIN,
+                               vmax=SIGNAL_WINDOW_VMAX,
+                               signal2noise_trail=SIGNAL2NOISE_TRAIL,
+                               noise_window_size=NOISE_WINDOW_SIZE):
+        """
+        Returns the signal windows and the noise windows of all the
+        pairs of the table (see _get_pairtable()), as slice bounds of
+        the time array *timearray* (see signal_noise_indexes()):
+        (istart_signal, istop_signal), (istart_noise, istop_noise),
+        arrays of indices ordered as the rows of the table.
+
+        Index ranges are cached in the table for each time
+        array and set of parameters.
+
+        @type timearray: L{numpy.ndarray}
+        @rtype: (L{numpy.ndarray}, L{numpy.ndarray}), (L{numpy.ndarray}, L{numpy.ndarray})
+        """
+        table = self._get_pairtable()
+        cache = self.__dict__['_pairtable']['windows']
+        key = (len(timearray), float(timearray[0]), float(timearray[-1]),
+               float(vmin), float(vmax), float(signal2noise_trail),
+               float(noise_window_size))
+        if key not in cache:
+            cache[key] = signal_noise_indexes(timearray, table['dist'], vmin, vmax,
+                                              signal2noise_trail, noise_window_size)
+        return cache[key]
+
     def pairs(self, sort=False, minday=1, minSNR=None, mindist=None,
               withnets=None, onlywithnets=None, pairs_subset=None,
               **kwargs):
         """
         Returns pairs of stations of cross-correlation collection
-        verifying conditions.
+        verifying conditions, selected with boolean queries on
+        the table of pairs (see _get_pairtable()).
 
-        Additional arguments in *kwargs* are sent to xc.SNR().
+        Additional arguments in *kwargs* are sent to xc.SNR(), whose
+        results are cached in the table.
 
         @type sort: bool
         @type minday: int
@@ -1562,42 +2166,129 @@ class CrossCorrelationCollection(AttribDict):
         @type pairs_subset: list of (str, str)
         @rtype: list of (str, str)
         """
-        pairs = [(s1, s2) for s1 in self for s2 in self[s1]]
-        if sort:
-            pairs.sort()
+        table = self._get_pairtable()
+        mask = np.ones(len(table), dtype=bool)
 
         # filtering subset of pairs
         if pairs_subset:
-            pairs_subset = [set(pair) for pair in pairs_subset]
-            pairs = [pair for pair in pairs if set(pair) in pairs_subset]
+            pairs_subset = set(frozenset(pair) for pair in pairs_subset)
+            mask &= [frozenset(pair) in pairs_subset
+                     for pair in zip(table['s1'], table['s2'])]
 
         # filtering by nb of days
-        pairs = [(s1, s2) for (s1, s2) in pairs
-                 if self[s1][s2].nday >= minday]
-
-        # filtering by min SNR
-        if minSNR:
-            pairs = [(s1, s2) for (s1, s2) in pairs
-                     if self[s1][s2].SNR(**kwargs) >= minSNR]
+        mask &= table['nday'] >= minday
 
         # filtering by distance
         if mindist:
-            pairs = [(s1, s2) for (s1, s2) in pairs
-                     if self[s1][s2].dist() >= mindist]
+            mask &= table['dist'] >= mindist
 
         # filtering by network
         if withnets:
             # one of the station of the pair must belong to networks
-            pairs = [(s1, s2) for (s1, s2) in pairs if
-                     self[s1][s2].station1.network in withnets or
-                     self[s1][s2].station2.network in withnets]
+            mask &= np.in1d(table['net1'], withnets) | np.in1d(table['net2'], withnets)
         if onlywithnets:
             # both stations of the pair must belong to networks
-            pairs = [(s1, s2) for (s1, s2) in pairs if
-                     self[s1][s2].station1.network in onlywithnets and
-                     self[s1][s2].station2.network in onlywithnets]
+            mask &= np.in1d(table['net1'], onlywithnets) & np.in1d(table['net2'], onlywithnets)
 
-        return pairs
+        # filtering by min SNR, calculating (and caching in the
+        # table) the SNRs of the remaining pairs if needed
+        if minSNR:
+            cache = self.__dict__['_pairtable']
+            SNRkwargs = sorted(kwargs.items())
+            if cache['SNRkwargs'] != SNRkwargs:
+                table['SNR'] = np.nan
+                cache['SNRkwargs'] = SNRkwargs
+            indices = np.nonzero(mask & np.isnan(table['SNR']))[0]
+            if len(indices):
+                pairs = list(zip(table['s1'][indices], table['s2'][indices]))
+                table['SNR'][indices] = self.SNRarrays(pairs, **kwargs)[:, 0]
+            mask &= table['SNR'] >= minSNR
+
+        indices = np.nonzero(mask)[0]
+        if sort:
+            indices = sorted(indices, key=lambda i: (table['s1'][i], table['s2'][i]))
+        return [(str(table['s1'][i]), str(table['s2'][i])) for i in indices]
+
+    def SNRarrays(self, pairs, whiten=False, months=None, verbose=False,
+                  **kwargs):
+        """
+        [spectral] signal-to-noise ratios of the cross-correlations of
+        *pairs*, calculated at once for all the cross-correlations sharing
+        the same time array (see SNR_matrix()), and returned as a (nb of
+        pairs x nb of bands) array (nb of bands = 1 if no band is given).
+        SNRs of pairs without data in *months* are nan.
+
+        Additional arguments in *kwargs* are sent to SNR_matrix()
+        (periodbands, centerperiods_and_alpha, vmin, vmax,
+        signal2noise_trail, noise_window_size). The index ranges
+        of the windows are taken from the table of pairs (see
+        _get_pairtable_windows()).
+
+        SNRs are read from (and added to) the cache of each
+        cross-correlation (see CrossCorrelation.SNR()).
+
+        @type pairs: list of (str, str)
+        @type whiten: bool
+        @type months: list of (L{MonthYear} or (int, int))
+        @type verbose: bool
+        @rtype: L{numpy.ndarray}
+        """
+        table = self._get_pairtable()
+        rows = self.__dict__['_pairtable']['rows']
+        for arg in ['periodbands', 'centerperiods_and_alpha']:
+            if kwargs.get(arg):
+                kwargs[arg] = list(kwargs[arg])
+
+        # cached SNRs
+        keys = _SNRkeys(whiten=whiten, months=months, **kwargs)
+        SNRs = np.nan * np.zeros((len(pairs), len(keys)))
+        caches = [self[s1][s2]._get_SNRcache() for s1, s2 in pairs]
+
+        windowkwargs = {k: kwargs[k] for k in ('vmin', 'vmax', 'signal2noise_trail',
+                                               'noise_window_size') if k in kwargs}
+
+        def estimate_block(timearray, items):
+            # SNRs of a block of cross-corrs sharing the same time array,
+            # with the index ranges of windows of all pairs (cached in the table)
+            ipairs, dataarrays = zip(*items)
+            if verbose:
+                print("Estimating SNRs of {} pairs".format(len(ipairs)))
+            tablewindows = self._get_pairtable_windows(timearray, **windowkwargs)
+            irows = [rows[tuple(pairs[j])] for j in ipairs]
+            windows = tuple((istart[irows], istop[irows])
+                            for istart, istop in tablewindows)
+            SNRs[list(ipairs)] = SNR_matrix(timearray, np.array(dataarrays),
+                                            table['dist'][irows],
+                                            windows=windows, **kwargs)
+            for ipair in ipairs:
+                caches[ipair].update(zip(keys, SNRs[ipair].tolist()))
+
+        # symmetrized [and whitened] cross-corrs of pairs with SNRs
+        # missing in cache, grouped by time array, whose SNRs are estimated
+        # as soon as a block is complete (the copies are not cached in the
+        # cross-corrs, so that only one block per time array is in memory)
+        groups = OrderedDict()
+        for ipair, (s1, s2) in enumerate(pairs):
+            if all(key in caches[ipair] for key in keys):
+                SNRs[ipair] = [caches[ipair][key] for key in keys]
+                continue
+            xcout = self[s1][s2].symmetrize(inplace=False, cache=False)
+            if whiten:
+                xcout = xcout.whiten(inplace=False, cache=False)
+            xcdata = xcout._get_monthyears_xcdataarray(months=months)
+            if xcdata is None:
+                continue
+            t = xcout.timearray
+            timearray, items = groups.setdefault((len(t), t[0], t[-1]), (t, []))
+            items.append((ipair, xcdata))
+            if len(items) >= max(SNR_BLOCK_SIZE // len(timearray), 1):
+                estimate_block(timearray, items)
+                del items[:]
+
+        for timearray, items in groups.values():
+            if items:
+                estimate_block(timearray, items)
+        return SNRs
 
     def pairs_and_SNRarrays(self, pairs_subset=None, minspectSNR=None,
                             whiten=False, verbose=False,
@@ -1621,31 +2312,26 @@ class CrossCorrelationCollection(AttribDict):
         @rtype: dict from (str, str) to L{numpy.ndarray}
         """
 
-        if verbose:
-            print("Estimating spectral SNR of pair:",)
-
         # initial list of pairs
         pairs = pairs_subset if pairs_subset else self.pairs()
 
+        # spectral SNRs of all pairs, calculated at once
+        SNRarrays = self.SNRarrays(pairs, periodbands=PERIOD_BANDS, whiten=whiten,
+                                   vmin=vmin, vmax=vmax,
+                                   signal2noise_trail=signal2noise_trail,
+                                   noise_window_size=noise_window_size,
+                                   verbose=verbose)
+
         # filetring by min spectral SNR
         SNRarraydict = {}
-        for (s1, s2) in pairs:
-            if verbose:
-                print('{0}-{1}'.format(s1, s2),)
-
-            SNRarray = self[s1][s2].SNR(periodbands=PERIOD_BANDS, whiten=whiten,
-                                        vmin=vmin, vmax=vmax,
-                                        signal2noise_trail=signal2noise_trail,
-                                        noise_window_size=noise_window_size)
+        for (s1, s2), SNRarray in zip(pairs, SNRarrays):
             if not minspectSNR or min(SNRarray) >= minspectSNR:
                 SNRarraydict[(s1, s2)] = SNRarray
 
-        if verbose:
-            print()
-
         return SNRarraydict
 
-    def add(self, tracedict, stations, xcorr_tmax, xcorrdict=None, verbose=False):
+    def add(self, tracedict, stations, xcorr_tmax, xcorrdict=None, pairs=None,
+            archive=None, verbose=False):
         """
         Stacks cross-correlations between pairs of stations
         from a dict of {station.name: Trace} (in *tracedict*).
@@ -1653,12 +2339,21 @@ class CrossCorrelationCollection(AttribDict):
         You can provide pre-calculated cross-correlations in *xcorrdict*
         = dict {(station1.name, station2.name): numpy array containing cross-corr}
 
+        You can restrict the pairs to cross-correlate to the set of pairs
+        of station names (station1.name, station2.name) given in *pairs*,
+        with station1.name < station2.name (see select_pairs()).
+
+        The daily cross-correlations are also added to *archive*, if given
+        (see DailyCrossCorrelationArchive).
+
         Initializes self[station1][station2] as an instance of CrossCorrelation
         if the pair station1-station2 is not in self
 
         @type tracedict: dict from str to L{obspy.core.trace.Trace}
         @type stations: list of L{pysismo.psstation.Station}
         @type xcorr_tmax: float
+        @type pairs: set of (str, str)
+        @type archive: L{DailyCrossCorrelationArchive}
         @type verbose: bool
         """
         if not xcorrdict:
@@ -1666,6 +2361,10 @@ class CrossCorrelationCollection(AttribDict):
 
         stationtrace_pairs = it.combinations(sorted(tracedict.items()), 2)
         for (s1name, tr1), (s2name, tr2) in stationtrace_pairs:
+            if pairs is not None and (s1name, s2name) not in pairs:
+                # pair not selected
+                continue
+
             if verbose:
                 print("{s1}-{s2}".format(s1=s1name, s2=s2name),)
 
@@ -1676,32 +2375,217 @@ class CrossCorrelationCollection(AttribDict):
             station1 = next(s for s in stations if s.name == s1name)
             station2 = next(s for s in stations if s.name == s2name)
 
-            # initializing self[s1] if s1 not in self
-            # (avoiding setdefault() since behavior in unknown with AttribDict)
-            if s1name not in self:
-                self[s1name] = AttribDict()
-
-            # initializing self[s1][s2] if s2 not in self[s1]
-            if s2name not in self[s1name]:
-                self[s1name][s2name] = CrossCorrelation(
-                    station1=station1,
-                    station2=station2,
-                    xcorr_dt=1.0 / tr1.stats.sampling_rate,
-                    xcorr_tmax=xcorr_tmax)
+            # initializing self[s1][s2] if needed
+            pairxc = self._get_or_init_xcorr(station1, station2,
+                                             xcorr_dt=1.0 / tr1.stats.sampling_rate,
+                                             xcorr_tmax=xcorr_tmax)
 
             # stacking cross-correlation
             try:
                 # getting pre-calculated cross-corr, if provided
                 xcorr = xcorrdict.get((s1name, s2name), None)
-                self[s1name][s2name].add(tr1, tr2, xcorr=xcorr)
+                xcorr = pairxc.add(tr1, tr2, xcorr=xcorr)
             except pserrors.NaNError:
                 # got NaN
                 s = "Warning: got NaN in cross-corr between {s1}-{s2} -> skipping"
                 print(s.format(s1=s1name, s2=s2name))
+                continue
+
+            if archive:
+                # archiving daily cross-correlation
+                archive.add(s1name, s2name, day=(tr1.stats.starttime + ONESEC).date,
+                            xcorr=xcorr)
+
+        if verbose:
+            print()
+
+    def _get_or_init_xcorr(self, station1, station2, xcorr_dt, xcorr_tmax):
+        """
+        Returns self[station1.name][station2.name], initialized as an
+        instance of CrossCorrelation if the pair is not in self, whose
+        max lag is *xcorr_tmax* adapted to the distance between the
+        stations (see pair_tmax())
+
+        As days are meant to be stacked in the returned cross-correlation,
+        the version of the collection is bumped (see _bump_version()).
+
+        @type station1: L{pysismo.psstation.Station}
+        @type station2: L{pysismo.psstation.Station}
+        @type xcorr_dt: float
+        @type xcorr_tmax: float
+        @rtype: L{CrossCorrelation}
+        """
+        self._bump_version()
+
+        # initializing self[s1] if s1 not in self
+        # (avoiding setdefault() since behavior in unknown with AttribDict)
+        if station1.name not in self:
+            self[station1.name] = AttribDict()
+
+        # initializing self[s1][s2] if s2 not in self[s1]
+        if station2.name not in self[station1.name]:
+            self[station1.name][station2.name] = CrossCorrelation(
+                station1=station1,
+                station2=station2,
+                xcorr_dt=xcorr_dt,
+                xcorr_tmax=pair_tmax(station1.dist(station2), tmax=xcorr_tmax))
+
+        return self[station1.name][station2.name]
+
+    def xcorr_nmax(self, station1, station2, xcorr_dt, xcorr_tmax):
+        """
+        Returns the max lag (in samples) of the cross-correlation of
+        the pair station1-station2: that of self[station1.name][station2.name]
+        if the pair is in self, else *xcorr_tmax* adapted to the distance
+        between the stations (see pair_tmax()), so that the cross-
+        correlations of the pair can be calculated up to that lag only
+
+        @type station1: L{pysismo.psstation.Station}
+        @type station2: L{pysismo.psstation.Station}
+        @type xcorr_dt: float
+        @type xcorr_tmax: float
+        @rtype: int
+        """
+        if station1.name in self and station2.name in self[station1.name]:
+            return self[station1.name][station2.name]._get_xcorr_nmax()
+        return int(pair_tmax(station1.dist(station2), tmax=xcorr_tmax) / xcorr_dt)
+
+    def check_time_arrays(self, xcorr_dt, xcorr_tmax):
+        """
+        Raises an Exception if the time array of a pair differs from that
+        of a new cross-correlation of the pair with sampling step *xcorr_dt*
+        and max lag *xcorr_tmax* (adapted to the distance between the
+        stations, see pair_tmax()), i.e., if new stacks could not be
+        merged with the pair (see merge()).
+
+        @type xcorr_dt: float
+        @type xcorr_tmax: float
+        """
+        for s1, s2 in self.pairs(sort=True, minday=0):
+            pairxc = self[s1][s2]
+            nmax = int(pair_tmax(pairxc.dist(), tmax=xcorr_tmax) / xcorr_dt)
+            if abs(pairxc._get_xcorr_dt() - xcorr_dt) > EPS or \
+                    len(pairxc.timearray) != 2 * nmax + 1:
+                s = ("Time array of cross-correlation {} differs from that of new "
+                     "cross-correlations (sampling step {} s, max lag {} s): check "
+                     "PERIOD_RESAMPLE, CROSSCORR_TMAX and CROSSCORR_TMAX_FLOOR")
+                raise Exception(s.format(repr(pairxc), xcorr_dt, nmax * xcorr_dt))
+
+    def has_processed_days(self):
+        """
+        Does the collection keep a record of processed days?
+        (see processed_days())
+        @rtype: bool
+        """
+        return '_processed_days' in self.__dict__
+
+    def processed_days(self):
+        """
+        Returns the days at which the data of each station have been
+        processed and stacked, as a dict {station name: set of days}.
+        This record allows to update the collection with new data only
+        (see script crosscorrelation.py): the days of a station whose
+        data could not be cross-correlated (e.g., rejected trace) are
+        not recorded, so that they are processed again.
+
+        For a collection calculated before this record was kept,
+        the days between the first and last days of the pairs of
+        each station are returned.
+
+        @rtype: dict from str to set of L{datetime.date}
+        """
+        if '_processed_days' in self.__dict__:
+            return self.__dict__['_processed_days']
+
+        # approximate record from the first and last days of the pairs
+        processed_days = {}
+        for s1name, s2name in self.pairs():
+            xc = self[s1name][s2name]
+            ndays = (xc.endday - xc.startday).days + 1
+            days = set(xc.startday + dt.timedelta(days=i) for i in range(ndays))
+            for name in (s1name, s2name):
+                processed_days.setdefault(name, set()).update(days)
+        return processed_days
+
+    def add_processed_days(self, stationnames, days):
+        """
+        Records that the data of the stations *stationnames*
+        have been processed at *days*
+
+        @type stationnames: list of str
+        @type days: list of L{datetime.date}
+        """
+        processed_days = self.processed_days()
+        for name in stationnames:
+            processed_days.setdefault(name, set()).update(days)
+        # (avoiding setattr(), which would turn the dict into an AttribDict)
+        self.__dict__['_processed_days'] = processed_days
+
+    def merge(self, other, check_periods=True, verbose=False):
+        """
+        Merges (in-place) another collection of cross-correlations,
+        typically a partial collection calculated by a run sharded
+        by date range or by subset of pairs: cross-correlations of pairs
+        appearing in both collections are merged (see CrossCorrelation.merge()),
+        the others are copied into self. The records of processed days
+        are united.
+
+        Note that a pair appearing in both collections must not have
+        been cross-correlated over the same days in both of them:
+        unless *check_periods* = False, an exception is raised if
+        the periods of such a pair overlap.
+
+        @type other: L{CrossCorrelationCollection}
+        @type check_periods: bool
+        @type verbose: bool
+        """
+        if self.has_processed_days() or other.has_processed_days():
+            for name, days in other.processed_days().items():
+                self.add_processed_days([name], days)
+
+        for s1name, s2name in other.pairs(minday=0):
+            if verbose:
+                print("{s1}-{s2}".format(s1=s1name, s2=s2name),)
+
+            # initializing self[s1] if s1 not in self
+            if s1name not in self:
+                self[s1name] = AttribDict()
+
+            if s2name not in self[s1name]:
+                # new pair: copying cross-correlation
+                self[s1name][s2name] = copy.deepcopy(other[s1name][s2name])
+            else:
+                # pair already in self: merging cross-correlations
+                self[s1name][s2name].merge(other[s1name][s2name],
+                                           check_periods=check_periods)
+        self._bump_version()
 
         if verbose:
             print()
 
+    def extract_months(self, months):
+        """
+        Returns a new collection containing only the stacks of
+        the given months (see CrossCorrelation.extract_months()),
+        and the processed days of these months. Pairs without
+        data in these months are skipped.
+
+        @type months: list of (L{MonthYear} or (int, int))
+        @rtype: L{CrossCorrelationCollection}
+        """
+        xcout = CrossCorrelationCollection()
+        if self.has_processed_days():
+            for name, days in self.processed_days().items():
+                xcout.add_processed_days([name], [d for d in days if MonthYear(d) in months])
+        for s1name, s2name in self.pairs(minday=0):
+            monthsxc = self[s1name][s2name].extract_months(months)
+            if not monthsxc:
+                continue
+            if s1name not in xcout:
+                xcout[s1name] = AttribDict()
+            xcout[s1name][s2name] = monthsxc
+        return xcout
+
     def plot(self, plot_type='distance', xlim=None, norm=True, whiten=False,
              sym=False, minSNR=None, minday=1, withnets=None, onlywithnets=None,
              figsize=(21.0, 12.0), outfile=None, dpi=300, showplot=True):
@@ -1991,15 +2875,26 @@ class CrossCorrelationCollection(AttribDict):
         plt.ylim(bbox[2:])
         plt.show()
 
-    def export(self, outprefix, stations=None, verbose=False):
+    def export(self, outprefix, stations=None, store=CROSSCORR_STORE,
+               columnar=CROSSCORR_COLUMNAR, verbose=False):
         """
-        Exports cross-correlations to picke file and txt file
+        Exports cross-correlations to picke file (or to a chunked store
+        if *store* is True, see CrossCorrelationStore) and txt file (or
+        to a binary columnar file if *columnar* is True, see _to_columns())
 
         @type outprefix: str or unicode
         @type stations: list of L{Station}
+        @type store: bool
+        @type columnar: bool
         """
-        self._to_picklefile(outprefix, verbose=verbose)
-        self._to_ascii(outprefix, verbose=verbose)
+        if store:
+            self._to_xcstore(outprefix, verbose=verbose)
+        else:
+            self._to_picklefile(outprefix, verbose=verbose)
+        if columnar:
+            self._to_columns(outprefix, verbose=verbose)
+        else:
+            self._to_ascii(outprefix, verbose=verbose)
         self._pairsinfo_to_ascii(outprefix, verbose=verbose)
         self._stationsinfo_to_ascii(outprefix, stations=stations, verbose=verbose)
 
@@ -2009,14 +2904,16 @@ class CrossCorrelationCollection(AttribDict):
               vmin=SIGNAL_WINDOW_VMIN, vmax=SIGNAL_WINDOW_VMAX,
               signal2noise_trail=SIGNAL2NOISE_TRAIL,
               noise_window_size=NOISE_WINDOW_SIZE,
-              **kwargs):
+              curveset=FTAN_CURVESET, **kwargs):
         """
         Exports raw-clean FTAN plots to pdf (one page per pair)
         and clean dispersion curves to pickle file by calling
         plot_FTAN() for each cross-correlation.
 
         pdf is exported to *prefix*[_*suffix*].pdf
-        dispersion curves are exported to *prefix*[_*suffix*].pickle
+        dispersion curves are exported to *prefix*[_*suffix*].pickle,
+        or to dir *prefix*[_*suffix*].dcset if *curveset* is True
+        (see pstomo.DispersionCurveSet)
 
         If *prefix* is not given, then it is automatically set up as:
         *FTAN_DIR*/FTAN[_whitenedxc][_mindist=...][_minsSNR=...]
@@ -2047,6 +2944,7 @@ class CrossCorrelationCollection(AttribDict):
         @type minspectSNR: float
         @type whiten: bool
         @type monthyears: list of (int, int)
+        @type curveset: bool
         """
         # setting default prefix if not given
         if not prefix:
@@ -2092,8 +2990,9 @@ class CrossCorrelationCollection(AttribDict):
             pairs = sorted(SNRarraydict.keys())
 
         s = ("Exporting FTANs of {0} pairs to file {1}.pdf\n"
-             "and dispersion curves to file {1}.pickle\n")
-        print(s.format(len(pairs), outputpath))
+             "and dispersion curves to {2} {1}.{3}\n")
+        print(s.format(len(pairs), outputpath, *(('dir', 'dcset') if curveset
+                                                  else ('file', 'pickle'))))
 
         cleanvgcurves = []
 #        cleanvpcurves = []
@@ -2133,15 +3032,26 @@ class CrossCorrelationCollection(AttribDict):
                 # something went wrong with this FTAN
                 print("\nGot unexpected error:\n\n{}\n\nSKIPPING PAIR!".format(err))
 
+            finally:
+                # freeing the views and indexes cached during the FTAN of
+                # the pair, so that memory does not grow with the nb of pairs
+                xc._release_caches()
+
         print("\nSaving files...")
 
         # closing pdf
         pdf.close()
 
-        # exporting vg curves to pickle file
-        f = psutils.openandbackup(outputpath + '.pickle', mode='wb')
-        pickle.dump(cleanvgcurves, f, protocol=2)
-        f.close()
+        if curveset and cleanvgcurves:
+            # exporting vg curves to array-backed set (an empty
+            # list of curves, without periods, is pickled)
+            curves = pstomo.DispersionCurveSet.from_curves(cleanvgcurves)
+            curves.save(outputpath + '.dcset')
+        else:
+            # exporting vg curves to pickle file
+            f = psutils.openandbackup(outputpath + '.pickle', mode='wb')
+            pickle.dump(cleanvgcurves, f, protocol=2)
+            f.close()
 
     def stations(self, pairs, sort=True):
         """
@@ -2151,12 +3061,17 @@ class CrossCorrelationCollection(AttribDict):
         @type pairs: list of (str, str)
         @rtype: list of L{pysismo.psstation.Station}
         """
-        stations = []
-        for s1, s2 in pairs:
-            if self[s1][s2].station1 not in stations:
-                stations.append(self[s1][s2].station1)
-            if self[s1][s2].station2 not in stations:
-                stations.append(self[s1][s2].station2)
+        table = self._get_pairtable()
+        rows = self.__dict__['_pairtable']['rows']
+        allstations = self._get_pairtable_stations()
+
+        # unique station indices, in order of appearance
+        indices = OrderedDict()
+        for pair in pairs:
+            row = table[rows[tuple(pair)]]
+            indices[row['i1']] = None
+            indices[row['i2']] = None
+        stations = [allstations[i] for i in indices]
 
         if sort:
             stations.sort(key=lambda obj: obj.name)
@@ -2176,6 +3091,20 @@ class CrossCorrelationCollection(AttribDict):
         f = psutils.openandbackup(outprefix + '.pickle', mode='wb')
         pickle.dump(self, f, protocol=2)
         f.close()
+        _remove_SNRs_file(outprefix + '.pickle')
+
+    def _to_xcstore(self, outprefix, verbose=False):
+        """
+        Writes cross-correlations to a chunked store
+        (see CrossCorrelationStore)
+
+        @type outprefix: str or unicode
+        """
+        if verbose:
+            s = "Exporting cross-correlations in binary format to store: {}.xcstore"
+            print(s.format(outprefix))
+
+        CrossCorrelationStore.write(self, outprefix + '.xcstore')
 
     def _to_ascii(self, outprefix, verbose=False):
         """
@@ -2196,13 +3125,81 @@ class CrossCorrelationCollection(AttribDict):
         header = ['time'] + ["{0}-{1}".format(s1, s2) for s1, s2 in pairs]
         f.write('\t'.join(header) + '\n')
 
-        # writing line = ith [time, cross-corr 1st pair, cross-corr 2nd pair etc]
-        data = zip(self._get_timearray(), *[self[s1][s2].dataarray for s1, s2 in pairs])
-        for fields in data:
-            line = [str(fld) for fld in fields]
-            f.write('\t'.join(line) + '\n')
+        # writing lines = [time, cross-corr 1st pair, cross-corr 2nd pair etc]
+        # by blocks of lines formatted at once, padding with NaN the
+        # cross-corrs of smaller max lag (see pair_tmax())
+        timearray, columns = self._get_columns(pairs)
+        nline = max(1, ASCII_BLOCK_SIZE // (len(pairs) + 1))
+        linefmt = '\t'.join(['%r'] * (len(pairs) + 1)) + '\n'
+        for j0 in range(0, len(timearray), nline):
+            j1 = min(j0 + nline, len(timearray))
+            block = np.nan * np.zeros((j1 - j0, len(pairs) + 1))
+            block[:, 0] = timearray[j0:j1]
+            for k, (i0, dataarray) in enumerate(columns):
+                # part of cross-corr within block
+                a0, a1 = max(j0, i0), min(j1, i0 + len(dataarray))
+                if a0 < a1:
+                    block[a0 - j0:a1 - j0, k + 1] = dataarray[a0 - i0:a1 - i0]
+            f.write((linefmt * len(block)) % tuple(block.ravel().tolist()))
         f.close()
 
+    def _to_columns(self, outprefix, verbose=False):
+        """
+        Exports cross-correlations to a binary columnar file,
+        *outprefix*.columns.npy, containing an array (in Fortran
+        order) whose 1st column is the time array and the next
+        ones the cross-correlations of the pairs (padded with NaN
+        if smaller max lag, see pair_tmax()), the names of the
+        columns being given in *outprefix*.columns.json.
+
+        The array is written pair by pair, without being built
+        in memory, and can be read with np.load(mmap_mode='r').
+
+        @type outprefix: str or unicode
+        """
+        if verbose:
+            s = "Exporting cross-correlations in columnar format to file: {}.columns.npy"
+            print(s.format(outprefix))
+
+        pairs = [(s1, s2) for (s1, s2) in self.pairs(sort=True) if self[s1][s2].nday]
+        header = ['time'] + ["{0}-{1}".format(s1, s2) for s1, s2 in pairs]
+        f = psutils.openandbackup(outprefix + '.columns.json', mode='w')
+        json.dump(header, f)
+        f.close()
+
+        timearray, columns = self._get_columns(pairs)
+        path = outprefix + '.columns.npy'
+        if os.path.exists(path):
+            # backup
+            shutil.copyfile(path, path + '~')
+        array = np.lib.format.open_memmap(path, mode='w+', dtype='float64',
+                                          shape=(len(timearray), len(pairs) + 1),
+                                          fortran_order=True)
+        array[:, 0] = timearray
+        for k, (i0, dataarray) in enumerate(columns):
+            column = array[:, k + 1]
+            column[:] = np.nan
+            column[i0:i0 + len(dataarray)] = dataarray
+        array.flush()
+        del array
+
+    def _get_columns(self, pairs):
+        """
+        Returns the time array of the collection (see _get_timearray()),
+        and the index of the first time of each pair in it along with
+        its cross-correlation, as a list of (int, L{numpy.ndarray})
+
+        @type pairs: list of (str, str)
+        @rtype: L{numpy.ndarray}, list of (int, L{numpy.ndarray})
+        """
+        timearray = self._get_timearray()
+        columns = []
+        for s1, s2 in pairs:
+            xc = self[s1][s2]
+            i0 = np.abs(timearray - xc.timearray[0]).argmin()
+            columns.append((i0, xc.dataarray))
+        return timearray, columns
+
     def _pairsinfo_to_ascii(self, outprefix, verbose=False):
         """
         Exports pairs information to txt file
@@ -2215,11 +3212,13 @@ class CrossCorrelationCollection(AttribDict):
 
         # writing file: coord, locations, ids etc. for each pair
         pairs = self.pairs(sort=True)
+        table = self._get_pairtable()
+        rows = self.__dict__['_pairtable']['rows']
         f = psutils.openandbackup(outprefix + '.stats.txt', mode='w')
         # header
         header = ['pair', 'lon1', 'lat1', 'lon2', 'lat2',
                   'locs1', 'locs2', 'ids1', 'ids2',
-                  'distance', 'startday', 'endday', 'nday']
+                  'distance', 'startday', 'endday', 'nday', 'convergence_snr']
         f.write('\t'.join(header) + '\n')
 
         # fields
@@ -2234,10 +3233,11 @@ class CrossCorrelationCollection(AttribDict):
                 ','.join(sorted("'{}'".format(l) for l in self[s1][s2].locs2)),
                 ','.join(sorted(sid for sid in self[s1][s2].ids1)),
                 ','.join(sorted(sid for sid in self[s1][s2].ids2)),
-                self[s1][s2].dist(),
+                table['dist'][rows[(s1, s2)]],
                 self[s1][s2].startday,
                 self[s1][s2].endday,
-                self[s1][s2].nday
+                self[s1][s2].nday,
+                self[s1][s2].convergence_snr()
             ]
             line = [str(fld) if (fld or fld == 0) else 'none' for fld in fields]
             f.write('\t'.join(line) + '\n')
@@ -2267,19 +3267,30 @@ class CrossCorrelationCollection(AttribDict):
         header = ['name', 'network', 'lon', 'lat', 'npair', 'nday']
         f.write('\t'.join(header) + '\n')
 
+        # nb of pairs and total nb of days of pairs of each station
+        # (pairs with at least one day, see pairs())
+        table = self._get_pairtable()
+        table = table[table['nday'] >= 1]
+        allstations = self._get_pairtable_stations()
+        nstation = len(allstations)
+        npairs = (np.bincount(table['i1'], minlength=nstation) +
+                  np.bincount(table['i2'], minlength=nstation))
+        ndays = (np.bincount(table['i1'], weights=table['nday'], minlength=nstation) +
+                 np.bincount(table['i2'], weights=table['nday'], minlength=nstation))
+        stationindex = {tuple(getattr(s, att) for att in s.BOOLATTRS): i
+                        for i, s in enumerate(allstations)}
+
         for station in stations:
-            # pairs in which station appears
-            pairs = [(s1, s2) for s1, s2 in self.pairs()
-                     if station in [self[s1][s2].station1, self[s1][s2].station2]]
-            # total nb of days of pairs
-            nday = sum(self[s1][s2].nday for s1, s2 in pairs)
+            i = stationindex.get(tuple(getattr(station, att) for att in station.BOOLATTRS))
+            npair = npairs[i] if i is not None else 0
+            nday = int(ndays[i]) if i is not None else 0
             # writing fields
             fields = [
                 station.name,
                 station.network,
                 str(station.coord[0]),
                 str(station.coord[1]),
-                str(len(pairs)),
+                str(npair),
                 str(nday)
             ]
             f.write('\t'.join(fields) + '\n')
@@ -2288,7 +3299,10 @@ class CrossCorrelationCollection(AttribDict):
 
     def _get_timearray(self):
         """
-        Returns time array of cross-correlations
+        Returns time array of cross-correlations, i.e., the time
+        array of largest max lag, that of the other cross-correlations
+        (whose max lag may depend on the pair, see pair_tmax()) being
+        a part of it
 
         @rtype: L{numpy.ndarray}
         """
@@ -2296,23 +3310,1499 @@ class CrossCorrelationCollection(AttribDict):
         pairs = self.pairs()
 
         # reference time array
-        s1, s2 = pairs[0]
+        s1, s2 = max(pairs, key=lambda pair: len(self[pair[0]][pair[1]].timearray))
         reftimearray = self[s1][s2].timearray
 
-        # checking that all time arrays are equal to reference time array
+        # checking that all time arrays are part of reference time array
         for (s1, s2) in pairs:
-            if np.any(self[s1][s2].timearray != reftimearray):
+            timearray = self[s1][s2].timearray
+            i0 = np.abs(reftimearray - timearray[0]).argmin()
+            if i0 + len(timearray) > len(reftimearray) or \
+                    np.any(np.abs(reftimearray[i0:i0 + len(timearray)] - timearray) > EPS):
                 s = 'Cross-corr collection does not have a unique timelag array'
                 raise Exception(s)
 
         return reftimearray
 
 
-def get_merged_trace(station, date, skiplocs=CROSSCORR_SKIPLOCS, minfill=MINFILL):
+class MultiComponentCrossCorrelationCollection(AttribDict):
+    """
+    Collection of multi-component (tensor-valued) cross-correlations
+    = AttribDict{component pair: instance of CrossCorrelationCollection},
+    where a component pair, e.g. 'ZN', is made of the component of the
+    first station (Z) and that of the second station (N).
+
+    E.g., the cross-correlation between the vertical component of
+    STA01 and the north component of STA02 can be accessed both ways:
+    - self['ZN']['STA01']['STA02']
+    - self.ZN.STA01.STA02
+
+    All the component pairs of a pair of stations are stacked over
+    the same days, and the record of processed days is kept in the
+    collection of the first component pair.
+    """
+
+    def __init__(self, components):
+        """
+        Initializing one collection per pair of components
+
+        @type components: list of str
+        """
+        AttribDict.__init__(self)
+        for c1, c2 in it.product(components, repeat=2):
+            self[c1 + c2] = CrossCorrelationCollection()
+
+    def __repr__(self):
+        npair = len(self.pairs())
+        s = ('(AttribDict)<Collection of multi-component cross-correlation '
+             'between {0} pairs, components {1}>')
+        return s.format(npair, ''.join(self.components()))
+
+    def components(self):
+        """
+        Returns the components, e.g., ['Z', 'N', 'E']
+        @rtype: list of str
+        """
+        return list(OrderedDict.fromkeys(key[0] for key in self))
+
+    def pairs(self, **kwargs):
+        """
+        Returns pairs of stations verifying conditions
+        (see CrossCorrelationCollection.pairs())
+
+        @rtype: list of (str, str)
+        """
+        return self[self._firstkey()].pairs(**kwargs)
+
+    def xcorr_nmax(self, station1, station2, xcorr_dt, xcorr_tmax):
+        """
+        Returns the max lag (in samples) of the cross-correlations of
+        the pair station1-station2, shared by all the component pairs
+        (see CrossCorrelationCollection.xcorr_nmax())
+
+        @type station1: L{pysismo.psstation.Station}
+        @type station2: L{pysismo.psstation.Station}
+        @type xcorr_dt: float
+        @type xcorr_tmax: float
+        @rtype: int
+        """
+        return self[self._firstkey()].xcorr_nmax(station1, station2,
+                                                 xcorr_dt, xcorr_tmax)
+
+    def check_time_arrays(self, xcorr_dt, xcorr_tmax):
+        """
+        Raises an Exception if the time array of a pair (of any pair
+        of components) differs from that of new cross-correlations
+        (see CrossCorrelationCollection.check_time_arrays())
+
+        @type xcorr_dt: float
+        @type xcorr_tmax: float
+        """
+        for key in self:
+            self[key].check_time_arrays(xcorr_dt, xcorr_tmax)
+
+    def add(self, tracedict, stations, xcorr_tmax, xcorrdict=None, pairs=None,
+            archive=None, verbose=False):
+        """
+        Stacks cross-correlations between all the pairs of components
+        of pairs of stations, from a dict {station.name: {component: Trace}}
+        (in *tracedict*). Each trace is Fourier-transformed only once, and
+        the cross-correlations of all the pairs of components are obtained
+        from these shared spectra (see spectral_xcorrs()).
+
+        You can provide pre-calculated cross-correlations in *xcorrdict* =
+        dict {((station1.name, comp1), (station2.name, comp2)): numpy array
+        containing cross-corr}
+
+        You can restrict the pairs to cross-correlate to the set of pairs
+        of station names (station1.name, station2.name) given in *pairs*,
+        with station1.name < station2.name (see select_pairs()).
+
+        A pair of stations is skipped if any of the cross-correlations
+        between its components contains NaN, so that all the component
+        pairs are stacked over the same days.
+
+        The daily cross-correlations are also added to *archive*, if given
+        (see DailyCrossCorrelationArchive).
+
+        @type tracedict: dict from str to (dict from str to L{obspy.core.trace.Trace})
+        @type stations: list of L{pysismo.psstation.Station}
+        @type xcorr_tmax: float
+        @type pairs: set of (str, str)
+        @type archive: L{DailyCrossCorrelationArchive}
+        @type verbose: bool
+        """
+        components = self.components()
+        stationdict = {s.name: s for s in stations}
+
+        # pairs of stations to cross-correlate
+        stationpairs = [(s1name, s2name) for s1name, s2name
+                        in it.combinations(sorted(tracedict), 2)
+                        if pairs is None or (s1name, s2name) in pairs]
+        if not stationpairs:
+            return
+
+        # cross-correlations between all the pairs of components,
+        # from the shared spectra of the traces
+        traces = {(sname, c): tracedict[sname][c] for sname in tracedict
+                  for c in components}
+        keypairs = [((s1name, c1), (s2name, c2)) for s1name, s2name in stationpairs
+                    for c1, c2 in it.product(components, repeat=2)]
+        sampling_rate = next(iter(traces.values())).stats.sampling_rate
+        pairnmax = {(s1name, s2name): self.xcorr_nmax(stationdict[s1name],
+                                                      stationdict[s2name],
+                                                      xcorr_dt=1.0 / sampling_rate,
+                                                      xcorr_tmax=xcorr_tmax)
+                    for s1name, s2name in stationpairs}
+        nmax = {keypair: pairnmax[(keypair[0][0], keypair[1][0])]
+                for keypair in keypairs}
+        if not xcorrdict:
+            xcorrdict = {}
+        xcorrs = spectral_xcorrs(traces, [keypair for keypair in keypairs
+                                          if keypair not in xcorrdict], nmax)
+        xcorrs.update(xcorrdict)
+
+        for s1name, s2name in stationpairs:
+            if verbose:
+                print("{s1}-{s2}".format(s1=s1name, s2=s2name),)
+
+            pairxcorrs = {c1 + c2: xcorrs[((s1name, c1), (s2name, c2))]
+                          for c1, c2 in it.product(components, repeat=2)}
+            if any(np.any(np.isnan(xcorr)) for xcorr in pairxcorrs.values()):
+                # got NaN
+                s = "Warning: got NaN in cross-corr between {s1}-{s2} -> skipping"
+                print(s.format(s1=s1name, s2=s2name))
+                continue
+
+            # stacking cross-correlations of all the pairs of components
+            for key, xcorr in pairxcorrs.items():
+                tr1 = tracedict[s1name][key[0]]
+                tr2 = tracedict[s2name][key[1]]
+                pairxc = self[key]._get_or_init_xcorr(stationdict[s1name],
+                                                      stationdict[s2name],
+                                                      xcorr_dt=1.0 / sampling_rate,
+                                                      xcorr_tmax=xcorr_tmax)
+                xcorr = pairxc.add(tr1, tr2, xcorr=xcorr)
+                if archive:
+                    # archiving daily cross-correlation
+                    archive.add(s1name, s2name, day=(tr1.stats.starttime + ONESEC).date,
+                                xcorr=xcorr, components=key)
+
+        if verbose:
+            print()
+
+    def has_processed_days(self):
+        """
+        Does the collection keep a record of processed days?
+        @rtype: bool
+        """
+        return self[self._firstkey()].has_processed_days()
+
+    def processed_days(self):
+        """
+        Returns the days at which the data of each station have been
+        processed (see CrossCorrelationCollection.processed_days())
+
+        @rtype: dict from str to set of L{datetime.date}
+        """
+        return self[self._firstkey()].processed_days()
+
+    def add_processed_days(self, stationnames, days):
+        """
+        Records that the data of the stations *stationnames*
+        have been processed at *days*
+
+        @type stationnames: list of str
+        @type days: list of L{datetime.date}
+        """
+        self[self._firstkey()].add_processed_days(stationnames, days)
+
+    def merge(self, other, check_periods=True, verbose=False):
+        """
+        Merges (in-place) another collection of multi-component
+        cross-correlations, with the same components, pair of
+        components by pair of components (see
+        CrossCorrelationCollection.merge())
+
+        @type other: L{MultiComponentCrossCorrelationCollection}
+        @type check_periods: bool
+        @type verbose: bool
+        """
+        if not isinstance(other, MultiComponentCrossCorrelationCollection) or \
+                list(other) != list(self):
+            raise Exception("Cannot merge cross-correlations of different components")
+
+        for key in self:
+            self[key].merge(other[key], check_periods=check_periods,
+                            verbose=verbose and key == self._firstkey())
+
+    def extract_months(self, months):
+        """
+        Returns a new collection containing only the stacks of
+        the given months (see CrossCorrelationCollection.extract_months())
+
+        @type months: list of (L{MonthYear} or (int, int))
+        @rtype: L{MultiComponentCrossCorrelationCollection}
+        """
+        xcout = MultiComponentCrossCorrelationCollection(self.components())
+        for key in self:
+            xcout[key] = self[key].extract_months(months)
+        return xcout
+
+    def rotated(self, verbose=False):
+        """
+        Returns a new collection whose horizontal components are rotated
+        to the radial (R) and transverse (T) directions of each pair of
+        stations: R is along the great circle from the first to the second
+        station (i.e., the azimuth at the first station and the back-azimuth
+        + 180 deg at the second station), and T is 90 deg clockwise from R.
+
+        The rotation is applied to the stacks and month stacks, using
+        the azimuths of the horizontal components of the stations
+        (see psstation.get_stations()). Pairs whose stations lack
+        the azimuths of their horizontal components are skipped.
+
+        Returns self if the components do not comprise exactly
+        two horizontal components.
+
+        @rtype: L{MultiComponentCrossCorrelationCollection}
+        """
+        components = self.components()
+        horizontals = [c for c in components if c != 'Z']
+        if len(horizontals) != 2:
+            return self
+
+        # rotated components, e.g., Z12 -> ZRT
+        rotcomponents = [c if c == 'Z' else 'RT'[horizontals.index(c)]
+                         for c in components]
+        xcout = MultiComponentCrossCorrelationCollection(rotcomponents)
+        if self.has_processed_days():
+            for name, days in self.processed_days().items():
+                xcout.add_processed_days([name], days)
+
+        for s1name, s2name in self.pairs(minday=0):
+            pairxcs = {key: self[key][s1name][s2name] for key in self}
+            firstxc = pairxcs[self._firstkey()]
+            if any([m.month for m in xc.monthxcs] != [m.month for m in firstxc.monthxcs]
+                   for xc in pairxcs.values()):
+                s = "Components of {}-{} were not stacked over the same months"
+                raise Exception(s.format(s1name, s2name))
+
+            # rotation matrices of the stations
+            az = psstation.registry.azimuth(firstxc.station1, firstxc.station2)
+            baz = psstation.registry.azimuth(firstxc.station2, firstxc.station1)
+            rot1 = _rotation_matrix(firstxc.station1, components, backazimuth=az + 180.0)
+            rot2 = _rotation_matrix(firstxc.station2, components, backazimuth=baz)
+            if rot1 is None or rot2 is None:
+                if verbose:
+                    s = "Warning: no azimuth of horizontal components for {}-{} -> skipping"
+                    print(s.format(s1name, s2name))
+                continue
+
+            # tensor of stacks (and month stacks) = array[c1, c2, time]
+            # rotated as: rotdata[a, b] = sum_{i,j} rot1[a, i] * rot2[b, j] * data[i, j]
+            def rotate(dataarrays):
+                data = np.array([[dataarrays[c1 + c2] for c2 in components]
+                                 for c1 in components])
+                return np.einsum('ai,bj,ijt->abt', rot1, rot2, data)
+
+            rotdata = rotate({key: xc.dataarray for key, xc in pairxcs.items()})
+            rotmonthdata = [rotate({key: xc.monthxcs[i].dataarray
+                                    for key, xc in pairxcs.items()})
+                            for i in range(len(firstxc.monthxcs))]
+
+            for (a, c1), (b, c2) in it.product(enumerate(rotcomponents), repeat=2):
+                rotxc = firstxc.copy()
+                rotxc.dataarray = rotdata[a, b]
+                for monthxc, monthdata in zip(rotxc.monthxcs, rotmonthdata):
+                    monthxc.dataarray = monthdata[a, b]
+                # the squared daily cross-corrs cannot be rotated
+                for obj in [rotxc] + rotxc.monthxcs:
+                    obj.sqdataarray = None
+                # locations and ids of the components contributing to c1, c2
+                keys = [k1 + k2 for k1 in (horizontals if c1 != 'Z' else 'Z')
+                        for k2 in (horizontals if c2 != 'Z' else 'Z')]
+                rotxc.locs1 = set.union(*[pairxcs[key].locs1 for key in keys])
+                rotxc.locs2 = set.union(*[pairxcs[key].locs2 for key in keys])
+                rotxc.ids1 = set.union(*[pairxcs[key].ids1 for key in keys])
+                rotxc.ids2 = set.union(*[pairxcs[key].ids2 for key in keys])
+                if s1name not in xcout[c1 + c2]:
+                    xcout[c1 + c2][s1name] = AttribDict()
+                xcout[c1 + c2][s1name][s2name] = rotxc
+
+        return xcout
+
+    def export(self, outprefix, stations=None, store=CROSSCORR_STORE,
+               columnar=CROSSCORR_COLUMNAR, verbose=False):
+        """
+        Exports the whole collection to pickle file (or to a chunked
+        store if *store* is True, see CrossCorrelationStore), which
+        allows to merge or update it, and the cross-correlations of
+        each pair of components, after rotation to the radial and
+        transverse directions (see rotated()), to the files of
+        CrossCorrelationCollection.export() suffixed by the
+        pair of components, e.g., *outprefix*_TT.pickle
+
+        @type outprefix: str or unicode
+        @type stations: list of L{Station}
+        @type store: bool
+        @type columnar: bool
+        """
+        if store:
+            if verbose:
+                s = "Exporting cross-correlations in binary format to store: {}.xcstore"
+                print(s.format(outprefix))
+            CrossCorrelationStore.write(self, outprefix + '.xcstore')
+        else:
+            if verbose:
+                s = "Exporting cross-correlations in binary format to file: {}.pickle"
+                print(s.format(outprefix))
+            f = psutils.openandbackup(outprefix + '.pickle', mode='wb')
+            pickle.dump(self, f, protocol=2)
+            f.close()
+            _remove_SNRs_file(outprefix + '.pickle')
+
+        rotxc = self.rotated(verbose=verbose)
+        for key in rotxc:
+            rotxc[key].export(outprefix=u'{}_{}'.format(outprefix, key),
+                              stations=stations, store=store, columnar=columnar,
+                              verbose=verbose)
+
+    def _firstkey(self):
+        """
+        Returns the first pair of components, e.g., 'ZZ'
+        @rtype: str
+        """
+        return next(iter(self))
+
+
+class CrossCorrelationJournal:
+    """
+    Append-only journal of partial cross-correlations, allowing
+    to resume an interrupted cross-correlation run. It consists of:
+
+    - *prefix*.journal.pickle: partial collections of cross-correlations
+      (typically, the stacks of one processed month) dumped one after
+      another with module pickle;
+
+    - *prefix*.manifest.json: the days already processed and the size
+      of the valid part of the journal. This file is atomically replaced
+      after each append, so that a crash while writing the journal leaves
+      the previous state intact.
+
+    The collection of cross-correlations is rebuilt by merging all
+    the partial collections of the journal.
+    """
+
+    def __init__(self, prefix):
+        """
+        @type prefix: str or unicode
+        """
+        self.journalpath = u'{}.journal.pickle'.format(prefix)
+        self.manifestpath = u'{}.manifest.json'.format(prefix)
+
+    def __repr__(self):
+        return '<Cross-correlation journal {}>'.format(self.journalpath)
+
+    def exists(self):
+        """
+        Is there a manifest of processed days?
+        @rtype: bool
+        """
+        return os.path.exists(self.manifestpath)
+
+    def completed_days(self):
+        """
+        Returns the set of days already processed
+
+        @rtype: set of L{datetime.date}
+        """
+        manifest = self._read_manifest()
+        return set(dt.datetime.strptime(day, '%Y-%m-%d').date()
+                   for day in manifest['days'])
+
+    def append(self, partialxc, days):
+        """
+        Appends a partial collection of cross-correlations to the
+        journal, and records the corresponding processed days in
+        the manifest.
+
+        @type partialxc: L{CrossCorrelationCollection} or
+                         L{MultiComponentCrossCorrelationCollection}
+        @type days: list of L{datetime.date}
+        """
+        manifest = self._read_manifest() if self.exists() else {'size': 0, 'days': []}
+
+        # appending partial collection after the valid part of the journal
+        # (discarding anything written after it, e.g., before a crash)
+        mode = 'r+b' if os.path.exists(self.journalpath) else 'wb'
+        with open(self.journalpath, mode) as f:
+            f.truncate(manifest['size'])
+            f.seek(manifest['size'])
+            pickle.dump(partialxc, f, protocol=2)
+            f.flush()
+            os.fsync(f.fileno())
+            size = f.tell()
+
+        # atomically replacing the manifest
+        manifest['size'] = size
+        manifest['days'].extend(day.isoformat() for day in sorted(days))
+        tmppath = self.manifestpath + '.tmp'
+        with open(tmppath, 'w') as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmppath, self.manifestpath)
+
+    def replay(self, verbose=False):
+        """
+        Rebuilds the collection of cross-correlations by merging the
+        partial collections of the valid part of the journal. Returns
+        None if the journal is empty.
+
+        @rtype: L{CrossCorrelationCollection} or
+                L{MultiComponentCrossCorrelationCollection}
+        """
+        size = self._read_manifest()['size']
+        if not size:
+            return None
+
+        if verbose:
+            s = "Rebuilding cross-correlations from journal: {}"
+            print(s.format(self.journalpath))
+
+        xc = None
+        with open(self.journalpath, 'rb') as f:
+            while f.tell() < size:
+                partialxc = pickle.load(f)
+                if xc is None:
+                    xc = partialxc
+                else:
+                    xc.merge(partialxc)
+        return xc
+
+    def remove(self):
+        """
+        Removes the journal and its manifest
+        """
+        for path in [self.journalpath, self.manifestpath]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _read_manifest(self):
+        """
+        @rtype: dict
+        """
+        with open(self.manifestpath) as f:
+            return json.load(f)
+
+
+class DailyCrossCorrelationArchive:
+    """
+    Archive of the daily cross-correlations of each pair of stations,
+    allowing to stack them over any selection of days (weekly stacks,
+    sliding windows, stacks excluding bad days etc.) without reprocessing
+    the waveforms. The archive is a directory containing:
+
+    - archive.json: data type, sampling step and max time of the
+      cross-correlations;
+
+    - stations.pickle: the stations of the pairs (dict {name: station});
+
+    - pairs.json: the index of the pairs of the archive, as a list of
+      [station1, station2, pair of components (or null)];
+
+    - one subdir per month (yyyy-mm), containing one compressed file per
+      pair of stations, <station1>-<station2>[_<pair of components>].npz
+      (see _pair_stem()), with arrays *days* (datetime64[D]), *scales*
+      and *data* (nb of days x nb of times, in the data type of the
+      archive) such that the daily cross-correlations are data[i] * scales[i].
+
+    While cross-correlations are calculated, the daily cross-correlations
+    are appended to uncompressed staging files (one per pair and month),
+    which are compressed into the archive at the end of each month
+    (see compress_staging()).
+
+    E.g., to stack the cross-correlations of a pair over weekly windows:
+
+    >>> archive = DailyCrossCorrelationArchive('xcorr_2000-2012_xmlresponse.daily')
+    >>> days = archive.days('STA01', 'STA02')
+    >>> weekstack, weekdays = archive.stack('STA01', 'STA02', firstday=days[0],
+    ...                                     lastday=days[0] + dt.timedelta(days=6))
+    """
+
+    def __init__(self, path, dtype=None, xcorr_dt=PERIOD_RESAMPLE,
+                 xcorr_tmax=CROSSCORR_TMAX):
+        """
+        Opens the archive in dir *path*, or initializes a new
+        archive if *dtype* is given (and the archive does not exist)
+
+        @type path: str or unicode
+        @param dtype: data type of the archive ('float32' or 'float16')
+        @type dtype: str
+        @type xcorr_dt: float
+        @type xcorr_tmax: float
+        """
+        self.path = path
+        self.infopath = os.path.join(path, 'archive.json')
+        self.stationspath = os.path.join(path, 'stations.pickle')
+        self.pairspath = os.path.join(path, 'pairs.json')
+        self._pairindex = None
+
+        if os.path.exists(self.infopath):
+            with open(self.infopath) as f:
+                info = json.load(f)
+            if dtype and (abs(info['xcorr_dt'] - xcorr_dt) > EPS or
+                          abs(info['xcorr_tmax'] - xcorr_tmax) > EPS):
+                s = "Sampling step or max time of archive {} differ from {} s and {} s"
+                raise Exception(s.format(path, xcorr_dt, xcorr_tmax))
+        elif dtype:
+            # initializing new archive
+            info = {'dtype': np.dtype(dtype).name,
+                    'xcorr_dt': xcorr_dt,
+                    'xcorr_tmax': xcorr_tmax}
+            if not os.path.exists(path):
+                os.makedirs(path)
+            with open(self.infopath, 'w') as f:
+                json.dump(info, f)
+        else:
+            raise Exception("No archive of daily cross-correlations in " + path)
+
+        self.dtype = np.dtype(info['dtype'])
+        self.xcorr_dt = info['xcorr_dt']
+        self.xcorr_tmax = info['xcorr_tmax']
+        nmax = int(self.xcorr_tmax / self.xcorr_dt)
+        self.timearray = np.arange(-nmax * self.xcorr_dt, (nmax + 1) * self.xcorr_dt,
+                                   self.xcorr_dt)
+
+        # records of the staging files: day (ordinal), scale and data
+        self._stagingdtype = np.dtype([('day', '<i8'),
+                                       ('scale', '<f8'),
+                                       ('data', self.dtype, (len(self.timearray),))])
+
+    def __repr__(self):
+        return '<Archive of daily cross-correlations {}>'.format(self.path)
+
+    def add_stations(self, stations):
+        """
+        Adds (or updates) stations to the archive
+
+        @type stations: list of L{pysismo.psstation.Station}
+        """
+        stationdict = self.stations()
+        stationdict.update((s.name, s) for s in stations)
+        with open(self.stationspath, 'wb') as f:
+            pickle.dump(stationdict, f, protocol=2)
+
+    def stations(self):
+        """
+        Returns the stations of the archive
+
+        @rtype: dict from str to L{pysismo.psstation.Station}
+        """
+        if not os.path.exists(self.stationspath):
+            return {}
+        with open(self.stationspath, 'rb') as f:
+            return pickle.load(f)
+
+    def add(self, s1name, s2name, day, xcorr, components=None):
+        """
+        Appends the daily cross-correlation of a pair of stations
+        (and of a pair of components, e.g. 'ZN', if multi-component
+        cross-correlations) to the staging file of its month
+
+        @type s1name: str
+        @type s2name: str
+        @type day: L{datetime.date}
+        @type xcorr: L{numpy.ndarray}
+        @type components: str
+        """
+        if len(xcorr) > len(self.timearray) or (len(self.timearray) - len(xcorr)) % 2:
+            s = "Length of cross-correlation ({}) does not fit that of archive ({})"
+            raise Exception(s.format(len(xcorr), len(self.timearray)))
+        if len(xcorr) < len(self.timearray):
+            # padding cross-corr of smaller max lag (see pair_tmax()) with
+            # zeros, which cost almost nothing once compressed
+            npad = (len(self.timearray) - len(xcorr)) // 2
+            xcorr = np.concatenate([np.zeros(npad), xcorr, np.zeros(npad)])
+
+        # scaling cross-correlation to unit max (avoids overflows with float16)
+        scale = np.abs(xcorr).max() or 1.0
+        record = np.zeros(1, dtype=self._stagingdtype)
+        record['day'] = day.toordinal()
+        record['scale'] = scale
+        record['data'] = xcorr / scale
+
+        # recording new pair in the index of the archive
+        pairindex = self._get_pairindex()
+        if (s1name, s2name, components) not in pairindex:
+            pairindex.add((s1name, s2name, components))
+            tmppath = self.pairspath + '.tmp'
+            with open(tmppath, 'w') as f:
+                json.dump(sorted(pairindex, key=lambda p: (p[0], p[1], p[2] or '')), f)
+            os.replace(tmppath, self.pairspath)
+
+        monthdir = os.path.join(self.path, '{:04d}-{:02d}'.format(day.year, day.month))
+        if not os.path.exists(monthdir):
+            os.makedirs(monthdir)
+        stagingpath = os.path.join(monthdir, _pair_stem(s1name, s2name, components) +
+                                   '.staging')
+        with open(stagingpath, 'ab') as f:
+            record.tofile(f)
+
+    def compress_staging(self, verbose=False):
+        """
+        Compresses the staging files into the archive, merging them with
+        the days already archived (days already archived are replaced),
+        and removes them
+        """
+        stagingpaths = sorted(glob.glob(os.path.join(self.path, '*', '*.staging')))
+        if verbose and stagingpaths:
+            s = "Compressing daily cross-correlations of {} pairs into archive: {}"
+            print(s.format(len(stagingpaths), self.path))
+
+        for stagingpath in stagingpaths:
+            records = np.fromfile(stagingpath, dtype=self._stagingdtype)
+            days = np.array([dt.date.fromordinal(int(d)) for d in records['day']],
+                            dtype='datetime64[D]')
+            scales = records['scale']
+            data = records['data']
+
+            npzpath = stagingpath[:-len('.staging')] + '.npz'
+            if os.path.exists(npzpath):
+                with np.load(npzpath) as archived:
+                    keep = ~np.in1d(archived['days'], days)
+                    days = np.concatenate([archived['days'][keep], days])
+                    scales = np.concatenate([archived['scales'][keep], scales])
+                    data = np.concatenate([archived['data'][keep], data])
+
+            # sorting days and writing compressed file (atomically)
+            isort = np.argsort(days, kind='mergesort')
+            tmppath = npzpath + '.tmp'
+            with open(tmppath, 'wb') as f:
+                np.savez_compressed(f, days=days[isort], scales=scales[isort],
+                                    data=data[isort])
+            os.replace(tmppath, npzpath)
+            os.remove(stagingpath)
+
+    def discard_staging(self):
+        """
+        Removes the staging files (e.g., those of a month
+        whose processing was interrupted)
+        """
+        for stagingpath in glob.glob(os.path.join(self.path, '*', '*.staging')):
+            os.remove(stagingpath)
+
+    def pairs(self, components=None):
+        """
+        Returns the pairs of stations of the archive
+
+        @type components: str
+        @rtype: list of (str, str)
+        """
+        return sorted((s1name, s2name) for s1name, s2name, comps in self._get_pairindex()
+                      if comps == components and self._npzpaths(s1name, s2name, comps))
+
+    def _get_pairindex(self):
+        """
+        Returns the index of the pairs of the archive,
+        as a set of (station1, station2, pair of components)
+
+        @rtype: set of (str, str, str)
+        """
+        if self._pairindex is None:
+            self._pairindex = set()
+            if os.path.exists(self.pairspath):
+                with open(self.pairspath) as f:
+                    self._pairindex = set(tuple(p) for p in json.load(f))
+        return self._pairindex
+
+    def days(self, s1name, s2name, components=None):
+        """
+        Returns the days archived for a pair of stations
+
+        @type s1name: str
+        @type s2name: str
+        @type components: str
+        @rtype: list of L{datetime.date}
+        """
+        days = []
+        for npzpath in self._npzpaths(s1name, s2name, components):
+            with np.load(npzpath) as archived:
+                days.extend(archived['days'].astype(dt.date))
+        return days
+
+    def stack(self, s1name, s2name, days=None, firstday=None, lastday=None,
+              skipdays=None, components=None):
+        """
+        Stacks the daily cross-correlations of a pair of stations
+        over a selection of days: *days* (if given), between *firstday*
+        and *lastday* (if given), except *skipdays* (if given).
+
+        Returns the stack and the list of stacked days.
+
+        @type s1name: str
+        @type s2name: str
+        @type days: list of L{datetime.date}
+        @type firstday: L{datetime.date}
+        @type lastday: L{datetime.date}
+        @type skipdays: list of L{datetime.date}
+        @type components: str
+        @rtype: L{numpy.ndarray}, list of L{datetime.date}
+        """
+        stack = np.zeros(len(self.timearray))
+        stackdays = []
+        for _, monthdays, monthstack, _ in self._month_stacks(s1name, s2name, days,
+                                                           firstday, lastday,
+                                                           skipdays, components):
+            stack += monthstack
+            stackdays.extend(monthdays)
+        return stack, stackdays
+
+    def to_collection(self, days=None, firstday=None, lastday=None, skipdays=None,
+                      components=None, verbose=False):
+        """
+        Rebuilds a collection of cross-correlations (with their month
+        stacks) from the daily cross-correlations of a selection of days
+        (see stack()). Note that locations and ids of the traces are
+        not archived.
+
+        @type days: list of L{datetime.date}
+        @type firstday: L{datetime.date}
+        @type lastday: L{datetime.date}
+        @type skipdays: list of L{datetime.date}
+        @type components: str
+        @rtype: L{CrossCorrelationCollection}
+        """
+        stationdict = self.stations()
+        xc = CrossCorrelationCollection()
+        for s1name, s2name in self.pairs(components=components):
+            if verbose:
+                print("{s1}-{s2}".format(s1=s1name, s2=s2name),)
+
+            pairxc = None
+            monthstacks = self._month_stacks(s1name, s2name, days, firstday,
+                                             lastday, skipdays, components)
+            for month, monthdays, monthstack, monthsqstack in monthstacks:
+                if pairxc is None:
+                    pairxc = xc._get_or_init_xcorr(stationdict[s1name],
+                                                   stationdict[s2name],
+                                                   xcorr_dt=self.xcorr_dt,
+                                                   xcorr_tmax=self.xcorr_tmax)
+                # month stacks cropped to the max lag of the pair (see pair_tmax())
+                nmax = pairxc._get_xcorr_nmax()
+                monthstack = _crop_lags(monthstack, nmax)
+                monthsqstack = _crop_lags(monthsqstack, nmax)
+                monthxc = MonthCrossCorrelation(month=month, ndata=len(pairxc.timearray))
+                monthxc.dataarray += monthstack
+                monthxc.sqdataarray += monthsqstack
+                monthxc.nday = len(monthdays)
+                pairxc.monthxcs.append(monthxc)
+                pairxc.dataarray += monthstack
+                pairxc.sqdataarray += monthsqstack
+                pairxc.nday += len(monthdays)
+                pairxc.startday = min(pairxc.startday or monthdays[0], monthdays[0])
+                pairxc.endday = max(pairxc.endday or monthdays[-1], monthdays[-1])
+
+        if verbose:
+            print()
+        return xc
+
+    def _month_stacks(self, s1name, s2name, days=None, firstday=None, lastday=None,
+                      skipdays=None, components=None):
+        """
+        Generates the month, the selected days, their stack and
+        their squared stack, for each archived month of a pair of stations
+        """
+        if days is not None:
+            days = np.array(days, dtype='datetime64[D]')
+        if skipdays is not None:
+            skipdays = np.array(skipdays, dtype='datetime64[D]')
+
+        for npzpath in self._npzpaths(s1name, s2name, components):
+            # skipping months outside [firstday, lastday]
+            year, month = [int(x) for x in
+                           os.path.basename(os.path.dirname(npzpath)).split('-')]
+            if firstday and (year, month) < (firstday.year, firstday.month):
+                continue
+            if lastday and (year, month) > (lastday.year, lastday.month):
+                continue
+
+            with np.load(npzpath) as archived:
+                monthdays = archived['days']
+                select = np.ones(len(monthdays), dtype=bool)
+                if days is not None:
+                    select &= np.in1d(monthdays, days)
+                if firstday:
+                    select &= monthdays >= np.datetime64(firstday, 'D')
+                if lastday:
+                    select &= monthdays <= np.datetime64(lastday, 'D')
+                if skipdays is not None:
+                    select &= ~np.in1d(monthdays, skipdays)
+                if not np.any(select):
+                    continue
+                scales = archived['scales'][select]
+                data = archived['data'][select].astype('float64')
+                monthstack = np.dot(scales, data)
+                monthsqstack = np.dot(scales**2, data**2)
+
+            yield (MonthYear(month, year), list(monthdays[select].astype(dt.date)),
+                   monthstack, monthsqstack)
+
+    def _npzpaths(self, s1name, s2name, components=None):
+        """
+        Returns the (chronologically sorted) archive files of a pair
+        """
+        filename = _pair_stem(s1name, s2name, components) + '.npz'
+        return sorted(glob.glob(os.path.join(self.path, '*', glob.escape(filename))))
+
+
+class CrossCorrelationStore:
+    """
+    Chunked binary store of a collection of cross-correlations, allowing
+    to read a single pair, a subset of months or a window of time lags
+    without loading (or even reading) the rest of the collection. The
+    store is a directory containing:
+
+    - manifest.json: the components of a multi-component collection (null
+      otherwise), the record of processed days, and the metadata of each
+      pair of stations (and of components): names of the stations and
+      of their files, nb of days, first/last days, locations, ids,
+      symmetrized/whitened flags and months stacked;
+
+    - stations.pickle: the stations of the pairs (dict {name: station});
+
+    - SNRs.pickle: the cached SNRs of the pairs (see CrossCorrelation.SNR()),
+      as a dict {(station1, station2, pair of components): cached SNRs},
+      rewritten with the SNRs calculated afterwards by write_SNRs();
+
+    - two files per pair, <station1>-<station2>[_<pair of components>]
+      (see _pair_stem()): .stack.npy, an array (3 x nb of times)
+      containing the time array, the stack and the sum of the squared
+      daily cross-correlations (see stack_stderr()), and .months.npy, an
+      array (nb of months x 2 x nb of times) containing the month stacks
+      and their sums of squares.
+      Arrays are not compressed, so that they can be memory-mapped.
+
+    E.g., to read the stacks of the first months of 2010 of a pair:
+
+    >>> store = CrossCorrelationStore('xcorr_2000-2012_xmlresponse.xcstore')
+    >>> xc = store.read('STA01', 'STA02', months=[(1, 2010), (2, 2010)])
+    """
+
+    def __init__(self, path):
+        """
+        Opens the store in dir *path*
+
+        @type path: str or unicode
+        """
+        self.path = path
+        self.manifestpath = os.path.join(path, 'manifest.json')
+        self.stationspath = os.path.join(path, 'stations.pickle')
+        self.SNRspath = os.path.join(path, 'SNRs.pickle')
+        if not os.path.exists(self.manifestpath):
+            raise Exception("No store of cross-correlations in " + path)
+
+        with open(self.manifestpath) as f:
+            self.manifest = json.load(f)
+        self._pairinfos = {(info['s1'], info['s2'], info['components']): info
+                           for info in self.manifest['pairs']}
+        self._stationdict = None
+        self._SNRcaches = None
+
+    def __repr__(self):
+        return '<Store of cross-correlations {}>'.format(self.path)
+
+    @staticmethod
+    def write(xc, path, verbose=False):
+        """
+        Writes a collection of cross-correlations (single or multi-component)
+        to a store in dir *path*. The store is first written to a temporary
+        dir, which then replaces the existing store (if any), backed up
+        as *path*~.
+
+        @type xc: L{CrossCorrelationCollection} or
+                  L{MultiComponentCrossCorrelationCollection}
+        @type path: str or unicode
+        @rtype: L{CrossCorrelationStore}
+        """
+        if isinstance(xc, MultiComponentCrossCorrelationCollection):
+            components = xc.components()
+            collections = [(key, xc[key]) for key in xc]
+        else:
+            components = None
+            collections = [(None, xc)]
+
+        tmppath = path + '.tmp'
+        if os.path.exists(tmppath):
+            shutil.rmtree(tmppath)
+        os.makedirs(tmppath)
+
+        manifest = {'version': 1,
+                    'components': components,
+                    'processed_days': None,
+                    'pairs': []}
+        if xc.has_processed_days():
+            manifest['processed_days'] = {
+                name: [day.isoformat() for day in sorted(days)]
+                for name, days in xc.processed_days().items()}
+
+        stationdict = {}
+        SNRcaches = {}
+        for key, keyxc in collections:
+            for s1name, s2name in keyxc.pairs(sort=True, minday=0):
+                pairxc = keyxc[s1name][s2name]
+                stationdict[s1name] = pairxc.station1
+                stationdict[s2name] = pairxc.station2
+                if pairxc._get_SNRcache():
+                    SNRcaches[(s1name, s2name, key)] = dict(pairxc._get_SNRcache())
+
+                monthxcs = sorted(pairxc.monthxcs, key=lambda mxc: (mxc.month.y, mxc.month.m))
+                sqdataarrays = [getattr(obj, 'sqdataarray', None)
+                                for obj in [pairxc] + monthxcs]
+                withsq = all(a is not None for a in sqdataarrays)
+                nan = np.nan * np.zeros_like(pairxc.dataarray)
+
+                stem = _pair_stem(s1name, s2name, key)
+                manifest['pairs'].append({
+                    's1': s1name,
+                    's2': s2name,
+                    'components': key,
+                    'stem': stem,
+                    'nday': pairxc.nday,
+                    'startday': pairxc.startday.isoformat() if pairxc.startday else None,
+                    'endday': pairxc.endday.isoformat() if pairxc.endday else None,
+                    'locs1': sorted(pairxc.locs1),
+                    'locs2': sorted(pairxc.locs2),
+                    'ids1': sorted(pairxc.ids1),
+                    'ids2': sorted(pairxc.ids2),
+                    'symmetrized': pairxc.symmetrized,
+                    'whitened': pairxc.whitened,
+                    'sq': withsq,
+                    'months': [[mxc.month.m, mxc.month.y, mxc.nday] for mxc in monthxcs]})
+
+                stem = os.path.join(tmppath, stem)
+                np.save(stem + '.stack.npy',
+                        np.array([pairxc.timearray, pairxc.dataarray,
+                                  pairxc.sqdataarray if withsq else nan]))
+                monthsarray = np.zeros((len(monthxcs), 2, len(pairxc.dataarray)))
+                for i, mxc in enumerate(monthxcs):
+                    monthsarray[i, 0] = mxc.dataarray
+                    monthsarray[i, 1] = mxc.sqdataarray if withsq else nan
+                np.save(stem + '.months.npy', monthsarray)
+
+        with open(os.path.join(tmppath, 'stations.pickle'), 'wb') as f:
+            pickle.dump(stationdict, f, protocol=2)
+        with open(os.path.join(tmppath, 'SNRs.pickle'), 'wb') as f:
+            pickle.dump(SNRcaches, f, protocol=2)
+        with open(os.path.join(tmppath, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f)
+
+        # replacing existing store, backed up
+        if os.path.exists(path):
+            if os.path.exists(path + '~'):
+                shutil.rmtree(path + '~')
+            os.rename(path, path + '~')
+        os.rename(tmppath, path)
+
+        return CrossCorrelationStore(path)
+
+    def components(self):
+        """
+        Returns the components of a multi-component store,
+        e.g., ['Z', 'N', 'E'], or None
+
+        @rtype: list of str
+        """
+        return self.manifest['components']
+
+    def stations(self):
+        """
+        Returns the stations of the store
+
+        @rtype: dict from str to L{pysismo.psstation.Station}
+        """
+        if self._stationdict is None:
+            with open(self.stationspath, 'rb') as f:
+                self._stationdict = pickle.load(f)
+        return self._stationdict
+
+    def _get_SNRcaches(self):
+        """
+        Returns the cached SNRs of the pairs of the store,
+        {(station1, station2, pair of components): cached SNRs}
+
+        @rtype: dict
+        """
+        if self._SNRcaches is None:
+            self._SNRcaches = {}
+            if os.path.exists(self.SNRspath):
+                with open(self.SNRspath, 'rb') as f:
+                    self._SNRcaches = pickle.load(f)
+        return self._SNRcaches
+
+    def write_SNRs(self, SNRcaches=None):
+        """
+        Rewrites SNRs.pickle with the cached SNRs of the pairs of the
+        store, which are shared with the cross-correlations read from
+        the store (see read()), updated with *SNRcaches* if given,
+        {(station1, station2, pair of components): cached SNRs}
+
+        @type SNRcaches: dict
+        """
+        caches = self._get_SNRcaches()
+        for key, cache in (SNRcaches or {}).items():
+            caches.setdefault(key, {}).update(cache)
+
+        tmppath = self.SNRspath + '.tmp'
+        with open(tmppath, 'wb') as f:
+            pickle.dump({key: cache for key, cache in caches.items() if cache},
+                        f, protocol=2)
+        os.rename(tmppath, self.SNRspath)
+
+    def pairs(self, components=None):
+        """
+        Returns the pairs of stations of the store (of the pair of
+        components *components*, e.g. 'ZN', if multi-component store;
+        the first pair of components by default)
+
+        @type components: str
+        @rtype: list of (str, str)
+        """
+        components = self._check_components(components)
+        return [(info['s1'], info['s2']) for info in self.manifest['pairs']
+                if info['components'] == components]
+
+    def processed_days(self):
+        """
+        Returns the record of processed days of the collection (see
+        CrossCorrelationCollection.processed_days()), or None if
+        the collection kept no record
+
+        @rtype: dict from str to set of L{datetime.date}
+        """
+        if self.manifest['processed_days'] is None:
+            return None
+        return {name: set(dt.datetime.strptime(d, '%Y-%m-%d').date() for d in days)
+                for name, days in self.manifest['processed_days'].items()}
+
+    def read(self, s1name, s2name, components=None, months=None, tmin=None, tmax=None,
+             mmap=False):
+        """
+        Reads the cross-correlation of a pair of stations (and of a pair
+        of components, if multi-component store), restricted to the stacks
+        of *months* (if given, see CrossCorrelation.extract_months()) and
+        to the time lags between *tmin* and *tmax* (if given). Only the
+        corresponding parts of the arrays are read.
+
+        If *mmap* is True, the stack and the month stacks of the
+        cross-correlation are (read-only) views of the memory-mapped
+        arrays of the store, whose data are read only when used.
+
+        The cached SNRs of the whole cross-correlation are shared by
+        the cross-correlations read from the store.
+
+        Returns None if the pair has no data in *months*.
+
+        @type s1name: str
+        @type s2name: str
+        @type components: str
+        @type months: list of (L{MonthYear} or (int, int))
+        @type tmin: float
+        @type tmax: float
+        @type mmap: bool
+        @rtype: L{CrossCorrelation}
+        """
+        components = self._check_components(components)
+        info = self._pairinfos[(s1name, s2name, components)]
+        load = (lambda a: a) if mmap else np.array
+        stem = os.path.join(self.path, info['stem'])
+
+        # memory-mapped arrays, whose selected parts only are read
+        stackarray = np.load(stem + '.stack.npy', mmap_mode='r')
+        monthsarray = np.load(stem + '.months.npy', mmap_mode='r')
+
+        # lag window
+        timearray = np.array(stackarray[0])
+        i0 = np.searchsorted(timearray, tmin - EPS) if tmin is not None else 0
+        i1 = np.searchsorted(timearray, tmax + EPS) if tmax is not None else len(timearray)
+
+        # selected months
+        imonths = range(len(info['months']))
+        if months is not None:
+            monthkeys = _monthkeys(months)
+            imonths = [i for i in imonths if tuple(info['months'][i][:2]) in monthkeys]
+            if not imonths:
+                return None
+
+        stationdict = self.stations()
+        xc = CrossCorrelation(station1=stationdict[s1name], station2=stationdict[s2name],
+                              xcorr_dt=timearray[1] - timearray[0], xcorr_tmax=0.0)
+        xc.timearray = timearray[i0:i1]
+        xc.dataarray = load(stackarray[1, i0:i1])
+        xc.sqdataarray = load(stackarray[2, i0:i1]) if info['sq'] else None
+        for i in imonths:
+            m, y, nday = info['months'][i]
+            monthxc = MonthCrossCorrelation(month=MonthYear(m, y), ndata=0)
+            monthxc.dataarray = load(monthsarray[i, 0, i0:i1])
+            monthxc.sqdataarray = load(monthsarray[i, 1, i0:i1]) if info['sq'] else None
+            monthxc.nday = nday
+            xc.monthxcs.append(monthxc)
+
+        xc.nday = info['nday']
+        if info['startday']:
+            xc.startday = dt.datetime.strptime(info['startday'], '%Y-%m-%d').date()
+            xc.endday = dt.datetime.strptime(info['endday'], '%Y-%m-%d').date()
+        xc.locs1, xc.locs2 = set(info['locs1']), set(info['locs2'])
+        xc.ids1, xc.ids2 = set(info['ids1']), set(info['ids2'])
+        xc.symmetrized = info['symmetrized']
+        xc.whitened = info['whitened']
+
+        if months is not None:
+            # stack, nb of days and first/last days of the selected months
+            xc = xc.extract_months(months)
+        elif tmin is None and tmax is None:
+            xc._SNRcache = self._get_SNRcaches().setdefault((s1name, s2name, components), {})
+        return xc
+
+    def to_collection(self, pairs=None, months=None, tmin=None, tmax=None,
+                      verbose=False):
+        """
+        Reads the collection of cross-correlations (single or multi-component)
+        of the store, restricted to *pairs* (if given) and to the months and
+        lag window given by *months*, *tmin*, *tmax* (see read())
+
+        @type pairs: list of (str, str)
+        @type months: list of (L{MonthYear} or (int, int))
+        @type tmin: float
+        @type tmax: float
+        @rtype: L{CrossCorrelationCollection} or
+                L{MultiComponentCrossCorrelationCollection}
+        """
+        if self.components():
+            xc = MultiComponentCrossCorrelationCollection(self.components())
+        else:
+            xc = CrossCorrelationCollection()
+
+        processed_days = self.processed_days()
+        if processed_days is not None:
+            for name, days in processed_days.items():
+                if months is not None:
+                    days = [d for d in days if MonthYear(d) in months]
+                xc.add_processed_days([name], days)
+
+        if pairs is not None:
+            pairs = set(pairs)
+        for info in self.manifest['pairs']:
+            s1name, s2name, key = info['s1'], info['s2'], info['components']
+            if pairs is not None and (s1name, s2name) not in pairs:
+                continue
+            if verbose and key == self._check_components(None):
+                print("{s1}-{s2}".format(s1=s1name, s2=s2name),)
+
+            pairxc = self.read(s1name, s2name, components=key, months=months,
+                               tmin=tmin, tmax=tmax)
+            if not pairxc:
+                continue
+            keyxc = xc[key] if key else xc
+            if s1name not in keyxc:
+                keyxc[s1name] = AttribDict()
+            keyxc[s1name][s2name] = pairxc
+
+        if verbose:
+            print()
+        return xc
+
+    def _check_components(self, components):
+        """
+        Returns the pair of components *components* (the first
+        pair of components by default) if multi-component store,
+        else None
+        """
+        if not self.components():
+            return None
+        return components or 2 * self.components()[0]
+
+
+class _LazyStationPairs:
+    """
+    Cross-correlations between a station and the other stations of a
+    store (see LazyCrossCorrelationCollection), accessed as self[s2name]
+    (or self.s2name), each access building the cross-correlation
+    from the memory-mapped arrays of the store
+    """
+    def __init__(self, store, s1name, s2names, components=None):
+        """
+        @type store: L{CrossCorrelationStore}
+        @type s1name: str
+        @type s2names: list of str
+        @type components: str
+        """
+        self._store = store
+        self._s1name = s1name
+        self._s2names = list(s2names)
+        self._components = components
+
+    def __repr__(self):
+        s = '<Lazy cross-correlations between station {} and {} stations>'
+        return s.format(self._s1name, len(self._s2names))
+
+    def __getitem__(self, s2name):
+        if s2name not in self._s2names:
+            raise KeyError(s2name)
+        return self._store.read(self._s1name, s2name, components=self._components,
+                                mmap=True)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __iter__(self):
+        return iter(self._s2names)
+
+    def __contains__(self, s2name):
+        return s2name in self._s2names
+
+    def __len__(self):
+        return len(self._s2names)
+
+    def keys(self):
+        return list(self._s2names)
+
+
+class LazyCrossCorrelationCollection(CrossCorrelationCollection):
+    """
+    Read-only collection of the cross-correlations of a store (see
+    CrossCorrelationStore), with the interface of CrossCorrelationCollection,
+    loading nothing but the manifest and the stations of the store: each
+    cross-correlation is built only when accessed, as self[s1][s2], from
+    the memory-mapped arrays of the store (see CrossCorrelationStore.read()),
+    and is not kept by the collection.
+
+    Processing the pairs one at a time (e.g., with FTANs()) then requires
+    the memory of a single cross-correlation, instead of that of the whole
+    collection. Note that the collection cannot be updated (add(), merge()).
+
+    E.g., to perform the FTANs of a large collection:
+
+    >>> xc = LazyCrossCorrelationCollection('xcorr_2000-2012_xmlresponse.xcstore')
+    >>> xc.FTANs(suffix='2000-2012_xmlresponse')
+    """
+
+    def __init__(self, store, components=None):
+        """
+        Lazily opens the store *store* (or the store in dir *store*),
+        restricted to the pair of components *components* (e.g.,
+        'ZZ') if multi-component store (the first pair by default)
+
+        @type store: L{CrossCorrelationStore} or str or unicode
+        @type components: str
+        """
+        CrossCorrelationCollection.__init__(self)
+        if not isinstance(store, CrossCorrelationStore):
+            store = CrossCorrelationStore(store)
+        components = store._check_components(components)
+
+        # (avoiding setattr(), see CrossCorrelationCollection.add_processed_days())
+        s2names = OrderedDict()
+        for s1name, s2name in store.pairs(components=components):
+            s2names.setdefault(s1name, []).append(s2name)
+        for s1name in s2names:
+            self.__dict__[s1name] = _LazyStationPairs(store, s1name, s2names[s1name],
+                                                      components)
+
+        # record of processed days, kept in the first pair of components
+        processed_days = store.processed_days()
+        if processed_days is not None and components == store._check_components(None):
+            self.__dict__['_processed_days'] = processed_days
+
+    def __repr__(self):
+        npair = sum(len(self[s1]) for s1 in self)
+        s = '(AttribDict)<Lazy collection of cross-correlation between {0} pairs>'
+        return s.format(npair)
+
+    def _get_pairtable(self):
+        """
+        Returns the table of pairs (see CrossCorrelationCollection._get_pairtable()),
+        which is calculated only once, as the collection cannot be updated
+
+        @rtype: L{numpy.ndarray}
+        """
+        if '_pairtable' not in self.__dict__:
+            CrossCorrelationCollection._get_pairtable(self)
+        return self.__dict__['_pairtable']['table']
+
+
+def select_pairs(stations, mindist=CROSSCORR_MINDIST, maxdist=CROSSCORR_MAXDIST,
+                 withnets=CROSSCORR_WITHNETS, onlywithnets=CROSSCORR_ONLYWITHNETS,
+                 pairs_subset=CROSSCORR_PAIRS_SUBSET, skippairs=CROSSCORR_SKIPPAIRS,
+                 maxpairs_per_station=CROSSCORR_MAXPAIRS_PER_STATION):
+    """
+    Selects the pairs of stations to cross-correlate, among all the
+    combinations of *stations*:
+
+    - the inter-station distance must be >= *mindist* and <= *maxdist*;
+    - at least one station of the pair must belong to networks
+      *withnets*, and both stations to networks *onlywithnets*;
+    - the pair must belong to *pairs_subset* (if given), and must not
+      belong to *skippairs* (the order of the stations does not matter);
+    - each station can appear in at most *maxpairs_per_station* pairs:
+      the pairs are retained from the nearest to the farthest, as long
+      as none of their stations has reached the max nb of pairs.
+
+    Set a parameter to None to disable the corresponding criterion.
+
+    Returns the set of selected pairs of station names (name1, name2),
+    with name1 < name2 (which is the order of the pairs in a
+    L{CrossCorrelationCollection}).
+
+    @type stations: list of L{pysismo.psstation.Station}
+    @type mindist: float
+    @type maxdist: float
+    @type withnets: list of str
+    @type onlywithnets: list of str
+    @type pairs_subset: list of (str, str)
+    @type skippairs: list of (str, str)
+    @type maxpairs_per_station: int
+    @rtype: set of (str, str)
+    """
+    pairs = list(it.combinations(sorted(stations, key=lambda sta: sta.name), 2))
+    if not pairs:
+        return set()
+
+    # inter-station distances, from the registry of stations
+    i1 = psstation.registry.indices([s1 for s1, _ in pairs])
+    i2 = psstation.registry.indices([s2 for _, s2 in pairs])
+    dists = psstation.registry.dists()[i1, i2]
+
+    if pairs_subset:
+        pairs_subset = set(frozenset(pair) for pair in pairs_subset)
+    skippairs = set(frozenset(pair) for pair in skippairs) if skippairs else set()
+
+    selected = []
+    for (s1, s2), dist in zip(pairs, np.atleast_1d(dists)):
+        if pairs_subset and frozenset((s1.name, s2.name)) not in pairs_subset:
+            continue
+        if frozenset((s1.name, s2.name)) in skippairs:
+            continue
+        if mindist is not None and dist < mindist:
+            continue
+        if maxdist is not None and dist > maxdist:
+            continue
+        if withnets and not (s1.network in withnets or s2.network in withnets):
+            continue
+        if onlywithnets and not (s1.network in onlywithnets and
+                                 s2.network in onlywithnets):
+            continue
+        selected.append((dist, s1.name, s2.name))
+
+    if maxpairs_per_station:
+        # retaining pairs from the nearest to the farthest, as long
+        # as none of their stations has reached the max nb of pairs
+        npairs = dict((sta.name, 0) for sta in stations)
+        nearestfirst = sorted(selected)
+        selected = []
+        for dist, s1name, s2name in nearestfirst:
+            if max(npairs[s1name], npairs[s2name]) >= maxpairs_per_station:
+                continue
+            selected.append((dist, s1name, s2name))
+            npairs[s1name] += 1
+            npairs[s2name] += 1
+
+    return set((s1name, s2name) for _, s1name, s2name in selected)
+
+
+def pair_tmax(dist, tmax=CROSSCORR_TMAX, floor=CROSSCORR_TMAX_FLOOR,
+              vmin=SIGNAL_WINDOW_VMIN, signal2noise_trail=SIGNAL2NOISE_TRAIL,
+              noise_window_size=NOISE_WINDOW_SIZE):
+    """
+    Returns the max lag (in sec) of the cross-correlation of a pair of
+    stations *dist* km apart: the end of the noise window of the pair
+    (see CrossCorrelation.SNR()), i.e.
+
+      dist/*vmin* + *signal2noise_trail* + *noise_window_size*,
+
+    and at least the time of the slowest FTAN velocity, bounded
+    between *floor* and *tmax*. Returns *tmax* if *floor* is None
+    (all the pairs are then cross-correlated up to the same max lag).
+
+    @type dist: float
+    @type tmax: float
+    @type floor: float
+    @type vmin: float
+    @type signal2noise_trail: float
+    @type noise_window_size: float
+    @rtype: float
+    """
+    if floor is None:
+        return tmax
+    tend = max(dist / vmin + signal2noise_trail + noise_window_size,
+               dist / min(FTAN_VELOCITIES))
+    return min(tmax, max(floor, tend))
+
+
+def tile_pairs(pairs, pairbytes, stationbytes=0, rambudget=CROSSCORR_RAM_BUDGET):
+    """
+    Splits the *pairs* of stations to cross-correlate into tiles whose
+    cross-correlations fit in the memory budget *rambudget* (in MB),
+    so that the cross-correlations of a day can be calculated and
+    stacked one tile at a time, with a peak memory depending on the
+    size of the tiles rather than on the total nb of pairs.
+
+    The memory needed by a tile is estimated as *pairbytes* bytes per
+    pair (e.g., the cross-correlation arrays of the pair), or
+    *pairbytes*[pair] bytes if *pairbytes* is a dict (e.g., if the max
+    lag depends on the pair, see pair_tmax()), plus *stationbytes*
+    bytes per station appearing in the tile (e.g., the spectra of the
+    traces of the station). Pairs are sorted, so that
+    the pairs sharing their first station go to the same tile.
+
+    Returns the list of tiles (lists of pairs), with all the pairs in
+    a single tile if *rambudget* is None. A tile always contains at
+    least one pair, even if the pair alone exceeds the budget.
+
+    @type pairs: iterable of (str, str)
+    @type pairbytes: int or dict from (str, str) to int
+    @type stationbytes: int
+    @type rambudget: float
+    @rtype: list of (list of (str, str))
+    """
+    pairs = sorted(pairs)
+    if rambudget is None:
+        return [pairs] if pairs else []
+
+    budget = rambudget * 1024**2
+    tiles = []
+    tile, tilestations, tilebytes = [], set(), 0
+    for pair in pairs:
+        newstations = set(pair) - tilestations
+        nbytes = pairbytes[pair] if isinstance(pairbytes, dict) else pairbytes
+        if tile and tilebytes + nbytes + \
+                (len(tilestations) + len(newstations)) * stationbytes > budget:
+            # budget exceeded: starting a new tile
+            tiles.append(tile)
+            tile, tilestations, tilebytes = [], set(), 0
+            newstations = set(pair)
+        tile.append(pair)
+        tilestations |= newstations
+        tilebytes += nbytes
+    if tile:
+        tiles.append(tile)
+
+    return tiles
+
+
+def get_merged_trace(station, date, skiplocs=CROSSCORR_SKIPLOCS, minfill=MINFILL,
+                     channel=None):
     """
     Returns one trace extracted from selected station, at selected date
     (+/- 1 hour on each side to avoid edge effects during subsequent
-    processing).
+    processing). Set *channel* to select one of the channels of a
+    multi-component station (default is station's channel).
 
     Traces whose location belongs to *skiplocs* are discarded, then
     if several locations remain, only the first is kept. Finally,
@@ -2328,13 +4818,14 @@ def get_merged_trace(station, date, skiplocs=CROSSCORR_SKIPLOCS, minfill=MINFILL
     @param skiplocs: list of locations to discard in station's data
     @type skiplocs: iterable
     @param minfill: minimum data fill to keep trace
+    @type channel: str
     @rtype: L{Trace}
     """
 
     # getting station's stream at selected date
     # (+/- one hour to avoid edge effects when removing response)
     t0 = UTCDateTime(date)  # date at time 00h00m00s
-    st = read(pathname_or_url=station.getpath(date),
+    st = read(pathname_or_url=station.getpath(date, channel=channel),
               starttime=t0 - dt.timedelta(hours=1),
               endtime=t0 + dt.timedelta(days=1, hours=1))
 
@@ -2568,6 +5059,315 @@ def preprocess_trace(trace, paz=None, freqmin=FREQMIN, freqmax=FREQMAX,
         raise pserrors.CannotPreprocess("Got NaN in trace data")
 
 
+class OneBitTrace:
+    """
+    One-bit normalized trace (see preprocess_trace()) whose signs are
+    bit-packed, i.e., 64 times smaller than the float data of the
+    trace, to cut the memory used by the traces of a day and the cost
+    of sending them to/from other processes.
+
+    The header (stats, id) of the trace is kept, and the one-bit data
+    (-1, 0 or +1) are unpacked into an array of int8 by *self.data*,
+    so that the instance can replace the trace in spectral_xcorrs(),
+    whose cross-correlations of one-bit traces are exact integers.
+    Each access to *self.data* unpacks the whole trace (the unpacked
+    data are not kept, to save memory): use len(self) for the nb
+    of samples.
+    """
+    def __init__(self, trace):
+        """
+        @type trace: L{Trace}
+        """
+        self.stats = trace.stats.copy()
+        self.id = trace.id
+        # packed signs, and packed non-zero flags if any sample is zero
+        self.signs = np.packbits(trace.data > 0)
+        self.nonzero = np.packbits(trace.data != 0) if np.any(trace.data == 0) else None
+
+    def __len__(self):
+        return self.stats.npts
+
+    def __str__(self):
+        s = u'{} | {} - {} | {} samples (one-bit)'
+        return s.format(self.id, self.stats.starttime, self.stats.endtime, self.stats.npts)
+
+    @property
+    def data(self):
+        """
+        Unpacked one-bit data
+        @rtype: L{numpy.ndarray}
+        """
+        npts = self.stats.npts
+        data = 2 * np.unpackbits(self.signs)[:npts].astype('int8') - 1
+        if self.nonzero is not None:
+            data *= np.unpackbits(self.nonzero)[:npts].astype('int8')
+        return data
+
+
+def spectral_xcorrs(tracedict, pairs, nmax):
+    """
+    Cross-correlates the traces of *tracedict* = {key: trace} for
+    each pair of keys (key1, key2) of *pairs*, between -/+ *nmax*
+    samples, or -/+ *nmax*[(key1, key2)] samples if *nmax* is a dict
+    (see pair_tmax()). Each trace is Fourier-transformed only once, and each
+    cross-correlation is obtained from the product of the shared spectra,
+    which is much faster than cross-correlating each pair on its own when
+    the traces appear in many pairs (e.g., the components of multi-
+    component stations).
+
+    The cross-correlations are the same as those of CrossCorrelation.add()
+    (obspy's correlate(), aligning the centers of the traces after the
+    last sample of the first trace is discarded if the difference
+    between their lengths is odd).
+
+    The cross-correlations of one-bit traces (see OneBitTrace), which
+    are sums of -1, 0 or +1, are rounded to exact integers.
+
+    Returns a dict {(key1, key2): cross-correlation array}
+
+    @type tracedict: dict from any to L{Trace} or L{OneBitTrace}
+    @type pairs: list of (any, any)
+    @type nmax: int or dict from (any, any) to int
+    @rtype: dict from (any, any) to L{numpy.ndarray}
+    """
+    keys = set(key for pair in pairs for key in pair)
+    if not keys:
+        return {}
+    npts = {key: len(tracedict[key]) for key in keys}
+    pairnmax = {pair: _pair_nmax(nmax, pair) for pair in pairs}
+
+    # data of the traces (one-bit traces are unpacked only once)
+    data = {key: tracedict[key].data for key in keys}
+
+    # nb of points of the FFTs such that the circular cross-correlation
+    # does not wrap around within the lags of interest (the cross-
+    # correlation of traces of n1 and n2 points is needed from
+    # (n1 - n2) / 2 - nmax to (n1 - n2) / 2 + nmax, and extends from
+    # -(n2 - 1) to n1 - 1)
+    nfft = next_fast_len(max(npts.values()) + max(pairnmax.values()) + 1)
+    spectra = {key: rfft(data[key], nfft) for key in keys}
+    onebit = all(isinstance(tracedict[key], OneBitTrace) for key in keys)
+
+    xcorrs = {}
+    for key1, key2 in pairs:
+        lags = np.arange(-pairnmax[(key1, key2)], pairnmax[(key1, key2)] + 1)
+        n1, n2 = npts[key1], npts[key2]
+        if (n1 - n2) % 2 != 0:
+            n1 -= 1  # discarding last sample to make the length difference even
+
+        # circular cross-correlation, whose lag k is at index k % nfft,
+        # around the lag aligning the centers of the traces
+        xcorr_circ = irfft(spectra[key1] * spectra[key2].conj(), nfft)
+        k = lags + (n1 - n2) // 2
+        xcorr = xcorr_circ[k % nfft]
+
+        if n1 < npts[key1]:
+            # removing the contribution of the discarded sample,
+            # trace1[n1] * trace2[n1 - k]
+            i2 = n1 - k
+            valid = (i2 >= 0) & (i2 < n2)
+            xcorr[valid] -= data[key1][n1] * data[key2][i2[valid]]
+
+        if onebit:
+            # exact cross-correlation of one-bit traces
+            xcorr = np.rint(xcorr)
+
+        xcorrs[(key1, key2)] = xcorr
+
+    return xcorrs
+
+
+def segment_xcorrs(tracedict, pairs, nmax, window_length=CROSSCORR_WINDOW_LENGTH,
+                   overlap=CROSSCORR_WINDOW_OVERLAP, reject=CROSSCORR_WINDOW_REJECT):
+    """
+    Cross-correlates the traces of *tracedict* = {key: trace} for
+    each pair of keys (key1, key2) of *pairs*, between -/+ *nmax*
+    samples (or -/+ *nmax*[(key1, key2)] samples if *nmax* is a dict),
+    by splitting the traces into windows of *window_length*
+    secs overlapping by a fraction *overlap* of their length, and
+    averaging the cross-spectra of the windows of each pair.
+
+    The windows are taken on a common time grid (starting at the
+    earliest trace), so that the windows of different traces are
+    simultaneous, and the windows of all the traces are Fourier-
+    transformed at once (2-D rfft). The window of a trace is rejected
+    if it is not fully covered by the trace, or if its standard
+    deviation exceeds *reject* times the median standard deviation of
+    the windows of the trace (e.g., transient signals of earthquakes).
+    The cross-correlation of a pair is obtained from the windows
+    accepted for both traces: it is the average of the cross-correlations
+    of the windows. Pairs without any window accepted for both traces
+    are left out of the returned dict (and their number is reported).
+
+    Note that, being an average over windows of *window_length* secs,
+    the cross-correlation is scaled differently from that of the
+    whole-day traces: stacks of window-averaged cross-correlations
+    must not be merged with stacks of whole-day ones (e.g., when
+    updating a collection calculated with another window length).
+
+    Returns a dict {(key1, key2): cross-correlation array}
+
+    @type tracedict: dict from any to L{Trace} or L{OneBitTrace}
+    @type pairs: list of (any, any)
+    @type nmax: int or dict from (any, any) to int
+    @type window_length: float
+    @type overlap: float
+    @type reject: float
+    @rtype: dict from (any, any) to L{numpy.ndarray}
+    """
+    keys = list(set(key for pair in pairs for key in pair))
+    if not keys:
+        return {}
+    sampling_rate = tracedict[keys[0]].stats.sampling_rate
+    nwinpts = int(round(window_length * sampling_rate))
+    pairnmax = {pair: _pair_nmax(nmax, pair) for pair in pairs}
+    if max(pairnmax.values()) >= nwinpts:
+        raise Exception("Windows must be longer than the max lag of cross-correlations")
+    step = max(int(round(nwinpts * (1.0 - overlap))), 1)
+
+    # common time grid of the windows
+    t0 = min(tracedict[key].stats.starttime for key in keys)
+    tend = max(tracedict[key].stats.endtime for key in keys)
+    nwin = max((int(round((tend - t0) * sampling_rate)) + 1 - nwinpts) // step + 1, 0)
+
+    # windows of the traces, and flags of accepted windows
+    windows = np.zeros((len(keys), nwin, nwinpts))
+    accepted = np.zeros((len(keys), nwin), dtype=bool)
+    for i, key in enumerate(keys):
+        data = tracedict[key].data
+        offset = int(round((tracedict[key].stats.starttime - t0) * sampling_rate))
+        starts = np.arange(nwin) * step - offset
+        accepted[i] = (starts >= 0) & (starts + nwinpts <= len(data))
+        windows[i, accepted[i]] = data[starts[accepted[i], np.newaxis] + np.arange(nwinpts)]
+        if reject and np.any(accepted[i]):
+            # rejecting windows of anomalous standard deviation
+            std = windows[i, accepted[i]].std(axis=-1)
+            accepted[i, accepted[i]] = std <= reject * np.median(std)
+
+    # spectra of all the windows, without wrap-around
+    # of the circular cross-correlations within -/+ nmax
+    nfft = next_fast_len(nwinpts + max(pairnmax.values()) + 1)
+    spectra = rfft(windows, nfft, axis=-1)
+    del windows
+
+    index = {key: i for i, key in enumerate(keys)}
+    xcorrs = {}
+    nskipped = 0
+    for key1, key2 in pairs:
+        lags = np.arange(-pairnmax[(key1, key2)], pairnmax[(key1, key2)] + 1)
+        i1, i2 = index[key1], index[key2]
+        common = accepted[i1] & accepted[i2]
+        if not np.any(common):
+            # no window to cross-correlate
+            nskipped += 1
+            continue
+        crossspectrum = np.mean(spectra[i1, common] * spectra[i2, common].conj(), axis=0)
+        xcorrs[(key1, key2)] = irfft(crossspectrum, nfft)[lags % nfft]
+
+    if nskipped:
+        s = "Warning: no window common to both traces of {} pair(s) -> skipping"
+        print(s.format(nskipped))
+
+    return xcorrs
+
+
+def _monthkeys(months):
+    """
+    Returns the keys (month, year) of a list of
+    L{MonthYear} or (month, year)
+    """
+    return [(m.m, m.y) if isinstance(m, MonthYear) else tuple(m) for m in months]
+
+
+def _pair_nmax(nmax, pair):
+    """
+    Returns the max lag (samples) of the cross-correlation of *pair*,
+    given a max lag *nmax* shared by all the pairs or a dict
+    {pair: max lag}
+    """
+    return nmax[pair] if isinstance(nmax, dict) else nmax
+
+
+def _pair_stem(s1name, s2name, components=None):
+    """
+    Returns the name (without extension) of the files of a pair of
+    stations (and of components), <station1>-<station2>[_<components>],
+    in which the characters '%', '-' and '_' of the names of the stations
+    are percent-encoded, so that the files of different pairs never
+    get the same name
+    """
+    def quote(name):
+        return name.replace('%', '%25').replace('-', '%2D').replace('_', '%5F')
+    stem = u'{}-{}'.format(quote(s1name), quote(s2name))
+    return stem + '_' + components if components else stem
+
+
+def _crop_lags(xcorr, nmax):
+    """
+    Returns the central part of cross-correlation *xcorr*,
+    between lags -/+ *nmax* (samples)
+    """
+    mid = (len(xcorr) - 1) // 2
+    if mid <= nmax:
+        return xcorr
+    return xcorr[mid - nmax:mid + nmax + 1]
+
+
+def _sum_sqdataarrays(xcs):
+    """
+    Returns the sum of the squared stacks (sqdataarray) of cross-
+    correlations or month cross-correlations, or None if any of
+    them is unknown
+    """
+    sqdataarrays = [getattr(xc, 'sqdataarray', None) for xc in xcs]
+    if any(a is None for a in sqdataarrays):
+        return None
+    return sum(sqdataarrays)
+
+
+def _rotation_matrix(station, components, backazimuth):
+    """
+    Returns the matrix rotating the *components* of a (multi-component)
+    station to the radial, transverse and vertical components (in the
+    order of *components*, the horizontal components being replaced
+    with R and T), for a given back-azimuth (deg). The radial direction
+    is along *backazimuth* + 180 deg, and the transverse direction is
+    90 deg clockwise from it.
+
+    Returns None if the azimuths of the horizontal components are unknown.
+
+    @type station: L{psstation.Station}
+    @type components: list of str
+    @type backazimuth: float
+    @rtype: L{numpy.ndarray}
+    """
+    stationazimuths = getattr(station, 'azimuths', {})
+    horizontals = [c for c in components if c != 'Z']
+    if any(c not in stationazimuths for c in horizontals):
+        return None
+
+    # a horizontal component of azimuth a records E.sin(a) + N.cos(a),
+    # so (E, N) = inverse(A).(H1, H2) with A = [[sin(a1), cos(a1)], [sin(a2), cos(a2)]]
+    azimuths = np.radians([stationazimuths[c] for c in horizontals])
+    A = np.column_stack([np.sin(azimuths), np.cos(azimuths)])
+    components_to_en = np.linalg.inv(A)
+
+    # radial and transverse components from E, N
+    ba = np.radians(backazimuth)
+    en_to_rt = np.array([[-np.sin(ba), -np.cos(ba)],
+                         [-np.cos(ba), np.sin(ba)]])
+    rt = en_to_rt.dot(components_to_en)
+
+    matrix = np.zeros((len(components), len(components)))
+    ih = [components.index(c) for c in horizontals]
+    for i, c in enumerate(components):
+        if c == 'Z':
+            matrix[i, i] = 1.0
+        else:
+            matrix[i, ih] = rt[horizontals.index(c)]
+    return matrix
+
+
 def load_pickled_xcorr(pickle_file):
     """
     Loads pickle-dumped cross-correlations
@@ -2578,9 +5378,102 @@ def load_pickled_xcorr(pickle_file):
     f = open(pickle_file,'rb')
     xc = pickle.load(f)
     f.close()
+
+    # SNRs cached after the cross-correlations were dumped (see save_SNRs())
+    SNRspath = _SNRs_file(pickle_file)
+    if os.path.exists(SNRspath):
+        with open(SNRspath, 'rb') as f:
+            SNRcaches = pickle.load(f)
+        for (s1name, s2name, key), cache in SNRcaches.items():
+            keyxc = xc[key] if key else xc
+            if s1name in keyxc and s2name in keyxc[s1name]:
+                keyxc[s1name][s2name]._get_SNRcache().update(cache)
+    return xc
+
+
+def load_xcorr(path, lazy=False):
+    """
+    Loads cross-correlations from a pickle file, or from
+    a chunked store (see CrossCorrelationStore).
+
+    If *lazy* is True, the cross-correlations of a store are
+    loaded lazily (see LazyCrossCorrelationCollection).
+
+    @type path: str or unicode
+    @type lazy: bool
+    @rtype: L{CrossCorrelationCollection} or
+            L{MultiComponentCrossCorrelationCollection}
+    """
+    if not os.path.isdir(path):
+        return load_pickled_xcorr(path)
+
+    store = CrossCorrelationStore(path)
+    if not lazy:
+        return store.to_collection()
+    if not store.components():
+        return LazyCrossCorrelationCollection(store)
+    xc = MultiComponentCrossCorrelationCollection(store.components())
+    for key in xc:
+        xc[key] = LazyCrossCorrelationCollection(store, components=key)
     return xc
 
 
+def save_SNRs(xc, path):
+    """
+    Saves the cached SNRs (see CrossCorrelation.SNR()) of the collection
+    *xc* (single or multi-component) loaded from *path* (see load_xcorr()),
+    e.g., the SNRs calculated by FTANs(), so that they are reused the
+    next time the collection is loaded:
+
+    - if *path* is a store, SNRs.pickle of the store is rewritten
+      (see CrossCorrelationStore.write_SNRs());
+    - if *path* is a pickle file, the SNRs are written to the file
+      *path* without extension + .SNRs.pickle, read along with the
+      pickle file by load_pickled_xcorr().
+
+    @type xc: L{CrossCorrelationCollection} or
+              L{MultiComponentCrossCorrelationCollection}
+    @type path: str or unicode
+    """
+    if isinstance(xc, MultiComponentCrossCorrelationCollection):
+        collections = [(key, xc[key]) for key in xc]
+    else:
+        collections = [(None, xc)]
+
+    SNRcaches = {}
+    for key, keyxc in collections:
+        for s1name, s2name in keyxc.pairs(minday=0):
+            cache = keyxc[s1name][s2name]._get_SNRcache()
+            if cache:
+                SNRcaches[(s1name, s2name, key)] = dict(cache)
+
+    if os.path.isdir(path):
+        CrossCorrelationStore(path).write_SNRs(SNRcaches)
+    else:
+        SNRspath = _SNRs_file(path)
+        tmppath = SNRspath + '.tmp'
+        with open(tmppath, 'wb') as f:
+            pickle.dump(SNRcaches, f, protocol=2)
+        os.rename(tmppath, SNRspath)
+
+
+def _SNRs_file(pickle_file):
+    """
+    Returns the path of the file of the SNRs cached after the
+    cross-correlations of *pickle_file* were dumped (see save_SNRs())
+    """
+    return os.path.splitext(pickle_file)[0] + '.SNRs.pickle'
+
+
+def _remove_SNRs_file(pickle_file):
+    """
+    Removes the file of cached SNRs of *pickle_file* (see save_SNRs()),
+    which does not apply to new cross-correlations dumped to *pickle_file*
+    """
+    if os.path.exists(_SNRs_file(pickle_file)):
+        os.remove(_SNRs_file(pickle_file))
+
+
 def load_pickled_xcorr_interactive(xcorr_dir=CROSSCORR_DIR, xcorr_files='xcorr*.pickle*'):
     """
     Loads interactively pickle-dumped cross-correlations, by giving the user
@@ -2594,6 +5487,7 @@ def load_pickled_xcorr_interactive(xcorr_dir=CROSSCORR_DIR, xcorr_files='xcorr*.
     # looking for files that match xcorrFiles
     pathxcorr = os.path.join(xcorr_dir, xcorr_files)
     flist = glob.glob(pathname=pathxcorr)
+    flist = [f for f in flist if not f.endswith(('.journal.pickle', '.SNRs.pickle'))]
     flist.sort()
 
     pickle_file = None
@@ -2613,6 +5507,189 @@ def load_pickled_xcorr_interactive(xcorr_dir=CROSSCORR_DIR, xcorr_files='xcorr*.
     return xc
 
 
+def _SNRkeys(periodbands=None, centerperiods_and_alpha=None, whiten=False,
+             months=None, vmin=SIGNAL_WINDOW_VMIN, vmax=SIGNAL_WINDOW_VMAX,
+             signal2noise_trail=SIGNAL2NOISE_TRAIL,
+             noise_window_size=NOISE_WINDOW_SIZE):
+    """
+    Returns the keys of the cached SNRs (see CrossCorrelation.SNR())
+    of each band, made of the months, whitening, windows and filter
+    """
+    params = (tuple(sorted(_monthkeys(months))) if months else None, bool(whiten),
+              float(vmin), float(vmax), float(signal2noise_trail),
+              float(noise_window_size))
+    if periodbands:
+        return [params + ('Butterworth', float(tmin), float(tmax))
+                for tmin, tmax in periodbands]
+    elif centerperiods_and_alpha:
+        return [params + ('Gaussian', float(period), float(alpha))
+                for period, alpha in centerperiods_and_alpha]
+    else:
+        return [params + (None,)]
+
+
+def signal_noise_windows(dists, tmax, vmin=SIGNAL_WINDOW_VMIN, vmax=SIGNAL_WINDOW_VMAX,
+                         signal2noise_trail=SIGNAL2NOISE_TRAIL,
+                         noise_window_size=NOISE_WINDOW_SIZE):
+    """
+    Returns the signal windows and the noise windows of cross-correlations
+    of interstation distances *dists* (km) and max time *tmax*, as arrays
+    (tmin_signal, tmax_signal), (tmin_noise, tmax_noise).
+    (See CrossCorrelation.signal_noise_windows().)
+
+    @type dists: float or L{numpy.ndarray}
+    @type tmax: float
+    @rtype: (L{numpy.ndarray}, L{numpy.ndarray}), (L{numpy.ndarray}, L{numpy.ndarray})
+    """
+    # signal window
+    tmin_signal = np.asarray(dists, dtype=float) / vmax
+    tmax_signal = np.asarray(dists, dtype=float) / vmin
+
+    # noise window
+    tmin_noise = tmax_signal + signal2noise_trail
+    tmax_noise = tmin_noise + noise_window_size
+
+    # if the noise window hits the rightmost limit, let's
+    # shift it to the left without crossing the signal window
+    delta = np.where(tmax_noise > tmax,
+                     np.minimum(tmax_noise - tmax, tmin_noise - tmax_signal), 0.0)
+    tmin_noise = tmin_noise - delta
+    tmax_noise = tmax_noise - delta
+
+    return (tmin_signal, tmax_signal), (tmin_noise, tmax_noise)
+
+
+def signal_noise_indexes(timearray, dists, vmin=SIGNAL_WINDOW_VMIN,
+                         vmax=SIGNAL_WINDOW_VMAX,
+                         signal2noise_trail=SIGNAL2NOISE_TRAIL,
+                         noise_window_size=NOISE_WINDOW_SIZE):
+    """
+    Returns the signal windows and the noise windows of cross-correlations
+    sharing the (increasing) time array *timearray*, of interstation
+    distances *dists* (km), as slice bounds of the time array:
+    (istart_signal, istop_signal), (istart_noise, istop_noise), so that
+    timearray[istart:istop] are the times of the window, limits included.
+    (See signal_noise_windows().)
+
+    @type timearray: L{numpy.ndarray}
+    @type dists: float or L{numpy.ndarray}
+    @rtype: (L{numpy.ndarray}, L{numpy.ndarray}), (L{numpy.ndarray}, L{numpy.ndarray})
+    """
+    windows = signal_noise_windows(dists, timearray.max(), vmin, vmax,
+                                   signal2noise_trail, noise_window_size)
+    return tuple((np.searchsorted(timearray, tmin, side='left'),
+                  np.searchsorted(timearray, tmax, side='right'))
+                 for tmin, tmax in windows)
+
+
+def SNR_matrix(timearray, dataarrays, dists, periodbands=None,
+               centerperiods_and_alpha=None,
+               vmin=SIGNAL_WINDOW_VMIN, vmax=SIGNAL_WINDOW_VMAX,
+               signal2noise_trail=SIGNAL2NOISE_TRAIL,
+               noise_window_size=NOISE_WINDOW_SIZE, windows=None):
+    """
+    [spectral] signal-to-noise ratios of several cross-correlations
+    sharing the same (symmetric) time array *timearray*, whose data
+    are the rows of *dataarrays*, and whose interstation distances
+    are *dists*: see CrossCorrelation.SNR().
+
+    All the cross-correlations are band-passed at once for each band:
+    with Butterworth filters along the last axis (if *periodbands*
+    are given), or with Gaussian filters applied to a single Fourier
+    transform of the data (if *centerperiods_and_alpha* are given).
+    The signal and noise windows are converted to index ranges of
+    each cross-correlation, unless already given in *windows* (see
+    signal_noise_indexes()).
+
+    Returns a (nb of cross-corrs x nb of bands) array (nb of bands = 1
+    if no band is given).
+
+    @type timearray: L{numpy.ndarray}
+    @type dataarrays: L{numpy.ndarray}
+    @type dists: L{numpy.ndarray}
+    @type periodbands: (list of (float, float))
+    @type centerperiods_and_alpha: (list of (float, float))
+    @rtype: L{numpy.ndarray}
+    """
+    dataarrays = np.atleast_2d(dataarrays)
+    nlags = dataarrays.shape[-1]
+    dt = timearray[1] - timearray[0]
+
+    # filtered data of each band
+    if periodbands:
+        bands = (psutils.bandpass_butterworth(data=dataarrays, dt=dt,
+                                              periodmin=band[0], periodmax=band[1])
+                 for band in periodbands)
+    elif centerperiods_and_alpha:
+        fft_data = rfft(dataarrays, axis=-1)
+        freq = rfftfreq(nlags, d=dt)
+        f0s = [(1.0 / period, alpha) for period, alpha in centerperiods_and_alpha]
+        bands = (irfft(fft_data * np.exp(-alpha * ((freq - f0) / f0) ** 2),
+                       n=nlags, axis=-1)
+                 for f0, alpha in f0s)
+    else:
+        bands = [dataarrays]
+
+    return _window_SNRs(timearray, bands, dists, vmin=vmin, vmax=vmax,
+                        signal2noise_trail=signal2noise_trail,
+                        noise_window_size=noise_window_size, windows=windows)
+
+
+def _window_SNRs(timearray, bands, dists, vmin=SIGNAL_WINDOW_VMIN,
+                 vmax=SIGNAL_WINDOW_VMAX, signal2noise_trail=SIGNAL2NOISE_TRAIL,
+                 noise_window_size=NOISE_WINDOW_SIZE, windows=None):
+    """
+    SNRs of (already filtered) cross-correlations: peak of the absolute
+    amplitude in the signal window divided by the mean absolute amplitude
+    in the noise window (see CrossCorrelation.SNR()).
+
+    *bands* are (nb of cross-corrs x nb of times) arrays of filtered
+    cross-correlations (one array per band) whose interstation distances
+    are *dists*. Returns a (nb of cross-corrs x nb of bands) array.
+
+    The index ranges of the signal and noise windows can be given in
+    *windows* (see signal_noise_indexes()), in which case *dists* and
+    the window parameters are not used.
+
+    @type timearray: L{numpy.ndarray}
+    @type bands: iterable of L{numpy.ndarray}
+    @type dists: L{numpy.ndarray}
+    @rtype: L{numpy.ndarray}
+    """
+    if windows is None:
+        windows = signal_noise_indexes(timearray, np.atleast_1d(dists), vmin, vmax,
+                                       signal2noise_trail, noise_window_size)
+    (istart_signal, istop_signal), (istart_noise, istop_noise) = \
+        [(np.atleast_1d(istart), np.atleast_1d(istop)) for istart, istop in windows]
+    noise_size = istop_noise - istart_noise
+
+    # the absolute amplitudes of each cross-corr are followed by a
+    # padding zero, so that windows are reduced at once (and without
+    # masks) over the flattened array, from (interleaved) start and
+    # stop indexes
+    nlags = len(timearray)
+    amplitudes = None
+    SNRs = []
+    for filtered in bands:
+        filtered = np.atleast_2d(filtered)
+        if amplitudes is None:
+            amplitudes = np.zeros((filtered.shape[0], nlags + 1))
+            offsets = np.arange(filtered.shape[0]) * (nlags + 1)
+            signal_indexes = np.column_stack((offsets + istart_signal,
+                                              offsets + istop_signal)).ravel()
+            noise_indexes = np.column_stack((offsets + istart_noise,
+                                             offsets + istop_noise)).ravel()
+        np.abs(filtered, out=amplitudes[:, :nlags])
+        flat = amplitudes.ravel()
+        peak = np.maximum.reduceat(flat, signal_indexes)[::2]
+        peak = np.where(istop_signal > istart_signal, peak, 0.0)
+        noise = np.add.reduceat(flat, noise_indexes)[::2]
+        noise = np.where(noise_size > 0, noise, 0.0) / noise_size
+        SNRs.append(peak / noise)
+
+    return np.array(SNRs).T
+
+
 def FTAN(x, dt, periods, alpha, phase_corr=None):
     """
     Frequency-time analysis of a time series.
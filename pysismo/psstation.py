@@ -13,6 +13,7 @@ import os
 import glob
 import pickle
 from copy import copy
+from operator import attrgetter
 import itertools as it
 import numpy as np
 
@@ -26,10 +27,14 @@ class Station:
     """
     Class to hold general station info: name, network, channel,
     base dir, month subdirs and coordinates.
+
+    A multi-component station holds one channel per component
+    (e.g., BHZ, BHN, BHE) in *channels*, *channel* being the first one,
+    and the azimuths of its horizontal components in *azimuths*.
     """
 
     def __init__(self, name, network, channel, filename, basedir,
-                 subdirs=None, coord=None):
+                 subdirs=None, coord=None, channels=None):
         """
         @type name: str
         @type network: str
@@ -38,10 +43,13 @@ class Station:
         @type basedir: str or unicode
         @type subdirs: list of str or unicode
         @type coord: list of (float or None)
+        @type channels: list of str
         """
         self.name = name
         self.network = network
-        self.channel = channel  # only one channel allowed (should be BHZ)
+        self.channel = channel  # only one channel, unless multi-component station
+        self.channels = channels if channels else [channel]
+        self.azimuths = {}  # {component: azimuth (deg) of horizontal component}
         self.file = filename
         self.basedir = basedir
         self.subdirs = subdirs if subdirs else []
@@ -67,30 +75,46 @@ class Station:
              u'Lon, Lat: {0}, {1}'.format(*self.coord)]
         return u'\n'.join(s)
 
-    def getpath(self, date):
+    def getpath(self, date, channel=None):
         """
         Gets path to mseed file (normally residing in subdir 'basedir/yyyy-mm/')
+        of *channel* (default is station's channel)
         @type date: L{UTCDateTime} or L{datetime} or L{date}
+        @type channel: str
         @rtype: unicode
         """
         subdir = '{y:04d}-{m:02d}'.format(y=date.year, m=date.month)
         if not subdir in self.subdirs:
             s = 'No data for station {s} at date {d}!!'
             raise Exception(s.format(s=self.name, d=date.date))
-        path = os.path.join(self.basedir, subdir, self.file)
+        filename = self.file
+        if channel and channel != self.channel:
+            # e.g., BL.CACB.BHZ.mseed -> BL.CACB.BHN.mseed
+            parts = filename.split('.')
+            parts[2] = channel
+            filename = '.'.join(parts)
+        path = os.path.join(self.basedir, subdir, filename)
         return path
 
+    def components(self):
+        """
+        Returns the components of the station (last letter
+        of the channels), e.g., ['Z', 'N', 'E']
+        @rtype: list of str
+        """
+        return [channel[-1] for channel in getattr(self, 'channels', [self.channel])]
+
     def dist(self, other):
         """
         Geodesic distance (in km) between stations, using the
-        WGS-84 ellipsoidal model of the Earth
+        WGS-84 ellipsoidal model of the Earth, taken from the
+        cached matrix of distances of the registry of stations
+        (see L{StationRegistry})
 
         @type other: L{Station}
         @rtype: float
         """
-        lon1, lat1 = self.coord
-        lon2, lat2 = other.coord
-        return psutils.dist(lons1=lon1, lats1=lat1, lons2=lon2, lats2=lat2)
+        return registry.dist(self, other)
 
     # =================
     # Boolean operators
@@ -135,6 +159,182 @@ class Station:
         return not self.__lt__(other)
 
 
+# name, network and channel of a station (see Station.BOOLATTRS)
+_boolattrs = attrgetter(*Station.BOOLATTRS)
+
+# generations of the registries of stations (see StationRegistry.clear())
+_generations = it.count()
+
+
+class StationRegistry:
+    """
+    Registry of stations, holding the matrices of geodesic distances
+    and azimuths between all the registered stations.
+
+    Stations are registered (and indexed) by their name, network and
+    channel (see L{Station.BOOLATTRS}), as they are compared by
+    Station.__eq__(). A station registered again with other coordinates
+    (i.e., relocated) keeps its index and replaces the previous one.
+    Distances and azimuths of new or relocated stations are calculated,
+    in one batched geodesic call, the next time the matrices are needed,
+    and cached (in arrays whose capacity is doubled when full, so that
+    registering stations one at a time does not copy the matrices
+    each time).
+
+    Pair objects (cross-correlations, dispersion curves) reference
+    their stations by their indices in the module's *registry*, valid
+    as long as its *generation* is unchanged, i.e., until the registry
+    is emptied with clear().
+    """
+
+    def __init__(self, stations=()):
+        """
+        @type stations: list of L{Station}
+        """
+        self.clear()
+        for station in stations:
+            self.index(station)
+
+    def __len__(self):
+        return len(self.stations)
+
+    def __repr__(self):
+        return '<Registry of {} stations>'.format(len(self))
+
+    def clear(self):
+        """
+        Empties the registry (e.g., to release the matrices of distances
+        and azimuths of the stations of a previous job) and starts a new
+        generation, so that the indices cached by pair objects are
+        recalculated
+        """
+        self.stations = []
+        self._indices = {}
+        self.generation = next(_generations)
+        # nb of stations whose distances and azimuths are calculated,
+        # and indices of relocated stations whose ones must be updated
+        self._ncalc = 0
+        self._relocated = set()
+        self._dists = np.zeros((0, 0))
+        self._azimuths = np.zeros((0, 0))
+
+    def index(self, station):
+        """
+        Returns the index of *station* in the registry,
+        registering it if needed (or replacing the registered
+        station if *station* has been relocated)
+
+        @type station: L{Station}
+        @rtype: int
+        """
+        key = _boolattrs(station)
+        i = self._indices.get(key)
+        if i is None:
+            i = self._indices[key] = len(self.stations)
+            self.stations.append(station)
+        elif tuple(self.stations[i].coord) != tuple(station.coord):
+            # relocated station
+            self.stations[i] = station
+            self._relocated.add(i)
+        return i
+
+    def indices(self, stations):
+        """
+        Returns the indices of *stations* in the registry,
+        registering them if needed
+
+        @type stations: list of L{Station}
+        @rtype: L{numpy.ndarray}
+        """
+        return np.array([self.index(station) for station in stations], dtype=int)
+
+    def _update(self):
+        """
+        Calculates the distances and azimuths between the stations
+        registered (or relocated) since the last update and all the
+        stations, in one batched geodesic call
+        """
+        nold, n = self._ncalc, len(self.stations)
+        irows = sorted(i for i in self._relocated if i < nold) + list(range(nold, n))
+        self._relocated = set()
+        if not irows:
+            return
+
+        if n > len(self._dists):
+            capacity = max(n, 2 * len(self._dists))
+            dists = np.zeros((capacity, capacity))
+            azimuths = np.zeros((capacity, capacity))
+            dists[:nold, :nold] = self._dists[:nold, :nold]
+            azimuths[:nold, :nold] = self._azimuths[:nold, :nold]
+            self._dists = dists
+            self._azimuths = azimuths
+
+        # new or relocated stations (rows) x all stations (columns)
+        coords = np.array([[np.nan if x is None else x for x in station.coord]
+                           for station in self.stations], dtype=float)
+        inew, iall = np.meshgrid(irows, np.arange(n), indexing='ij')
+        inew, iall = inew.ravel(), iall.ravel()
+        az12, az21, d = psutils.wgs84.inv(lons1=coords[inew, 0], lats1=coords[inew, 1],
+                                          lons2=coords[iall, 0], lats2=coords[iall, 1])
+
+        # the back-azimuth at station 2 is the azimuth from station 2 to station 1
+        self._dists[inew, iall] = self._dists[iall, inew] = np.array(d) / 1000.0
+        self._azimuths[inew, iall] = az12
+        self._azimuths[iall, inew] = az21
+        self._ncalc = n
+
+    def dists(self):
+        """
+        Returns the (cached) matrix of geodesic distances (km) between
+        the registered stations, using the WGS-84 ellipsoidal model
+        of the Earth
+
+        @rtype: L{numpy.ndarray}
+        """
+        self._update()
+        return self._dists[:self._ncalc, :self._ncalc]
+
+    def azimuths(self):
+        """
+        Returns the (cached) matrix of azimuths between the registered
+        stations: azimuths[i, j] = azimuth (deg clockwise from north)
+        of the geodesic from station i to station j, at station i
+
+        @rtype: L{numpy.ndarray}
+        """
+        self._update()
+        return self._azimuths[:self._ncalc, :self._ncalc]
+
+    def dist(self, station1, station2):
+        """
+        Geodesic distance (km) between *station1* and *station2*
+
+        @type station1: L{Station}
+        @type station2: L{Station}
+        @rtype: float
+        """
+        i1, i2 = self.index(station1), self.index(station2)
+        self._update()
+        return self._dists[i1, i2]
+
+    def azimuth(self, station1, station2):
+        """
+        Azimuth (deg clockwise from north) of the geodesic
+        from *station1* to *station2*, at *station1*
+
+        @type station1: L{Station}
+        @type station2: L{Station}
+        @rtype: float
+        """
+        i1, i2 = self.index(station1), self.index(station2)
+        self._update()
+        return self._azimuths[i1, i2]
+
+
+# registry of stations (and of their distances) of the session
+registry = StationRegistry()
+
+
 def get_stats(filepath, channel='BHZ', fast=True):
     """
     Returns stats on channel *channel* of stations
@@ -192,18 +392,26 @@ def get_stats(filepath, channel='BHZ', fast=True):
 
 def get_stations(mseed_dir=MSEED_DIR, xml_inventories=(), dataless_inventories=(),
                  networks=None, startday=None, endday=None, coord_tolerance=1E-4,
-                 verbose=True):
+                 components=None, verbose=True):
     """
     Gets the list of stations from miniseed files, and
     extracts information from StationXML and dataless
     inventories.
 
+    If a list of *components* is given (e.g., ['Z', 'N', 'E']), the
+    channels of each station ending with these components are gathered
+    into a multi-component station, whose month subdirs are those
+    containing all the components. Stations missing a component are
+    skipped. The azimuths of the horizontal components are read in the
+    StationXML inventories (N and E components default to 0 and 90 deg).
+
     @type mseed_dir: str or unicode
     @type xml_inventories: list of L{obspy.station.inventory.Inventory}
     @type dataless_inventories: list of L{obspy.io.xseed.parser.Parser})
     @type networks: list of str
     @type startday: L{datetime.date}
     @type endday: L{datetime.date}
+    @type components: list of str
     @rtype: list of L{Station}
     """
     if verbose:
@@ -227,6 +435,8 @@ def get_stations(mseed_dir=MSEED_DIR, xml_inventories=(), dataless_inventories=(
         network, name, channel = filename.split('.')[0:3]
         if networks and network not in networks:
             continue
+        if components and channel[-1] not in components:
+            continue
 
         # looking for station in list
         try:
@@ -241,6 +451,10 @@ def get_stations(mseed_dir=MSEED_DIR, xml_inventories=(), dataless_inventories=(
             # appending subdir to list of subdirs of station
             station.subdirs.append(subdir)
 
+    if components:
+        # gathering the channels of each station into a multi-component station
+        stations = _gather_components(stations, components, verbose=verbose)
+
     if verbose:
         print('Found {0} stations'.format(len(stations)))
 
@@ -292,9 +506,82 @@ def get_stations(mseed_dir=MSEED_DIR, xml_inventories=(), dataless_inventories=(
                     print(s.format(repr(sta), maxdiff_lon, maxdiff_lat))
                 stations.remove(sta)
 
+    if components:
+        # azimuths of horizontal components
+        for sta in stations:
+            _set_azimuths(sta, xml_inventories, verbose=verbose)
+
     return stations
 
 
+def _gather_components(stations, components, verbose=True):
+    """
+    Gathers the single-channel stations sharing the same network
+    and name into multi-component stations (see get_stations())
+
+    @type stations: list of L{Station}
+    @type components: list of str
+    @rtype: list of L{Station}
+    """
+    mcstations = []
+    groups = it.groupby(sorted(stations, key=lambda s: (s.network, s.name)),
+                        key=lambda s: (s.network, s.name))
+    for (network, name), group in groups:
+        group = list(group)
+        channels = []
+        for component in components:
+            compstations = sorted(s for s in group if s.channel[-1] == component)
+            if len(compstations) > 1 and verbose:
+                s = "WARNING: several channels for component {} of {}.{}: keeping {}"
+                print(s.format(component, network, name, compstations[0].channel))
+            if compstations:
+                channels.append(compstations[0])
+
+        if len(channels) < len(components):
+            if verbose:
+                s = "WARNING: skipping {}.{} as some of the components {} are missing"
+                print(s.format(network, name, ''.join(components)))
+            continue
+
+        # month subdirs containing all the components
+        subdirs = set.intersection(*[set(s.subdirs) for s in channels])
+        mcstations.append(Station(name=name, network=network,
+                                  channel=channels[0].channel,
+                                  filename=channels[0].file,
+                                  basedir=channels[0].basedir,
+                                  subdirs=sorted(subdirs),
+                                  channels=[s.channel for s in channels]))
+    return mcstations
+
+
+def _set_azimuths(station, xml_inventories=(), verbose=True):
+    """
+    Sets the azimuths of the horizontal components of a multi-component
+    station, from the channels of StationXML inventories. N and E
+    components default to 0 and 90 deg if not found.
+
+    @type station: L{Station}
+    @type xml_inventories: list of L{obspy.station.inventory.Inventory}
+    """
+    station.azimuths = {}
+    for channel in station.channels:
+        component = channel[-1]
+        if component == 'Z':
+            continue
+        azimuths = set(c.azimuth for inv in xml_inventories for net in inv
+                       for s in net.stations for c in s.channels
+                       if net.code == station.network and s.code == station.name
+                       and c.code == channel and c.azimuth is not None)
+        if len(azimuths) == 1:
+            station.azimuths[component] = azimuths.pop()
+        elif not azimuths and component in ('N', 'E'):
+            station.azimuths[component] = 0.0 if component == 'N' else 90.0
+        elif verbose:
+            s = ("WARNING: no (unique) azimuth found for channel {} of {}: "
+                 "its horizontal components cannot be rotated")
+            print(s.format(channel, repr(station)))
+
+
 def get_stationxml_inventories(stationxml_dir=STATIONXML_DIR, verbose=False):
     """
     Reads inventories in all StationXML (*.xml) files
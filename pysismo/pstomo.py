@@ -3,7 +3,7 @@ Definition of classes handling dispersion curves and
 velocity maps (obtained by inverting dispersion curves)
 """
 
-from pysismo import pserrors, psutils, psdepthmodel
+from pysismo import pserrors, psstation, psutils, psdepthmodel
 import itertools as it
 import numpy as np
 from scipy.optimize import curve_fit
@@ -11,6 +11,7 @@ from scipy.interpolate import interp1d
 import os
 import glob
 import pickle
+import warnings
 import matplotlib.pyplot as plt
 from matplotlib.colors import LinearSegmentedColormap
 from matplotlib import gridspec
@@ -161,6 +162,19 @@ class DispersionCurve:
         # list of (nominal period, instantaneous period)
         self.nom2inst_periods = nom2inst_periods
 
+        # cached indices of the stations in the registry of stations
+        # (see _get_stationindices())
+        self._stationindices = None
+
+    def __getstate__(self):
+        """
+        The cached indices of the stations in the
+        registry of stations are not pickled
+        """
+        state = self.__dict__.copy()
+        state.pop('_stationindices', None)
+        return state
+
     def __repr__(self):
         return 'Dispersion curve between stations {}-{}'.format(self.station1.name,
                                                                 self.station2.name)
@@ -196,11 +210,30 @@ class DispersionCurve:
         if not minwavelengthfactor is None:
             self.minwavelengthfactor = minwavelengthfactor
 
+    def _get_stationindices(self):
+        """
+        Returns the indices of the stations of the pair in the
+        registry of stations (see L{psstation.StationRegistry}),
+        cached (but not pickled) in self._stationindices along
+        with the generation of the registry they are valid for
+
+        @rtype: (int, int)
+        """
+        registry = psstation.registry
+        cache = getattr(self, '_stationindices', None)
+        if cache is None or cache[0] != registry.generation:
+            self._stationindices = (registry.generation,
+                                    registry.index(self.station1),
+                                    registry.index(self.station2))
+        return self._stationindices[1:]
+
     def dist(self):
         """
-        Interstation spacing (km)
+        Interstation spacing (km), taken from the cached matrix
+        of distances of the registry of stations
         """
-        return self.station1.dist(self.station2)
+        i1, i2 = self._get_stationindices()
+        return psstation.registry.dists()[i1, i2]
 
     def add_trimester(self, trimester_start, curve_trimester):
         """
@@ -380,7 +413,7 @@ class DispersionCurve:
         @rtype: list of L{numpy.ndarray}
         """
         # filtering criterion: periods <= distance * maxperiodfactor
-        dist = self.station1.dist(self.station2)
+        dist = self.dist()
         if not self.usewavelengthcutoff:
             periodmask = self.periods <= self.maxperiodfactor * dist
         varrays = []
@@ -505,6 +538,361 @@ class DispersionCurve:
         return kval
 
 
+class DispersionCurveSet:
+    """
+    Array-backed set of dispersion curves sharing the same periods,
+    holding their velocities, SNRs etc. in (nb of curves x nb of periods)
+    arrays, and their 12 trimester velocities and SNRs in (nb of curves
+    x 12 x nb of periods) arrays, instead of one L{DispersionCurve} per
+    pair of stations:
+
+    - periods                   : periods of the curves
+    - v, phase, SNRs            : group velocities, phases and spectral SNRs
+                                  (nan if SNRs not defined, see hasSNRs)
+    - vphase, kval              : phase velocities and k values (nan if not
+                                  calculated, see hasvphase)
+    - v_trimesters,
+      SNRs_trimesters           : trimester velocities and SNRs (trimester
+                                  starting with month i at index i - 1)
+    - trimesters                : is trimester velocity curve defined?
+    - hasSNRs_trimesters        : are trimester SNRs defined?
+    - coords1, coords2          : (lon, lat) of the stations of the curves
+    - selection parameters      : see L{DispersionCurve} (one value per curve)
+
+    The stations (and the list of nominal/instantaneous periods) of the
+    curves are kept in lists.
+
+    The set converts losslessly from and to a list of dispersion curves
+    (see from_curves(), to_curves()), and is saved to a dir containing
+    one .npy file per array, which can be memory-mapped at loading
+    (see save(), load()). The curves of the set are filtered all at
+    once, without building the curves (see update_parameters() and
+    filtered_vels_sdevs()).
+    """
+    ARRAYS = ['v', 'phase', 'SNRs', 'hasSNRs', 'vphase', 'kval', 'hasvphase',
+              'v_trimesters', 'SNRs_trimesters', 'trimesters', 'hasSNRs_trimesters',
+              'coords1', 'coords2']
+    PARAMETERS = ['minspectSNR', 'minspectSNR_nosdev', 'maxsdev', 'minnbtrimester',
+                  'maxperiodfactor', 'usewavelengthcutoff', 'minwavelengthfactor']
+
+    def __init__(self, periods, ncurve=0):
+        """
+        Initializes an empty set of *ncurve* dispersion curves
+        (with nan velocities) at *periods*
+
+        @type periods: iterable
+        @type ncurve: int
+        """
+        self.periods = np.array(periods)
+        nperiod = len(self.periods)
+
+        nans = lambda *shape: np.nan * np.zeros(shape)
+        self.v = nans(ncurve, nperiod)
+        self.phase = nans(ncurve, nperiod)
+        self.SNRs = nans(ncurve, nperiod)
+        self.hasSNRs = np.zeros(ncurve, dtype=bool)
+        self.vphase = nans(ncurve, nperiod)
+        self.kval = nans(ncurve, nperiod)
+        self.hasvphase = np.zeros(ncurve, dtype=bool)
+        self.v_trimesters = nans(ncurve, 12, nperiod)
+        self.SNRs_trimesters = nans(ncurve, 12, nperiod)
+        self.trimesters = np.zeros((ncurve, 12), dtype=bool)
+        self.hasSNRs_trimesters = np.zeros((ncurve, 12), dtype=bool)
+        self.coords1 = nans(ncurve, 2)
+        self.coords2 = nans(ncurve, 2)
+        self.parameters = np.zeros(ncurve, dtype=[(p, float) for p in self.PARAMETERS])
+
+        self.stations1 = [None] * ncurve
+        self.stations2 = [None] * ncurve
+        self.nom2inst_periods = [None] * ncurve
+
+    def __repr__(self):
+        return 'Set of {} dispersion curves'.format(len(self))
+
+    def __len__(self):
+        return len(self.v)
+
+    def __getitem__(self, i):
+        """
+        Returns the *i*th dispersion curve of the set
+        @rtype: L{DispersionCurve}
+        """
+        params = {p: self.parameters[p][i].item() for p in self.PARAMETERS}
+        params['minnbtrimester'] = int(params['minnbtrimester'])
+        params['usewavelengthcutoff'] = bool(params['usewavelengthcutoff'])
+        curve = DispersionCurve(periods=self.periods,
+                                v=self.v[i],
+                                station1=self.stations1[i],
+                                station2=self.stations2[i],
+                                phase=self.phase[i],
+                                nom2inst_periods=self.nom2inst_periods[i],
+                                **params)
+        if self.hasSNRs[i]:
+            curve._SNRs = np.array(self.SNRs[i])
+        for itrimester in np.nonzero(self.trimesters[i])[0]:
+            trimester_start = int(itrimester) + 1
+            curve.v_trimesters[trimester_start] = np.array(self.v_trimesters[i, itrimester])
+            curve._SNRs_trimesters[trimester_start] = (
+                np.array(self.SNRs_trimesters[i, itrimester])
+                if self.hasSNRs_trimesters[i, itrimester] else None)
+        if self.hasvphase[i]:
+            curve.vphase = np.array(self.vphase[i])
+            curve.kval = np.array(self.kval[i])
+        return curve
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    @staticmethod
+    def from_curves(curves):
+        """
+        Returns the set of the dispersion curves *curves*,
+        which must share the same periods
+
+        @type curves: list of L{DispersionCurve}
+        @rtype: L{DispersionCurveSet}
+        """
+        if not curves:
+            raise Exception("No dispersion curve to put in set")
+        curveset = DispersionCurveSet(periods=curves[0].periods, ncurve=len(curves))
+
+        for i, c in enumerate(curves):
+            if len(c.periods) != len(curveset.periods) or \
+                    np.any(np.abs(c.periods - curveset.periods) > EPS):
+                raise Exception("Dispersion curves of a set must share the same periods")
+
+            curveset.v[i] = c.v
+            curveset.phase[i] = c.phase
+            if c._SNRs is not None:
+                curveset.SNRs[i] = c._SNRs
+                curveset.hasSNRs[i] = True
+            if hasattr(c, 'vphase'):
+                curveset.vphase[i] = c.vphase
+                curveset.kval[i] = c.kval
+                curveset.hasvphase[i] = True
+            for trimester_start, vels in c.v_trimesters.items():
+                curveset.v_trimesters[i, trimester_start - 1] = vels
+                curveset.trimesters[i, trimester_start - 1] = True
+                SNRs = c._SNRs_trimesters.get(trimester_start)
+                if SNRs is not None:
+                    curveset.SNRs_trimesters[i, trimester_start - 1] = SNRs
+                    curveset.hasSNRs_trimesters[i, trimester_start - 1] = True
+            curveset.coords1[i] = c.station1.coord
+            curveset.coords2[i] = c.station2.coord
+            for p in DispersionCurveSet.PARAMETERS:
+                curveset.parameters[p][i] = getattr(c, p)
+
+            curveset.stations1[i] = c.station1
+            curveset.stations2[i] = c.station2
+            curveset.nom2inst_periods[i] = c.nom2inst_periods
+
+        return curveset
+
+    def to_curves(self):
+        """
+        Returns the list of dispersion curves of the set
+
+        @rtype: list of L{DispersionCurve}
+        """
+        return list(self)
+
+    def update_parameters(self, **kwargs):
+        """
+        Updating one or more filtering parameter(s) of all the curves
+        (see DispersionCurve.update_parameters())
+        """
+        unknown = set(kwargs) - set(self.PARAMETERS)
+        if unknown:
+            raise Exception("Unknown parameter(s): {}".format(', '.join(sorted(unknown))))
+        for p, value in kwargs.items():
+            if value is not None:
+                self.parameters[p] = value
+
+    def save(self, path):
+        """
+        Saves the set to dir *path*, containing one .npy file per array
+        and the stations (and nominal/instantaneous periods) of the curves
+        in metadata.pickle. An existing set is backed up as *path*~.
+
+        @type path: str or unicode
+        """
+        tmppath = path + '.tmp'
+        if os.path.exists(tmppath):
+            shutil.rmtree(tmppath)
+        os.makedirs(tmppath)
+
+        for name in ['periods', 'parameters'] + self.ARRAYS:
+            np.save(os.path.join(tmppath, name + '.npy'), getattr(self, name))
+        metadata = {'stations1': self.stations1,
+                    'stations2': self.stations2,
+                    'nom2inst_periods': self.nom2inst_periods}
+        with open(os.path.join(tmppath, 'metadata.pickle'), 'wb') as f:
+            pickle.dump(metadata, f, protocol=2)
+
+        # replacing existing set, backed up
+        if os.path.exists(path):
+            if os.path.exists(path + '~'):
+                shutil.rmtree(path + '~')
+            os.rename(path, path + '~')
+        os.rename(tmppath, path)
+
+    @staticmethod
+    def load(path, mmap=True):
+        """
+        Loads the set saved in dir *path* (see save()), memory-mapping
+        its arrays (read-only) if *mmap* is True. The selection parameters
+        are always read in memory, so that they can be updated.
+
+        @type path: str or unicode
+        @type mmap: bool
+        @rtype: L{DispersionCurveSet}
+        """
+        curveset = DispersionCurveSet(periods=np.load(os.path.join(path, 'periods.npy')))
+        curveset.parameters = np.load(os.path.join(path, 'parameters.npy'))
+        mmap_mode = 'r' if mmap else None
+        for name in DispersionCurveSet.ARRAYS:
+            setattr(curveset, name, np.load(os.path.join(path, name + '.npy'),
+                                            mmap_mode=mmap_mode))
+        with open(os.path.join(path, 'metadata.pickle'), 'rb') as f:
+            metadata = pickle.load(f)
+        curveset.stations1 = metadata['stations1']
+        curveset.stations2 = metadata['stations2']
+        curveset.nom2inst_periods = metadata['nom2inst_periods']
+        return curveset
+
+    def dists(self):
+        """
+        Interstation spacings (km) of the curves, taken from the
+        cached matrix of distances of the registry of stations
+
+        @rtype: L{numpy.ndarray}
+        """
+        i1 = psstation.registry.indices(self.stations1)
+        i2 = psstation.registry.indices(self.stations2)
+        return psstation.registry.dists()[i1, i2]
+
+    def filtered_sdevs(self):
+        """
+        Standard dev of velocity of each curve at each period, calculated
+        across trimester velocity curves (see DispersionCurve.filtered_sdevs()),
+        as a (nb of curves x nb of periods) array. Raises an Exception if
+        the SNRs of a trimester velocity curve are not defined.
+
+        @rtype: L{numpy.ndarray}
+        """
+        if np.any(self.trimesters & ~self.hasSNRs_trimesters):
+            raise Exception("Spectral SNRs not defined")
+
+        dists = self.dists()[:, np.newaxis, np.newaxis]
+        params = self.parameters
+        periods = self.periods[np.newaxis, np.newaxis, :]
+
+        # filtering criteria of trimester velocities (see
+        # DispersionCurve.filtered_trimester_vels())
+        with np.errstate(invalid='ignore', divide='ignore'):
+            periodmask = np.where(
+                params['usewavelengthcutoff'][:, np.newaxis, np.newaxis].astype(bool),
+                periods <= dists / (params['minwavelengthfactor'][:, np.newaxis, np.newaxis] *
+                                    self.v_trimesters),
+                periods <= params['maxperiodfactor'][:, np.newaxis, np.newaxis] * dists)
+        mask = periodmask & \
+            (np.nan_to_num(self.SNRs_trimesters) >= params['minspectSNR'][:, np.newaxis, np.newaxis])
+        mask &= self.trimesters[:, :, np.newaxis]
+        varrays = np.where(mask, self.v_trimesters, np.nan)
+
+        # std dev where nb of trimester velocities >= minnbtrimester
+        ntrimester = np.sum(~np.isnan(varrays), axis=1)
+        with np.errstate(invalid='ignore'), warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            sdevs = np.nanstd(varrays, axis=1)
+        return np.where(ntrimester >= params['minnbtrimester'][:, np.newaxis], sdevs, np.nan)
+
+    def filtered_vels_sdevs(self, vtype='group'):
+        """
+        Returns the (nb of curves x nb of periods) arrays of velocities and
+        of associated standard deviations of the curves, velocities not
+        passing the selection criteria being replaced with nans (see
+        DispersionCurve.filtered_vels_sdevs()). Raises an Exception if
+        the SNRs of a curve are not defined. Phase velocities of curves
+        without phase velocities (if *vtype* = 'phase') are nans.
+
+        @type vtype: str
+        @rtype: L{numpy.ndarray}, L{numpy.ndarray}
+        """
+        if not np.all(self.hasSNRs):
+            raise Exception("Spectral SNRs not defined")
+
+        sdevs = self.filtered_sdevs()
+        has_sdev = ~np.isnan(sdevs)
+        dists = self.dists()[:, np.newaxis]
+        params = self.parameters
+        SNRs = np.nan_to_num(self.SNRs)
+
+        # 1) period <= distance * *maxperiodfactor*, or
+        #    period <= distance / (*minwavelengthfactor* * v)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            goodperiods = np.nan_to_num(dists / (params['minwavelengthfactor'][:, np.newaxis] *
+                                                 self.v))
+            mask = np.where(params['usewavelengthcutoff'][:, np.newaxis].astype(bool),
+                            self.periods <= goodperiods,
+                            self.periods <= params['maxperiodfactor'][:, np.newaxis] * dists)
+
+        # 2) for velocities having a standard deviation associated:
+        #    standard deviation <= *maxsdev* and SNR >= *minspectSNR*
+        # 3) for velocities NOT having a standard deviation associated:
+        #    SNR >= *minspectSNR_nosdev*
+        with np.errstate(invalid='ignore'):
+            mask &= np.where(has_sdev,
+                             (sdevs <= params['maxsdev'][:, np.newaxis]) &
+                             (SNRs >= params['minspectSNR'][:, np.newaxis]),
+                             SNRs >= params['minspectSNR_nosdev'][:, np.newaxis])
+
+        if vtype == 'group':
+            return np.where(mask, self.v, np.nan), sdevs
+        elif vtype == 'phase':
+            # excluding vphase if less than vgroup
+            mask &= ~(self.vphase <= self.v) & self.hasvphase[:, np.newaxis]
+            return np.where(mask, self.vphase, np.nan), sdevs
+
+
+def load_dispersion_curves(path):
+    """
+    Loads the list of dispersion curves exported by FTAN, either
+    pickled in file *path* or saved as a L{DispersionCurveSet}
+    in dir *path* (*.dcset).
+
+    The curves of a set are built from its arrays, as needed by the
+    tomographic inversion (see L{VelocityMap}): use
+    load_dispersion_curveset() to exploit the arrays of the set.
+
+    @type path: str or unicode
+    @rtype: list of L{DispersionCurve}
+    """
+    if os.path.isdir(path):
+        return DispersionCurveSet.load(path).to_curves()
+
+    f = open(path, 'rb')
+    curves = pickle.load(f)
+    f.close()
+    return curves
+
+
+def load_dispersion_curveset(path, mmap=True):
+    """
+    Loads the dispersion curves exported by FTAN as a L{DispersionCurveSet},
+    either saved as a set in dir *path* (*.dcset), whose arrays are
+    memory-mapped if *mmap* is True, or pickled (as a list of curves)
+    in file *path*
+
+    @type path: str or unicode
+    @type mmap: bool
+    @rtype: L{DispersionCurveSet}
+    """
+    if os.path.isdir(path):
+        return DispersionCurveSet.load(path, mmap=mmap)
+    return DispersionCurveSet.from_curves(load_dispersion_curves(path))
+
+
 class Grid:
     """
     Class holding a 2D regular rectangular spatial grid
@@ -1264,6 +1652,15 @@ class VelocityMap:
         norm = abs(vpred - self.v0).sum()
         return norm
 
+    def covmopt_diag(self):
+        """
+        Returns the diagonal of the covariance matrix of the
+        best-fitting parameters (see CompactVelocityMap.covmopt_diag())
+
+        @rtype: L{numpy.ndarray}
+        """
+        return np.array(self.covmopt.diagonal()).flatten()
+
     def checkerboard_func(self, vmid, vmin, vmax, squaresize, shape='cos'):
         """
         Returns a checkerboard function, f(lons, lats), whose background
@@ -1689,6 +2086,325 @@ class VelocityMap:
             ax.text(x, y, label, ha='center', va='bottom', fontsize=10, weight='bold')
 
 
+class CompactVelocityMap:
+    """
+    Light-weight velocity map at a given period, read from a
+    L{VelocityMapSet}, holding the results needed to exploit
+    the map (reference velocity, grid, best-fitting model...)
+    without the matrices of the inversion:
+
+    - period, vtype, v0, grid : see L{VelocityMap}
+    - mopt                    : best-fitting model, as a (nb of nodes x 1) matrix
+    - density, Rradius        : path density and spatial resolution at nodes
+    (fields not exported in the set are None)
+
+    The diagonal of the covariance matrix of mopt is accessed with
+    covmopt_diag(), as for L{VelocityMap}, and the resolution matrix
+    (if exported in the set, in float32) is loaded on demand from
+    the set's dir (see R()).
+    """
+    def __init__(self, period, vtype, v0, grid, mopt, density=None,
+                 Rradius=None, covmopt_diag=None, Rpath=None):
+        self.period = period
+        self.vtype = vtype
+        self.v0 = v0
+        self.grid = grid
+        self.mopt = np.matrix(mopt).T
+        self.density = density
+        self.Rradius = Rradius
+        self._covmopt_diag = covmopt_diag
+        self._Rpath = Rpath
+
+    def __repr__(self):
+        """
+        E.g., "<Compact velocity map at period = 10 s>"
+        """
+        return '<Compact velocity map at period = {} s>'.format(self.period)
+
+    def R(self, mmap=True):
+        """
+        Returns the resolution matrix (float32) of the map,
+        memory-mapped (read-only) if *mmap* is True
+
+        @type mmap: bool
+        @rtype: L{numpy.ndarray}
+        """
+        if not self._Rpath:
+            raise Exception("Resolution matrix was not exported")
+        return np.load(self._Rpath, mmap_mode='r' if mmap else None)
+
+    def covmopt_diag(self):
+        """
+        Returns the diagonal of the covariance matrix of the
+        best-fitting parameters
+
+        @rtype: L{numpy.ndarray}
+        """
+        if self._covmopt_diag is None:
+            raise Exception("Diagonal of covariance matrix (covmopt_diag) was not "
+                            "exported: see TOMO_COMPACT_FIELDS")
+        return self._covmopt_diag
+
+    def velocities(self):
+        """
+        Velocities at the nodes of the grid
+
+        @rtype: L{numpy.ndarray}
+        """
+        return np.array(self.v0 / (1 + self.mopt)).flatten()
+
+
+class VelocityMapSet:
+    """
+    Compact export of the velocity maps of a tomographic inversion,
+    {period: L{VelocityMap}}, keeping only the fields needed to exploit
+    the maps (see VelocityMapSet.FIELDS) instead of pickling the dense
+    matrices (G, Q, covmopt, R...), paths and dispersion curves of
+    each map.
+
+    The maps of all periods are put on a common grid (the union of
+    the maps' grids, which must be aligned), so that each field
+    is held in a (nb of periods x nb of lats x nb of lons) array
+    (nan outside the grid of a period). The set is saved to a dir
+    containing one .npy file per field, plus one .npy file per
+    period for the resolution matrices if exported (in float32),
+    which are memory-mapped at loading.
+
+    Velocity maps are retrieved as instances of L{CompactVelocityMap}
+    with set[period].
+    """
+    FIELDS = ['mopt', 'density', 'Rradius', 'covmopt_diag']
+
+    def __init__(self, periods, vtype, v0, grids, grid, fields, R=False):
+        """
+        @type periods: L{numpy.ndarray}
+        @type vtype: str
+        @type v0: L{numpy.ndarray}
+        @type grids: list of L{Grid}
+        @type grid: L{Grid}
+        @type fields: dict of (str, L{numpy.ndarray})
+        @type R: bool
+        """
+        self.periods = periods
+        self.vtype = vtype
+        self.v0 = v0
+        self.grids = grids
+        self.grid = grid
+        self.fields = fields
+        self.hasR = R
+        self._path = None
+        self._R = None
+
+    def __repr__(self):
+        return '<Set of {} compact velocity maps>'.format(len(self.periods))
+
+    def __len__(self):
+        return len(self.periods)
+
+    def __getitem__(self, period):
+        """
+        Returns the velocity map at *period*
+
+        @rtype: L{CompactVelocityMap}
+        """
+        iperiod = self._iperiod(period)
+        grid = self.grids[iperiod]
+        ix, iy = self._grid_indexes(grid)
+
+        fields = {}
+        for name in self.FIELDS:
+            if name in self.fields:
+                fields[name] = np.array(self.fields[name][iperiod, iy, ix])
+
+        Rpath = None
+        if self.hasR and self._path:
+            Rpath = os.path.join(self._path, 'R_{}.npy'.format(iperiod))
+
+        return CompactVelocityMap(period=self.periods[iperiod], vtype=self.vtype,
+                                  v0=self.v0[iperiod], grid=grid, Rpath=Rpath,
+                                  **fields)
+
+    def __iter__(self):
+        return iter(self.periods)
+
+    def keys(self):
+        return list(self.periods)
+
+    def items(self):
+        return [(period, self[period]) for period in self.periods]
+
+    def velocities(self):
+        """
+        Velocities of all periods on the common grid, as a
+        (nb of periods x nb of lats x nb of lons) array
+
+        @rtype: L{numpy.ndarray}
+        """
+        return self.v0[:, np.newaxis, np.newaxis] / (1 + np.asarray(self.fields['mopt']))
+
+    @staticmethod
+    def from_vmaps(vmaps, fields=None, R=False):
+        """
+        Returns the compact set of velocity maps *vmaps*, keeping
+        fields *fields* (default: all fields, mopt being always kept)
+        and the resolution matrices if *R* is True
+
+        @type vmaps: dict of (float, L{VelocityMap})
+        @type fields: list of str
+        @type R: bool
+        @rtype: L{VelocityMapSet}
+        """
+        if fields is None:
+            fields = VelocityMapSet.FIELDS
+        unknown = set(fields) - set(VelocityMapSet.FIELDS)
+        if unknown:
+            raise Exception("Unknown field(s): {}".format(', '.join(sorted(unknown))))
+        fields = [f for f in VelocityMapSet.FIELDS if f == 'mopt' or f in fields]
+
+        periods = np.array(sorted(vmaps.keys()))
+        maps = [vmaps[period] for period in periods]
+        vtypes = set(vmap.vtype for vmap in maps)
+        if len(vtypes) > 1:
+            raise Exception("Velocity maps must be of the same type")
+
+        # common grid = union of the grids of the maps
+        grids = [vmap.grid for vmap in maps]
+        xstep, ystep = grids[0].xstep, grids[0].ystep
+        xmin = min(g.xmin for g in grids)
+        ymin = min(g.ymin for g in grids)
+        xmax = max(g.get_xmax() for g in grids)
+        ymax = max(g.get_ymax() for g in grids)
+        grid = Grid(xmin, xstep, int(round((xmax - xmin) / xstep)) + 1,
+                    ymin, ystep, int(round((ymax - ymin) / ystep)) + 1)
+
+        setfields = {name: np.nan * np.zeros((len(periods), grid.ny, grid.nx))
+                     for name in fields}
+        vmapset = VelocityMapSet(periods=periods, vtype=vtypes.pop(),
+                                  v0=np.array([vmap.v0 for vmap in maps]),
+                                  grids=grids, grid=grid, fields=setfields, R=R)
+
+        for iperiod, vmap in enumerate(maps):
+            ix, iy = vmapset._grid_indexes(vmap.grid)
+            values = {'mopt': lambda: vmap.mopt,
+                      'density': lambda: vmap.density,
+                      'Rradius': lambda: vmap.Rradius,
+                      'covmopt_diag': vmap.covmopt_diag}
+            for name in fields:
+                setfields[name][iperiod, iy, ix] = np.array(values[name]()).flatten()
+
+        if R:
+            vmapset._R = [np.array(vmap.R, dtype='float32') for vmap in maps]
+        return vmapset
+
+    def save(self, path):
+        """
+        Saves the set to dir *path*, containing one .npy file per
+        field, one .npy file per period for the resolution matrices
+        (if exported) and the periods, grids etc. in metadata.pickle.
+        An existing set is backed up as *path*~.
+
+        @type path: str or unicode
+        """
+        tmppath = path + '.tmp'
+        if os.path.exists(tmppath):
+            shutil.rmtree(tmppath)
+        os.makedirs(tmppath)
+
+        for name, array in self.fields.items():
+            np.save(os.path.join(tmppath, name + '.npy'), array)
+        if self.hasR:
+            for iperiod in range(len(self)):
+                np.save(os.path.join(tmppath, 'R_{}.npy'.format(iperiod)),
+                        self._get_R(iperiod))
+        metadata = {'periods': self.periods,
+                    'vtype': self.vtype,
+                    'v0': self.v0,
+                    'grids': self.grids,
+                    'grid': self.grid,
+                    'fields': sorted(self.fields.keys()),
+                    'R': self.hasR}
+        with open(os.path.join(tmppath, 'metadata.pickle'), 'wb') as f:
+            pickle.dump(metadata, f, protocol=2)
+
+        # replacing existing set, backed up
+        if os.path.exists(path):
+            if os.path.exists(path + '~'):
+                shutil.rmtree(path + '~')
+            os.rename(path, path + '~')
+        os.rename(tmppath, path)
+
+    @staticmethod
+    def load(path, mmap=True):
+        """
+        Loads the set saved in dir *path* (see save()), memory-mapping
+        its fields (read-only) if *mmap* is True. Resolution matrices
+        are only loaded on demand (see CompactVelocityMap.R()).
+
+        @type path: str or unicode
+        @type mmap: bool
+        @rtype: L{VelocityMapSet}
+        """
+        with open(os.path.join(path, 'metadata.pickle'), 'rb') as f:
+            metadata = pickle.load(f)
+        fields = {name: np.load(os.path.join(path, name + '.npy'),
+                                mmap_mode='r' if mmap else None)
+                  for name in metadata['fields']}
+        vmapset = VelocityMapSet(periods=metadata['periods'], vtype=metadata['vtype'],
+                                  v0=metadata['v0'], grids=metadata['grids'],
+                                  grid=metadata['grid'], fields=fields, R=metadata['R'])
+        vmapset._path = path
+        return vmapset
+
+    def _iperiod(self, period):
+        """
+        Index of *period* in the set
+        """
+        iperiods = np.nonzero(np.abs(self.periods - period) < EPS)[0]
+        if not len(iperiods):
+            raise KeyError(period)
+        return iperiods[0]
+
+    def _grid_indexes(self, grid):
+        """
+        Indexes (along lons and lats) in the common grid
+        of the nodes of *grid*, in the order of *grid*'s nodes
+        """
+        x, y = grid.xy_nodes()
+        ix = np.round((x - self.grid.xmin) / self.grid.xstep).astype(int)
+        iy = np.round((y - self.grid.ymin) / self.grid.ystep).astype(int)
+        if np.any(np.abs(self.grid.xmin + ix * self.grid.xstep - x) > EPS) or \
+                np.any(np.abs(self.grid.ymin + iy * self.grid.ystep - y) > EPS):
+            raise Exception("Grids of velocity maps are not aligned")
+        return ix, iy
+
+    def _get_R(self, iperiod):
+        """
+        Resolution matrix of the *iperiod*th map
+        """
+        if self._R is not None:
+            return self._R[iperiod]
+        return np.load(os.path.join(self._path, 'R_{}.npy'.format(iperiod)))
+
+
+def load_velocity_maps(path):
+    """
+    Loads the velocity maps exported by the tomographic inversion,
+    either pickled in file *path*, as a dict {period: L{VelocityMap}},
+    or saved as a L{VelocityMapSet} in dir *path* (*.vmapset), whose
+    maps are accessed with set[period] (as L{CompactVelocityMap})
+
+    @type path: str or unicode
+    @rtype: dict or L{VelocityMapSet}
+    """
+    if os.path.isdir(path):
+        return VelocityMapSet.load(path)
+
+    f = open(path, 'rb')
+    vmaps = pickle.load(f)
+    f.close()
+    return vmaps
+
+
 def pathdensity_colormap(dmax):
     """
     Builds a colormap for path density (d) varying from
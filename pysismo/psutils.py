@@ -7,10 +7,10 @@ import obspy.signal.filter
 import numpy as np
 from numpy.lib.stride_tricks import as_strided
 from numpy.fft import rfft, irfft, rfftfreq
+from scipy.signal import iirfilter, zpk2sos, sosfilt
 import os
 import glob
 import shutil
-import pickle
 import shapefile
 import matplotlib.pyplot as plt
 from matplotlib.patches import Polygon
@@ -140,9 +140,11 @@ def plot_nb_pairs():
     from pysismo.psconfig import (FTAN_DIR, MINSPECTSNR, MINSPECTSNR_NOSDEV,
                                   MINNBTRIMESTER, MAXSDEV, MAXPERIOD_FACTOR,
                                   USE_WAVELENGTH_CUTOFF, MINWAVELENGTH_FACTOR)
+    from pysismo import pstomo
 
     # selecting dispersion curves
-    flist = sorted(glob.glob(os.path.join(FTAN_DIR, 'FTAN*.pickle*')))
+    flist = sorted(glob.glob(os.path.join(FTAN_DIR, 'FTAN*.pickle*')) +
+                   glob.glob(os.path.join(FTAN_DIR, 'FTAN*.dcset')))
     print('Select file(s) containing dispersion curves to process:')
     print('\n'.join('{} - {}'.format(i, os.path.basename(f)))
                     for i, f in enumerate(flist))
@@ -152,40 +154,27 @@ def plot_nb_pairs():
     for curves_file in pickle_files:
         # loading dispersion curves of file
         print("Loading file: " + curves_file)
-        f = open(curves_file, 'rb')
-        curves = pickle.load(f)
-        f.close()
-        periods = curves[0].periods
+        curveset = pstomo.load_dispersion_curveset(curves_file)
 
         # updating selection parameters of dispersion curves
-        for c in curves:
-            c.update_parameters(minspectSNR=MINSPECTSNR,
-                                minspectSNR_nosdev=MINSPECTSNR_NOSDEV,
-                                minnbtrimester=MINNBTRIMESTER,
-                                maxsdev=MAXSDEV,
-                                maxperiodfactor=MAXPERIOD_FACTOR,
-                                usewavelengthcutoff=USE_WAVELENGTH_CUTOFF,
-                                minwavelengthfactor=MINWAVELENGTH_FACTOR)
+        curveset.update_parameters(minspectSNR=MINSPECTSNR,
+                                   minspectSNR_nosdev=MINSPECTSNR_NOSDEV,
+                                   minnbtrimester=MINNBTRIMESTER,
+                                   maxsdev=MAXSDEV,
+                                   maxperiodfactor=MAXPERIOD_FACTOR,
+                                   usewavelengthcutoff=USE_WAVELENGTH_CUTOFF,
+                                   minwavelengthfactor=MINWAVELENGTH_FACTOR)
 
-        # list of arrays of filtered velocities
-        list_filtered_vels = [c.filtered_vels_sdevs(vtype='group')[0] for c in curves]
+        # filtered velocities of all the curves, at once
+        filtered_vels, _ = curveset.filtered_vels_sdevs(vtype='group')
 
-        n_init = []
-        n_final = []
+        # total nb of mesurements, and remaining nb
+        # of measurements after selection criteria
+        n_init = np.count_nonzero(~np.isnan(curveset.v), axis=0)
+        n_final = np.count_nonzero(~np.isnan(filtered_vels), axis=0)
 
-        for period in periods:
-            iperiods = [c.get_period_index(period) for c in curves]
-
-            # total nb of mesurements
-            vels = np.array([c.v[i] for c, i in zip(curves, iperiods)])
-            n_init.append(np.count_nonzero(~np.isnan(vels)))
-
-            # remaining nb of measurements after selection criteria
-            vels = np.array([v[i] for v, i in zip(list_filtered_vels, iperiods)])
-            n_final.append(np.count_nonzero(~np.isnan(vels)))
-
-        lines = plt.plot(periods, n_init, label=os.path.basename(curves_file))
-        plt.plot(periods, n_final, color=lines[0].get_color())
+        lines = plt.plot(curveset.periods, n_init, label=os.path.basename(curves_file))
+        plt.plot(curveset.periods, n_final, color=lines[0].get_color())
 
     # finalizing and showing plot
     plt.xlabel('Period (s)')
@@ -320,6 +309,9 @@ def bandpass_butterworth(data, dt, periodmin, periodmax, corners=2, zerophase=Tr
     *periodmin* and *periodmax* with a Butterworth filter.
     *dt* is the sampling interval of the data.
 
+    If *data* is a 2D array, each row is band-passed, all
+    the rows being filtered at once.
+
     @type data: L{numpy.ndarray}
     @type dt: float
     @type periodmin: float or int or None
@@ -328,9 +320,25 @@ def bandpass_butterworth(data, dt, periodmin, periodmax, corners=2, zerophase=Tr
     @type zerophase: bool
     @rtype: L{numpy.ndarray}
     """
-    return obspy.signal.filter.bandpass(data=data, freqmin=1.0 / periodmax,
-                                        freqmax=1.0 / periodmin, df=1.0 / dt,
-                                        corners=corners, zerophase=zerophase)
+    if np.ndim(data) == 1:
+        return obspy.signal.filter.bandpass(data=data, freqmin=1.0 / periodmax,
+                                            freqmax=1.0 / periodmin, df=1.0 / dt,
+                                            corners=corners, zerophase=zerophase)
+
+    # same filter as obspy.signal.filter.bandpass(), along the last axis
+    fe = 0.5 / dt
+    low = 1.0 / periodmax / fe
+    high = 1.0 / periodmin / fe
+    if high - 1.0 > -1e-6 or low > 1:
+        # corner frequency above Nyquist: letting obspy handle each row
+        return np.array([bandpass_butterworth(row, dt, periodmin, periodmax,
+                                              corners, zerophase) for row in data])
+    z, p, k = iirfilter(corners, [low, high], btype='band', ftype='butter', output='zpk')
+    sos = zpk2sos(z, p, k)
+    filtered = sosfilt(sos, data, axis=-1)
+    if zerophase:
+        filtered = sosfilt(sos, filtered[..., ::-1], axis=-1)[..., ::-1]
+    return filtered
 
 
 def bandpass_gaussian(data, dt, period, alpha):
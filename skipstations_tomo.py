@@ -106,7 +106,8 @@ SKIP_STATIONS = ['AY01','LL02','GRAF','GUMN','CTS01','AMG01','LSR01','OHRS']
 from pysismo.psconfig import FTAN_DIR, TOMO_DIR
 
 # selecting dispersion curves
-flist = sorted(glob.glob(os.path.join(FTAN_DIR, 'FTAN*.pickle*')))
+flist = sorted(glob.glob(os.path.join(FTAN_DIR, 'FTAN*.pickle*')) +
+               glob.glob(os.path.join(FTAN_DIR, 'FTAN*.dcset*')))
 print('Select file(s) containing dispersion curves to process: [All except backups]')
 print('0 - All except backups (*~)')
 for i,f in enumerate(flist):
@@ -124,9 +125,7 @@ usersuffix = input("\nEnter suffix to append: [none]\n").strip()
 for pickle_file in pickle_files:
     print("\nProcessing dispersion curves of file: " + pickle_file)
 
-    f = open(pickle_file, 'rb')
-    curves = pickle.load(f)
-    f.close()
+    curves = pstomo.load_dispersion_curves(pickle_file)
 
     # if the name of the file containing the dispersion curves is:
     # FTAN_<suffix>.pickle,
@@ -66,7 +66,9 @@ of a one-pass inversion for comparison, at each period) are
 exported as figures  in a pdf file in dir *TOMO_DIR*.
 The final maps (2nd pass of the two-pass inversion at each
 period) are exported in binary format using module pickle
-as a dict: {period: instance of pstomo.VelocityMap}.
+as a dict: {period: instance of pstomo.VelocityMap}, or as a
+compact set of maps (dir *.vmapset, see pstomo.VelocityMapSet)
+if *TOMO_COMPACT_EXPORT* is True.
 """
 
 from pysismo import pstomo, psutils
@@ -104,10 +106,12 @@ assert np.all([len(GRID_STEPS)==npass,len(MINSPECTSNRS)==npass,len(CORR_LENGTHS)
 SKIP_STATIONS = []
 
 # parsing configuration file to import dirs
-from pysismo.psconfig import FTAN_DIR, TOMO_DIR, SKIP_PAIRS
+from pysismo.psconfig import (FTAN_DIR, TOMO_DIR, SKIP_PAIRS, TOMO_COMPACT_EXPORT,
+                              TOMO_COMPACT_FIELDS, TOMO_COMPACT_R)
 
 # selecting dispersion curves
-flist = sorted(glob.glob(os.path.join(FTAN_DIR, 'FTAN*.pickle*')))
+flist = sorted(glob.glob(os.path.join(FTAN_DIR, 'FTAN*.pickle*')) +
+               glob.glob(os.path.join(FTAN_DIR, 'FTAN*.dcset*')))
 print('Select file(s) containing dispersion curves to process: [All except backups]')
 print('0 - All except backups (*~)')
 for i,f in enumerate(flist):
@@ -125,9 +129,7 @@ usersuffix = input("\nEnter suffix to append: [none]\n").strip()
 for pickle_file in pickle_files:
     print("\nProcessing dispersion curves of file: " + pickle_file)
 
-    f = open(pickle_file, 'rb')
-    curves = pickle.load(f)
-    f.close()
+    curves = pstomo.load_dispersion_curves(pickle_file)
 
     # if the name of the file containing the dispersion curves is:
     # FTAN_<suffix>.pickle,
@@ -143,8 +145,10 @@ for pickle_file in pickle_files:
         outprefix += '_{}'.format(usersuffix)
     pdfname = outprefix + '_%s.pdf' % vtype
     picklename = outprefix + '_%s.pickle' % vtype
+    if TOMO_COMPACT_EXPORT:
+        picklename = outprefix + '_%s.vmapset' % vtype
     print("Maps will be exported as figures to file: " + pdfname)
-    print("Final (2-passed) maps will be pickled to file: " + picklename)
+    print("Final (2-passed) maps will be exported to: " + picklename)
 
     # backup of pdf
     if os.path.exists(pdfname):
@@ -304,7 +308,12 @@ for pickle_file in pickle_files:
 
     # exporting final maps (using pickle) as a dict:
     # {period: instance of pstomo.VelocityMap}
-    print("\nExporting final velocity maps to file: " + picklename)
-    f = psutils.openandbackup(picklename, 'wb')
-    pickle.dump(vmaps, f, protocol=2)
-    f.close()
+    print("\nExporting final velocity maps to: " + picklename)
+    if TOMO_COMPACT_EXPORT:
+        vmapset = pstomo.VelocityMapSet.from_vmaps(vmaps, fields=TOMO_COMPACT_FIELDS,
+                                                   R=TOMO_COMPACT_R)
+        vmapset.save(picklename)
+    else:
+        f = psutils.openandbackup(picklename, 'wb')
+        pickle.dump(vmaps, f, protocol=2)
+        f.close()
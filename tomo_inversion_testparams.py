@@ -62,7 +62,6 @@ from pysismo import pstomo, psutils
 import os, sys
 import shutil
 import glob
-import pickle
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_pdf import PdfPages
 import itertools as it
@@ -82,7 +81,8 @@ vtype = 'phase'
 from pysismo.psconfig import FTAN_DIR, TOMO_DIR
 
 # selecting dispersion curves
-flist = sorted(glob.glob(os.path.join(FTAN_DIR, 'FTAN*.pickle*')))
+flist = sorted(glob.glob(os.path.join(FTAN_DIR, 'FTAN*.pickle*')) +
+               glob.glob(os.path.join(FTAN_DIR, 'FTAN*.dcset*')))
 print('Select file(s) containing dispersion curves to process: [All except backups]')
 print('0 - All except backups (*~)')
 for i,f in enumerate(flist):
@@ -98,9 +98,7 @@ else:
 for pickle_file in pickle_files:
     print("\nProcessing dispersion curves of file: " + pickle_file)
 
-    f = open(pickle_file, 'rb')
-    curves = pickle.load(f)
-    f.close()
+    curves = pstomo.load_dispersion_curves(pickle_file)
 
     # opening pdf file (setting name as "testparams-tomography_xxx.pdf")
     try: